@@ -0,0 +1,119 @@
+"""
+Builds the daily_spend rollups (see spend_rollups.py) from the existing
+`transactions` collection.
+
+The timestamp range is cut into slices that are streamed in parallel,
+each projected to user_id/amount/timestamp and summed per (user, day).
+The rollups are then written with plain sets, in parallel batches of 500,
+so running it twice gives the same result. Transactions saved while it
+runs can be overwritten by the slice totals, so run it before the
+rollup-writing server takes traffic (or re-run it once things are quiet).
+
+    python backfill_rollups.py [--workers 8] [--slices 64] [--dry-run]
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import firebase_admin
+from firebase_admin import credentials, firestore
+
+from spend_rollups import ROLLUP_COLLECTION, day_key
+
+FIRESTORE_BATCH_LIMIT = 500
+
+
+def init_db():
+    cred_path = os.path.join(os.path.dirname(__file__), 'firebase-credentials.json')
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(cred_path)
+        firebase_admin.initialize_app(cred)
+    return firestore.client()
+
+
+def timestamp_bounds(db):
+    col = db.collection('transactions')
+    first = list(col.order_by('timestamp').limit(1).stream())
+    last = list(col.order_by('timestamp', direction=firestore.Query.DESCENDING).limit(1).stream())
+    if not first:
+        return None
+    return first[0].to_dict()['timestamp'], last[0].to_dict()['timestamp']
+
+
+def aggregate_slice(db, start, end):
+    """{(user_id, day): [total, count, last_ts]} for start <= timestamp < end."""
+    docs = db.collection('transactions')\
+        .where('timestamp', '>=', start)\
+        .where('timestamp', '<', end)\
+        .select(['user_id', 'amount', 'timestamp'])\
+        .stream()
+    rollups = {}
+    for doc in docs:
+        data = doc.to_dict()
+        if data.get('user_id') is None:
+            continue
+        ts = data.get('timestamp', 0)
+        key = (data['user_id'], day_key(ts))
+        entry = rollups.setdefault(key, [0, 0, ts])
+        entry[0] += data.get('amount', 0)
+        entry[1] += 1
+        entry[2] = max(entry[2], ts)
+    return rollups
+
+
+def merge(into, part):
+    for key, (total, count, last_ts) in part.items():
+        entry = into.setdefault(key, [0, 0, last_ts])
+        entry[0] += total
+        entry[1] += count
+        entry[2] = max(entry[2], last_ts)
+
+
+def write_rollups(db, items):
+    batch = db.batch()
+    for (user_id, day), (total, count, last_ts) in items:
+        batch.set(db.collection(ROLLUP_COLLECTION).document(f"{user_id}_{day}"), {
+            "user_id": user_id,
+            "day": day,
+            "total_amount": total,
+            "count": count,
+            "last_timestamp": last_ts
+        })
+    batch.commit()
+    return len(items)
+
+
+def backfill(db, workers=8, slices=64, dry_run=False):
+    started = time.time()
+    bounds = timestamp_bounds(db)
+    if bounds is None:
+        print("ℹ️ No transactions to roll up.")
+        return {}
+    lo, hi = bounds
+    step = max(1, (hi + 1 - lo + slices - 1) // slices)
+    ranges = [(start, min(start + step, hi + 1)) for start in range(lo, hi + 1, step)]
+
+    rollups = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for part in pool.map(lambda r: aggregate_slice(db, *r), ranges):
+            merge(rollups, part)
+    docs = sum(count for _, count, _ in rollups.values())
+    print(f"📊 {docs} transactions -> {len(rollups)} rollups ({len(ranges)} slices, {time.time() - started:.1f}s)")
+
+    if not dry_run:
+        items = sorted(rollups.items())
+        chunks = [items[i:i + FIRESTORE_BATCH_LIMIT] for i in range(0, len(items), FIRESTORE_BATCH_LIMIT)]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            written = sum(pool.map(lambda chunk: write_rollups(db, chunk), chunks))
+        print(f"✅ Wrote {written} rollup docs to '{ROLLUP_COLLECTION}' in {time.time() - started:.1f}s.")
+    return rollups
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill daily_spend rollups from transactions")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--slices", type=int, default=64)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    backfill(init_db(), workers=args.workers, slices=args.slices, dry_run=args.dry_run)
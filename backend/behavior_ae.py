@@ -0,0 +1,420 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+INITIAL_SLOTS = 1024  # UserAEStore's first allocation; doubled as more users become resident
+NOT_RESIDENT = -2     # UserAEStore slot for a user with a profile but no free slot right now
+
+
+def _dense(x, w, b):
+    """
+    x @ w + b, accumulated one input column at a time.
+    BLAS picks different kernels for different batch sizes, which changes the
+    last bits of the result; this keeps a row's output independent of how many
+    rows it was scored with.
+    """
+    out = x[:, 0:1] * w[0]
+    for k in range(1, w.shape[0]):
+        out = out + x[:, k:k + 1] * w[k]
+    return out + b
+
+class NumPyBehaviorAE:
+    """Lightweight Autoencoder using pure NumPy for inference."""
+    def __init__(self, weights):
+        self.enc_w = np.array(weights['enc_w']).T  # Transpose for np.dot (Input x Hidden) vs torch (Hidden x Input)
+        self.enc_b = np.array(weights['enc_b'])
+        self.dec_w = np.array(weights['dec_w']).T
+        self.dec_b = np.array(weights['dec_b'])
+        self.scaler_mean = np.array(weights['scaler_mean'])
+        self.scaler_scale = np.array(weights['scaler_scale'])
+
+    @classmethod
+    def from_arrays(cls, enc_w, enc_b, dec_w, dec_b, scaler_mean, scaler_scale):
+        """From already transposed (in x out) arrays, e.g. one row of StackedAEProfiles."""
+        ae = cls.__new__(cls)
+        ae.enc_w = np.asarray(enc_w, dtype=np.float64)
+        ae.enc_b = np.asarray(enc_b, dtype=np.float64)
+        ae.dec_w = np.asarray(dec_w, dtype=np.float64)
+        ae.dec_b = np.asarray(dec_b, dtype=np.float64)
+        ae.scaler_mean = np.asarray(scaler_mean, dtype=np.float64)
+        ae.scaler_scale = np.asarray(scaler_scale, dtype=np.float64)
+        return ae
+
+    def predict(self, x):
+        x = np.atleast_2d(x)
+
+        # 1. Scale
+        scaled_x = (x - self.scaler_mean) / self.scaler_scale
+        
+        # 2. Encoder (Linear -> ReLU)
+        z = _dense(scaled_x, self.enc_w, self.enc_b)
+        z = np.maximum(0, z) # ReLU
+        
+        # 3. Decoder (Linear)
+        recon = _dense(z, self.dec_w, self.dec_b)
+        
+        return recon, scaled_x
+
+    def get_mse(self, x):
+        return self.get_mse_batch(x)[0]
+
+    def get_mse_batch(self, x):
+        """Row-wise reconstruction error for an (N x features) matrix."""
+        recon, scaled_x = self.predict(x)
+        sq_err = (scaled_x - recon)**2
+        total = sq_err[:, 0]
+        for k in range(1, sq_err.shape[1]):
+            total = total + sq_err[:, k]
+        return total / sq_err.shape[1]
+
+
+def _dense_rows(x, w, b):
+    """
+    Per-row x[i] @ w[i] + b[i] for gathered weights (N x in x out), accumulated
+    one input column at a time in the same order as _dense, so a
+    user's rows score bit for bit like that user's NumPyBehaviorAE. (einsum
+    is free to reorder the sum, which would move the last bits.)
+    """
+    out = x[:, 0:1] * w[:, 0]
+    for k in range(1, w.shape[1]):
+        out = out + x[:, k:k + 1] * w[:, k]
+    return out + b
+
+
+class StackedAEProfiles:
+    """
+    Every user's behaviour autoencoder packed into shared tensors.
+
+    Row r of each tensor belongs to user_ids[r]:
+        enc_w (U x features x hidden), enc_b (U x hidden),
+        dec_w (U x hidden x features), dec_b (U x features)  -- float32
+        scaler_mean, scaler_scale (U x features)              -- float64
+    The weights come out of torch as float32, so storing them that way is
+    lossless; the scaler stats are sklearn float64 and stay that way. A batch
+    mixing any number of users is scored with one gather per tensor and a
+    handful of vector ops, instead of one small matmul per user.
+
+    user_ids is a sorted bytes array (utf-8) and lookups binary-search it, so
+    opening a memory-mapped bundle (see load) doesn't build a per-user dict.
+    Behaves like the old {user_id: NumPyBehaviorAE} dict for lookups
+    (`in`, len, get, [])—those return a per-user view.
+    """
+    BUNDLE_KIND = "behavior_ae"
+
+    def __init__(self, user_ids, enc_w, enc_b, dec_w, dec_b, scaler_mean, scaler_scale):
+        self.user_ids = user_ids
+        self.enc_w = enc_w
+        self.enc_b = enc_b
+        self.dec_w = dec_w
+        self.dec_b = dec_b
+        self.scaler_mean = scaler_mean
+        self.scaler_scale = scaler_scale
+
+    @classmethod
+    def from_weights(cls, weights_data):
+        """From the ae_weights.json layout ({user: {enc_w, enc_b, dec_w, dec_b, scaler_mean, scaler_scale}})."""
+        user_ids = sorted(weights_data)
+
+        def stack(key, transpose=False):
+            arrays = [np.array(weights_data[u][key], dtype=np.float64) for u in user_ids]
+            # torch Linear stores (out x in); scoring wants (in x out)
+            return np.array([a.T if transpose else a for a in arrays], dtype=np.float64)
+
+        enc_w, enc_b = stack('enc_w', transpose=True), stack('enc_b')
+        dec_w, dec_b = stack('dec_w', transpose=True), stack('dec_b')
+        # Only narrow to float32 when it changes nothing (weights exported from torch)
+        weights = [enc_w, enc_b, dec_w, dec_b]
+        if all(np.array_equal(w.astype(np.float32), w) for w in weights):
+            weights = [w.astype(np.float32) for w in weights]
+        ids = np.array([u.encode('utf-8') for u in user_ids], dtype=bytes) if user_ids else np.array([], dtype='S1')
+        return cls(ids, *weights, stack('scaler_mean'), stack('scaler_scale'))
+
+    @classmethod
+    def load(cls, path):
+        """Opens a bundle written by save(); the tensors stay memory-mapped."""
+        try:
+            from model_bundle import open_bundle
+        except ImportError:
+            from backend.model_bundle import open_bundle
+        bundle = open_bundle(path, kind=cls.BUNDLE_KIND)
+        return cls(*(bundle[name] for name in ('user_ids', 'enc_w', 'enc_b', 'dec_w', 'dec_b', 'scaler_mean', 'scaler_scale')))
+
+    def save(self, path):
+        try:
+            from model_bundle import write_bundle
+        except ImportError:
+            from backend.model_bundle import write_bundle
+        return write_bundle(path, self.BUNDLE_KIND, {
+            "user_ids": self.user_ids, "enc_w": self.enc_w, "enc_b": self.enc_b,
+            "dec_w": self.dec_w, "dec_b": self.dec_b,
+            "scaler_mean": self.scaler_mean, "scaler_scale": self.scaler_scale
+        }, meta={"users": len(self)})
+
+    # --- dict-style access ---
+    def __len__(self):
+        return len(self.user_ids)
+
+    def __contains__(self, user_id):
+        return self.row_of(user_id) >= 0
+
+    def __getitem__(self, user_id):
+        row = self.row_of(user_id)
+        if row < 0:
+            raise KeyError(user_id)
+        return NumPyBehaviorAE.from_arrays(
+            self.enc_w[row], self.enc_b[row], self.dec_w[row], self.dec_b[row],
+            self.scaler_mean[row], self.scaler_scale[row]
+        )
+
+    def get(self, user_id, default=None):
+        return self[user_id] if user_id in self else default
+
+    def keys(self):
+        return [u.decode('utf-8') for u in self.user_ids.tolist()]
+
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.enc_w, self.enc_b, self.dec_w, self.dec_b,
+                                      self.scaler_mean, self.scaler_scale))
+
+    # --- scoring ---
+    def row_of(self, user_id):
+        return int(self.rows_for([user_id])[0])
+
+    def rows_for(self, user_ids):
+        """Tensor row per user id, -1 for users without a profile."""
+        if len(self.user_ids) == 0 or len(user_ids) == 0:
+            return np.full(len(user_ids), -1, dtype=np.intp)
+        keys = np.array([str(u).encode('utf-8') for u in user_ids], dtype=bytes)
+        pos = np.minimum(np.searchsorted(self.user_ids, keys), len(self.user_ids) - 1)
+        return np.where(self.user_ids[pos] == keys, pos, -1).astype(np.intp)
+
+    def mse_rows(self, x, rows):
+        """Reconstruction error of x[i] under the profile in tensor row rows[i] (all rows valid)."""
+        x = np.atleast_2d(np.asarray(x, dtype=np.float64))
+        scaled_x = (x - self.scaler_mean[rows]) / self.scaler_scale[rows]
+        z = _dense_rows(scaled_x, self.enc_w[rows].astype(np.float64), self.enc_b[rows].astype(np.float64))
+        z = np.maximum(0, z)
+        recon = _dense_rows(z, self.dec_w[rows].astype(np.float64), self.dec_b[rows].astype(np.float64))
+        sq_err = (scaled_x - recon) ** 2
+        total = sq_err[:, 0]
+        for k in range(1, sq_err.shape[1]):
+            total = total + sq_err[:, k]
+        return total / sq_err.shape[1]
+
+    def mse(self, x, user_ids):
+        """Reconstruction error per row for a mixed-user batch; 0.0 where the user has no profile."""
+        rows = self.rows_for(user_ids)
+        errors = np.zeros(len(rows))
+        known = rows >= 0
+        if known.any():
+            errors[known] = self.mse_rows(np.atleast_2d(x)[known], rows[known])
+        return errors
+
+
+class UserAEStore:
+    """
+    Bounded working set of AE profiles in front of a StackedAEProfiles source
+    (normally the memory-mapped ae_weights.bin).
+
+    A user's profile is copied out of the source into a resident slot on
+    first use and the least recently used slot is recycled once `capacity`
+    profiles are resident, so memory follows the active users rather than
+    the whole user base. Resident profiles live in their own stacked tensors,
+    so scoring a batch is still one gather + vector pass; the tensors start
+    small and double as slots fill, never past `capacity` or the number of
+    profiles in the source. A batch with more distinct users than
+    `capacity` is scored straight from the source.
+
+    The lock only covers slot bookkeeping. A batch pins its slots while it
+    resolves them, scores outside the lock and unpins afterwards; pinned
+    slots are never recycled, so concurrent batches score in parallel. A
+    user who can't get a slot because every one is pinned is scored from
+    the source.
+
+    Same lookup/scoring interface as StackedAEProfiles; `in` and len()
+    answer from the source index and don't load anything.
+    """
+    def __init__(self, source, capacity=100000):
+        self.source = source
+        self.capacity = max(0, int(capacity))
+        self.lock = threading.Lock()
+        self.slots = OrderedDict()  # user_id -> slot, least recently used first
+        self.pins = {}              # slot -> batches currently scoring with it
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+        # Never more slots than there are profiles to hold; grown on demand up to that
+        self.max_slots = min(self.capacity, len(source))
+        self.resident = self._allocate(min(self.max_slots, INITIAL_SLOTS))
+
+    def _allocate(self, size):
+        src = self.source
+        n_features = src.scaler_mean.shape[1] if src.scaler_mean.ndim == 2 else 0
+        n_hidden = src.enc_b.shape[1] if src.enc_b.ndim == 2 else 0
+        return StackedAEProfiles(
+            np.array([], dtype='S1'),
+            np.zeros((size, n_features, n_hidden), dtype=src.enc_w.dtype),
+            np.zeros((size, n_hidden), dtype=src.enc_b.dtype),
+            np.zeros((size, n_hidden, n_features), dtype=src.dec_w.dtype),
+            np.zeros((size, n_features), dtype=src.dec_b.dtype),
+            np.zeros((size, n_features), dtype=src.scaler_mean.dtype),
+            np.ones((size, n_features), dtype=src.scaler_scale.dtype)
+        )
+
+    def _grow(self, needed):
+        """Doubles the resident tensors (up to max_slots) until `needed` slots fit. Caller holds the lock."""
+        old = self.resident
+        size = old.enc_w.shape[0]
+        if needed <= size:
+            return
+        grown = self._allocate(min(self.max_slots, max(needed, 2 * size)))
+        for name in ('enc_w', 'enc_b', 'dec_w', 'dec_b', 'scaler_mean', 'scaler_scale'):
+            getattr(grown, name)[:size] = getattr(old, name)
+        self.resident = grown
+
+    # --- dict-style access ---
+    def __len__(self):
+        return len(self.source)
+
+    def __contains__(self, user_id):
+        return user_id in self.source
+
+    def __getitem__(self, user_id):
+        if self.capacity == 0:
+            return self.source[user_id]
+        with self.lock:
+            slot = self._slots_for([user_id])[0]
+            try:
+                if slot == -1:
+                    raise KeyError(user_id)
+                if slot >= 0:
+                    # Copies, so recycling the slot later can't change the returned profile
+                    r = self.resident
+                    return NumPyBehaviorAE.from_arrays(
+                        r.enc_w[slot].copy(), r.enc_b[slot].copy(), r.dec_w[slot].copy(), r.dec_b[slot].copy(),
+                        r.scaler_mean[slot].copy(), r.scaler_scale[slot].copy()
+                    )
+            finally:
+                self._unpin_locked([slot])
+        return self.source[user_id]
+
+    def get(self, user_id, default=None):
+        return self[user_id] if user_id in self else default
+
+    def keys(self):
+        return self.source.keys()
+
+    # --- working set ---
+    def _slots_for(self, user_ids):
+        """
+        Resident slot per user (loading misses), -1 for users without a
+        profile, NOT_RESIDENT when every slot is pinned. Each resolved slot
+        is pinned once; release them with _unpin_locked. Caller holds the lock.
+        """
+        slots = np.full(len(user_ids), -1, dtype=np.intp)
+        missing = {}
+        pinned = set()
+        for i, user_id in enumerate(user_ids):
+            slot = self.slots.get(user_id)
+            if slot is not None:
+                self.slots.move_to_end(user_id)
+                self.hits += 1
+                if slot not in pinned:
+                    pinned.add(slot)
+                    self.pins[slot] = self.pins.get(slot, 0) + 1
+                slots[i] = slot
+            else:
+                missing.setdefault(user_id, []).append(i)
+        if not missing:
+            return slots
+
+        start = time.perf_counter()
+        users = list(missing)
+        rows = self.source.rows_for(users)
+        for user_id, row in zip(users, rows):
+            if row < 0:
+                continue
+            self.misses += 1
+            self.hits += len(missing[user_id]) - 1
+            if len(self.slots) < self.capacity:
+                slot = len(self.slots)
+                self._grow(slot + 1)
+            else:
+                slot = self._evict_locked()
+                if slot is None:
+                    slots[missing[user_id]] = NOT_RESIDENT
+                    continue
+            self._copy_in(slot, row)
+            self.slots[user_id] = slot
+            self.pins[slot] = self.pins.get(slot, 0) + 1
+            slots[missing[user_id]] = slot
+        self.load_seconds += time.perf_counter() - start
+        return slots
+
+    def _evict_locked(self):
+        """Frees the least recently used unpinned slot; None if every slot is pinned."""
+        for user_id, slot in self.slots.items():
+            if not self.pins.get(slot):
+                del self.slots[user_id]
+                self.evictions += 1
+                return slot
+        return None
+
+    def _unpin_locked(self, slots):
+        for slot in set(int(slot) for slot in slots if slot >= 0):
+            if self.pins[slot] == 1:
+                del self.pins[slot]
+            else:
+                self.pins[slot] -= 1
+
+    def _copy_in(self, slot, row):
+        src, dst = self.source, self.resident
+        dst.enc_w[slot] = src.enc_w[row]
+        dst.enc_b[slot] = src.enc_b[row]
+        dst.dec_w[slot] = src.dec_w[row]
+        dst.dec_b[slot] = src.dec_b[row]
+        dst.scaler_mean[slot] = src.scaler_mean[row]
+        dst.scaler_scale[slot] = src.scaler_scale[row]
+
+    # --- scoring ---
+    def mse(self, x, user_ids):
+        """Reconstruction error per row for a mixed-user batch; 0.0 where the user has no profile."""
+        if len(set(user_ids)) > self.capacity:
+            return self.source.mse(x, user_ids)
+        x = np.atleast_2d(x)
+        errors = np.zeros(len(user_ids))
+        with self.lock:
+            slots = self._slots_for(user_ids)
+            # Pinned rows are never rewritten, in this tensor set or (after a grow) its replacement
+            resident = self.resident
+        try:
+            known = slots >= 0
+            if known.any():
+                errors[known] = resident.mse_rows(x[known], slots[known])
+            overflow = np.flatnonzero(slots == NOT_RESIDENT)
+            if len(overflow):
+                errors[overflow] = self.source.mse(x[overflow], [user_ids[i] for i in overflow])
+        finally:
+            with self.lock:
+                self._unpin_locked(slots)
+        return errors
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        allocated = self.resident.enc_w.shape[0]
+        per_profile = self.resident.nbytes() / allocated if allocated else 0
+        return {
+            "profiles_on_disk": len(self.source),
+            "resident_profiles": len(self.slots),
+            "capacity": self.capacity,
+            "resident_bytes": int(per_profile * len(self.slots)),
+            "allocated_bytes": self.resident.nbytes(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "avg_load_us": round(self.load_seconds / self.misses * 1e6, 1) if self.misses else None
+        }
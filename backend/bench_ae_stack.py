@@ -0,0 +1,70 @@
+"""
+Cross-user autoencoder scoring: one NumPyBehaviorAE per user vs StackedAEProfiles.
+
+Builds synthetic profiles (float32 weights like the torch export, float64
+scaler stats) for many users, scores a batch that mixes all of them both
+ways and checks the errors are bit-identical.
+
+    python backend/bench_ae_stack.py --users 10000 --rows 20000
+"""
+import argparse
+import time
+
+import numpy as np
+
+try:
+    from behavior_ae import NumPyBehaviorAE, StackedAEProfiles
+except ImportError:
+    from backend.behavior_ae import NumPyBehaviorAE, StackedAEProfiles
+
+
+def synthetic_weights(n_users, rng, features=3, hidden=2):
+    f32 = lambda *shape: rng.normal(0, 0.5, shape).astype(np.float32).astype(np.float64).tolist()
+    return {
+        f"ACC_{i:07d}": {
+            "enc_w": f32(hidden, features), "enc_b": f32(hidden),
+            "dec_w": f32(features, hidden), "dec_b": f32(features),
+            "scaler_mean": rng.uniform(100, 5000, features).tolist(),
+            "scaler_scale": rng.uniform(10, 900, features).tolist()
+        }
+        for i in range(n_users)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(11)
+    weights = synthetic_weights(args.users, rng)
+    per_user = {u: NumPyBehaviorAE(w) for u, w in weights.items()}
+    stacked = StackedAEProfiles.from_weights(weights)
+
+    users = list(weights)
+    batch_users = [users[i] for i in rng.integers(0, len(users), args.rows)]
+    x = np.column_stack([rng.uniform(1, 20000, args.rows), rng.uniform(8, 35, args.rows), rng.uniform(68, 97, args.rows)])
+
+    start = time.perf_counter()
+    expected = np.zeros(args.rows)
+    rows_by_user = {}
+    for i, u in enumerate(batch_users):
+        rows_by_user.setdefault(u, []).append(i)
+    for u, rows in rows_by_user.items():
+        expected[rows] = per_user[u].get_mse_batch(x[rows])
+    per_user_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    got = stacked.mse(x, batch_users)
+    stacked_ms = (time.perf_counter() - start) * 1000
+
+    print(f"{args.rows} rows across {len(rows_by_user)} users")
+    print(f"per-user objects: {per_user_ms:8.1f} ms")
+    print(f"stacked tensors:  {stacked_ms:8.1f} ms ({per_user_ms / stacked_ms:.0f}x)")
+    print(f"stacked weights:  {stacked.nbytes() / len(stacked):.0f} bytes per user")
+    print(f"bit-identical:    {np.array_equal(expected, got)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Concurrent load generator for the API.
+
+Fires requests at a running server from many concurrent clients and reports
+throughput and latency percentiles per concurrency level. Run it against a
+build before and after a change to compare, e.g.:
+
+    uvicorn backend.main:app --port 8000
+    python backend/bench_concurrency.py --url http://localhost:8000 \
+        --endpoint /analyze-transaction --payload backend/test_scenarios/safe_acc1001.json \
+        --concurrency 1 8 32 64 --requests 500
+
+    python backend/bench_concurrency.py --endpoint /alerts --method GET
+
+With handlers blocking the event loop, throughput stays flat as concurrency
+grows (one slow Firestore call stalls everyone). With I/O on the thread pool
+it should scale until Firestore or the CPU pool saturates.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+
+def load_payload(path):
+    if not path:
+        return None
+    raw = open(path, 'rb').read()
+    # Some scenario files are saved as UTF-16 by Windows editors
+    for encoding in ('utf-8', 'utf-16'):
+        try:
+            data = json.loads(raw.decode(encoding))
+            break
+        except (UnicodeDecodeError, ValueError):
+            continue
+    else:
+        raise ValueError(f"Cannot parse {path} as JSON")
+    return data.get('test_case', data)
+
+
+async def run_level(client, method, url, payload, concurrency, total):
+    latencies = []
+    errors = 0
+    remaining = total
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, json=payload)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99)
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--endpoint", default="/alerts")
+    parser.add_argument("--method", default=None, help="defaults to POST when --payload is given, else GET")
+    parser.add_argument("--payload", default=None, help="JSON body (scenario files are unwrapped)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--requests", type=int, default=300, help="requests per concurrency level")
+    args = parser.parse_args()
+
+    payload = load_payload(args.payload)
+    method = args.method or ("POST" if payload is not None else "GET")
+    url = args.url.rstrip("/") + args.endpoint
+
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+        # Warm-up so connection setup and lazy model paths don't skew level 1
+        await run_level(client, method, url, payload, 1, 5)
+        print(f"{method} {url}")
+        print(f"{'conc':>5} {'reqs':>6} {'errs':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for level in args.concurrency:
+            r = await run_level(client, method, url, payload, level, args.requests)
+            print(f"{r['concurrency']:>5} {r['requests']:>6} {r['errors']:>5} {r['rps']:>9.1f} "
+                  f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+"""
+Historical heatmap aggregation: value_counts + groupby mode() vs the
+single-pass code counts in heatmap.historical_fraud_by_location.
+
+Builds a synthetic dataset (string location/transaction_type columns like
+the CSV, a few missing values, ~8% fraud), runs both and checks the
+(location, count, common fraud type) lists are identical. The single pass
+is timed on the string columns and on category columns, which is how
+main.py loads the CSV.
+
+    python backend/bench_heatmap.py --rows 10000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    from heatmap import historical_fraud_by_location
+    from city_coords import CITY_COORDS
+except ImportError:
+    from backend.heatmap import historical_fraud_by_location
+    from backend.city_coords import CITY_COORDS
+
+FRAUD_TYPES = ["Phishing", "SIM Swap", "Account Takeover", "Card Skimming", "Identity Theft", "Money Mule", "Fake KYC"]
+
+
+def legacy_fraud_by_location(df):
+    """What /fraud-heatmap used to compute on every request."""
+    fraud_df = df[df['is_fraud'] == 1]
+    loc_counts = fraud_df['location'].value_counts()
+    fraud_df = df[df['is_fraud'] == 1]
+    loc_types = fraud_df.groupby('location')['transaction_type']\
+        .agg(lambda x: x.mode().iloc[0] if not x.mode().empty else "Unknown").to_dict()
+    return [(location, int(count), loc_types.get(location, "Phishing")) for location, count in loc_counts.items()]
+
+
+def synthetic_dataset(rows, rng):
+    locations = np.array(list(CITY_COORDS) + ["Unknown Town", None], dtype=object)
+    # Skewed, so a few cities dominate like real fraud data
+    weights = rng.pareto(1.5, len(locations)) + 0.1
+    types = np.array(FRAUD_TYPES + [None], dtype=object)
+    return pd.DataFrame({
+        "location": locations[rng.choice(len(locations), rows, p=weights / weights.sum())],
+        "transaction_type": types[rng.integers(0, len(types), rows)],
+        "amount": rng.uniform(10, 50000, rows).round(2),
+        "is_fraud": (rng.random(rows) < 0.08).astype(np.int64)
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(23)
+    start = time.perf_counter()
+    df = synthetic_dataset(args.rows, rng)
+    print(f"{args.rows:,} rows, {int(df['is_fraud'].sum()):,} fraud, built in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    expected = legacy_fraud_by_location(df)
+    legacy_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    got = historical_fraud_by_location(df)
+    single_pass_ms = (time.perf_counter() - start) * 1000
+
+    coded = df.astype({"location": "category", "transaction_type": "category"})
+    start = time.perf_counter()
+    got_coded = historical_fraud_by_location(coded)
+    coded_ms = (time.perf_counter() - start) * 1000
+
+    print(f"value_counts + groupby mode:      {legacy_ms:9.1f} ms")
+    print(f"single pass, string columns:      {single_pass_ms:9.1f} ms ({legacy_ms / single_pass_ms:.1f}x)")
+    print(f"single pass, category columns:    {coded_ms:9.1f} ms ({legacy_ms / coded_ms:.1f}x)")
+    print(f"{len(got)} locations, identical: {got == expected and got_coded == expected}")
+    assert got == expected and got_coded == expected
+
+
+if __name__ == "__main__":
+    main()
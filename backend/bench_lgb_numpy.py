@@ -0,0 +1,69 @@
+"""
+Compares the NumPy tree engine (lgb_numpy.py) with lightgbm.Booster.predict.
+
+Checks that both give bit-identical probabilities on random rows (including
+NaN, negative and unseen categories) and times batches of 1 to 1,000 rows,
+both for a plain matrix and for the DataFrame input the API builds.
+
+    python backend/bench_lgb_numpy.py
+"""
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import lightgbm as lgb
+
+try:
+    from lgb_numpy import load_booster
+    from ml_utils import FEATURES_LGB, CAT_COLS
+except ImportError:
+    from backend.lgb_numpy import load_booster
+    from backend.ml_utils import FEATURES_LGB, CAT_COLS
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), 'models', 'lgb_model.txt')
+
+
+def random_rows(n, rng):
+    X = rng.normal(0, 3, (n, len(FEATURES_LGB))) * rng.choice([1, 10, 1000, 1e5], (n, len(FEATURES_LGB)))
+    for col in CAT_COLS:
+        X[:, FEATURES_LGB.index(col)] = rng.integers(-2, 60, n)
+    X[rng.random(X.shape) < 0.03] = np.nan
+    X[rng.random(X.shape) < 0.03] = 0.0
+    return X
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def main():
+    native = lgb.Booster(model_file=MODEL_PATH)
+    compiled = load_booster(MODEL_PATH)
+    rng = np.random.default_rng(7)
+
+    X = random_rows(50000, rng)
+    expected = native.predict(X)
+    got = compiled.predict(X)
+    mismatches = int(np.sum(expected != got))
+    print(f"Equality on {len(X)} rows: {mismatches} mismatches "
+          f"({'bit-identical' if mismatches == 0 else 'DIFFERENT'})")
+
+    print(f"{'rows':>6} {'native ms':>10} {'numpy ms':>10} {'native df ms':>13} {'numpy df ms':>12}")
+    for n in (1, 10, 100, 1000):
+        rows = X[:n]
+        df = pd.DataFrame(rows, columns=FEATURES_LGB)
+        repeat = 200 if n < 1000 else 50
+        print(f"{n:>6} {best_of(lambda: native.predict(rows), repeat):>10.3f} "
+              f"{best_of(lambda: compiled.predict(rows), repeat):>10.3f} "
+              f"{best_of(lambda: native.predict(df), repeat):>13.3f} "
+              f"{best_of(lambda: compiled.predict(df), repeat):>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Startup cost of the AE profiles: ae_weights.json vs the memory-mapped bundle.
+
+Writes synthetic profiles for --users accounts in both formats to a temp
+directory, then times opening each and scoring a first transaction, and
+measures the UserAEStore working set: cold-load latency for users not yet
+resident and the hit rate under a skewed (Zipf) stream of --lookups.
+
+    python backend/bench_model_bundle.py --users 1000000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+try:
+    from behavior_ae import StackedAEProfiles, UserAEStore
+    from bench_ae_stack import synthetic_weights
+except ImportError:
+    from backend.behavior_ae import StackedAEProfiles, UserAEStore
+    from backend.bench_ae_stack import synthetic_weights
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200000)
+    parser.add_argument("--capacity", type=int, default=10000, help="UserAEStore resident profiles")
+    parser.add_argument("--lookups", type=int, default=50000)
+    args = parser.parse_args()
+
+    weights = synthetic_weights(args.users, np.random.default_rng(5))
+    x = np.array([[2500.0, 19.07, 72.87]])
+    probe = "ACC_%07d" % (args.users // 2)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "ae_weights.json")
+        bin_path = os.path.join(tmp, "ae_weights.bin")
+        with open(json_path, "w") as f:
+            json.dump(weights, f)
+        StackedAEProfiles.from_weights(weights).save(bin_path)
+        del weights
+
+        start = time.perf_counter()
+        with open(json_path) as f:
+            from_json = StackedAEProfiles.from_weights(json.load(f))
+        json_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        mapped = StackedAEProfiles.load(bin_path)
+        bin_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        first = mapped.mse(x, [probe])
+        first_ms = (time.perf_counter() - start) * 1000
+
+        print(f"{args.users} users: json {os.path.getsize(json_path) / 1e6:.0f} MB, bundle {os.path.getsize(bin_path) / 1e6:.0f} MB")
+        print(f"load json + stack: {json_ms:9.1f} ms")
+        print(f"open bundle:       {bin_ms:9.1f} ms")
+        print(f"first score:       {first_ms:9.3f} ms")
+        print(f"same result:       {np.array_equal(first, from_json.mse(x, [probe]))}")
+
+        store = UserAEStore(mapped, args.capacity)
+        rng = np.random.default_rng(9)
+        cold = []
+        for i in rng.choice(args.users, 1000, replace=False):
+            start = time.perf_counter()
+            store.mse(x, ["ACC_%07d" % i])
+            cold.append((time.perf_counter() - start) * 1000)
+        cold.sort()
+        print(f"cold load (store): p50 {cold[500]:.3f} ms, p99 {cold[990]:.3f} ms")
+
+        store = UserAEStore(mapped, args.capacity)
+        users = ["ACC_%07d" % (i % args.users) for i in rng.zipf(1.2, args.lookups)]
+        matches = 0
+        start = time.perf_counter()
+        for user in users:
+            matches += store.mse(x, [user])[0] == mapped.mse(x, [user])[0]
+        elapsed = time.perf_counter() - start
+        stats = store.stats()
+        print(f"zipf stream:       {args.lookups} lookups, hit rate {stats['hit_rate']:.1%}, "
+              f"{stats['resident_profiles']} resident ({stats['resident_bytes'] / 1e6:.1f} MB), "
+              f"{stats['evictions']} evictions, {elapsed / args.lookups * 1e6:.0f} us/lookup incl. check")
+        print(f"store matches source: {matches == args.lookups}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Per-call latency of the Sentinel VAE.
+
+"before" re-creates the arrays from the JSON lists on every call, the way
+NumPyVAE.predict used to; "after" is the compiled engine (float32 layers,
+scaler folded into the first layer), for one row and for a batch.
+The end-to-end numbers compare the old pandas + sklearn + scipy predict
+path against FraudSentinel.predict, and count decision flips on a sweep.
+
+    python backend/bench_sentinel.py
+"""
+import json
+import os
+import time
+
+import joblib
+import numpy as np
+
+try:
+    from sentinel_module.detect_fraud import NumPyVAE, FraudSentinel
+except ImportError:
+    from backend.sentinel_module.detect_fraud import NumPyVAE, FraudSentinel
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+WEIGHTS_PATH = os.path.join(BASE_DIR, "models", "upi_weights.json")
+SCALER_PATH = os.path.join(BASE_DIR, "upi_models", "feature_scaler.pkl")
+
+
+def legacy_predict(layers, x):
+    out = x
+    for layer in layers:
+        w = np.array(layer["w"])
+        b = np.array(layer["b"])
+        out = np.dot(out, w) + b
+        if layer["activation"] == "relu":
+            out = np.maximum(0, out)
+        elif layer["activation"] == "sigmoid":
+            out = 1 / (1 + np.exp(-out))
+    return out
+
+
+def legacy_sentinel_predict(layers, scaler, sentinel, amount, time_gap, daily_total, user_limit=50000):
+    """FraudSentinel.predict's VAE layer as it was: DataFrame -> scaler.transform -> stats.norm.cdf."""
+    import pandas as pd
+    from scipy import stats
+
+    is_business = user_limit >= 500000
+    normalized_amount = (amount / user_limit) * 50000
+    normalized_daily = (daily_total / user_limit) * 50000
+    log_vel = np.log1p(normalized_amount / (time_gap + 1))
+    features = pd.DataFrame([[normalized_amount, time_gap, log_vel, normalized_amount, normalized_daily]],
+                            columns=['amount_inr', 'time_since_last_txn', 'log_velocity', 'amt_1h', 'amt_24h'])
+    scaled_input = scaler.transform(features)
+    reconstruction = legacy_predict(layers, scaled_input[0]).reshape(1, -1)
+    mse = np.mean(np.power(scaled_input - reconstruction, 2))
+    error_std = sentinel.ERROR_STD * (2.0 if is_business else 1.0)
+    z_score = min((mse - sentinel.ERROR_MEAN) / error_std, 4.0)
+    confidence = min(99.99, max(0.01, stats.norm.cdf(z_score) * 100))
+    if confidence > (99.95 if is_business else 99.9):
+        return "BLOCKED", confidence
+    elif confidence > (98 if is_business else 95):
+        return "FLAGGED", confidence
+    return "APPROVED", confidence
+
+
+def per_call_us(fn, repeat=2000):
+    best = float("inf")
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best * 1e6
+
+
+def main():
+    with open(WEIGHTS_PATH) as f:
+        layers = json.load(f)["all_layers"]
+    scaler = joblib.load(SCALER_PATH)
+    vae = NumPyVAE(WEIGHTS_PATH)
+    vae.fold_scaler(scaler.scale_, scaler.min_)
+
+    raw = np.array([4500.0, 620.0, np.log1p(4500.0 / 621.0), 4500.0, 12000.0])
+    scaled = raw * scaler.scale_ + scaler.min_
+    batch = np.tile(raw, (1000, 1)) * np.random.default_rng(1).uniform(0.5, 1.5, (1000, 5))
+
+    before = per_call_us(lambda: legacy_predict(layers, scaled))
+    after = per_call_us(lambda: vae.predict(scaled))
+    folded = per_call_us(lambda: vae.reconstruction_error(raw))
+    batch_us = per_call_us(lambda: vae.reconstruction_error(batch), repeat=50)
+    print(f"VAE predict, 1 row, lists -> arrays per call: {before:8.1f} us")
+    print(f"VAE predict, 1 row, compiled float32:         {after:8.1f} us ({before / after:.1f}x)")
+    print(f"VAE error from raw features (folded scaler):  {folded:8.1f} us")
+    print(f"VAE error, batch of 1000:                     {batch_us:8.1f} us ({batch_us / 1000:.2f} us/row)")
+
+    drift = np.max(np.abs(legacy_predict(layers, scaled) - vae.predict(scaled)))
+    print(f"max |float64 lists - float32 compiled| on one row: {drift:.2e}")
+
+    sentinel = FraudSentinel(WEIGHTS_PATH, SCALER_PATH)
+    old = per_call_us(lambda: legacy_sentinel_predict(layers, scaler, sentinel, 4500.0, 620.0, 12000.0), repeat=500)
+    full = per_call_us(lambda: sentinel.predict("ACC_1001", 4500.0, 620.0, 12000.0), repeat=2000)
+    print(f"Sentinel predict, pandas + sklearn + scipy:   {old:8.1f} us")
+    print(f"FraudSentinel.predict end to end:             {full:8.1f} us ({old / full:.1f}x)")
+
+    rng = np.random.default_rng(7)
+    flips, max_diff = 0, 0.0
+    for _ in range(5000):
+        limit = 1000000 if rng.random() < 0.2 else 50000
+        amount = float(rng.uniform(1, limit * 1.5))
+        gap = float(rng.choice([rng.uniform(15, 3600), 3600.0]))
+        daily = amount + float(rng.uniform(0, limit * 2))
+        want = legacy_sentinel_predict(layers, scaler, sentinel, amount, gap, daily, limit)
+        status, _, got = sentinel.predict("ACC_1001", amount, gap, daily, limit)
+        flips += status != want[0]
+        max_diff = max(max_diff, abs(got - want[1]))
+    print(f"decision flips vs old path on 5000 random txns: {flips} (max confidence diff {max_diff:.2e})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import threading
+import time
+
+try:
+    from snapshot_sync import SnapshotSync
+except ImportError:
+    from backend.snapshot_sync import SnapshotSync
+
+
+class BlockedRegistryCache:
+    """
+    In-memory mirror of the Firestore `blocked_registry` collection.
+
+    Loaded once at startup and kept current by a snapshot listener. If the
+    listener can't be attached (or dies), a background thread re-reads the
+    collection every `poll_interval` seconds instead (see SnapshotSync).
+    Lookups are plain dict reads, so sender/receiver checks never leave the
+    process.
+
+    subscribe(callback) gets every change as callback(changes, reset):
+    `changes` maps entity_id -> new entry (None once removed), and on a
+    full reload it is the whole registry with reset=True.
+    """
+    def __init__(self, poll_interval=30):
+        self.entities = {}
+        self.lock = threading.Lock()
+        self.collection = None
+        self.sync = SnapshotSync("Blocked registry", poll_interval, lambda: self.collection,
+                                 self.refresh, self._on_snapshot)
+        self.ready = False
+        self.last_refresh = None
+        self.listener_events = 0
+        self.full_reloads = 0
+        self.listeners = []
+        self.put_times = {}  # entity_id -> when put() last wrote it, until a reload has caught up
+
+    def start(self, db):
+        self.collection = db.collection('blocked_registry')
+        self.sync.start()
+
+    def stop(self):
+        self.sync.stop()
+
+    def refresh(self):
+        """Full reload of the collection (startup and polling fallback)."""
+        started = time.monotonic()
+        entities = {doc.id: doc.to_dict() for doc in self.collection.stream()}
+        with self.lock:
+            # A put() that landed while the stream ran may be missing from it (or older in it): keep ours
+            for entity_id, put_at in self.put_times.items():
+                if put_at >= started and entity_id in self.entities:
+                    entities[entity_id] = self.entities[entity_id]
+            self.put_times = {entity_id: put_at for entity_id, put_at in self.put_times.items() if put_at >= started}
+            self.entities = entities
+            self.ready = True
+            self.last_refresh = time.time()
+            self.full_reloads += 1
+        print(f"✅ Blocked registry cache loaded: {len(entities)} entities.")
+        self._notify(dict(entities), reset=True)
+
+    def _on_snapshot(self, col_snapshot, changes, read_time):
+        changed = {}
+        with self.lock:
+            for change in changes:
+                if change.type.name == 'REMOVED':
+                    self.entities.pop(change.document.id, None)
+                    changed[change.document.id] = None
+                else:
+                    changed[change.document.id] = self.entities[change.document.id] = change.document.to_dict()
+            self.listener_events += len(changes)
+            self.ready = True
+        self._notify(changed)
+
+    def subscribe(self, callback):
+        self.listeners.append(callback)
+
+    def _notify(self, changes, reset=False):
+        if not changes and not reset:
+            return
+        for callback in self.listeners:
+            try:
+                callback(changes, reset)
+            except Exception as e:
+                print(f"⚠️ Blocked registry subscriber failed: {e}")
+
+    def get(self, entity_id):
+        """Returns the registry entry for `entity_id`, or None if it isn't blocked."""
+        if not self.ready and self.collection is not None:
+            # Cache never loaded: fall back to a direct read rather than letting everything through
+            doc = self.collection.document(entity_id).get()
+            return doc.to_dict() if doc.exists else None
+        return self.entities.get(entity_id)
+
+    def put(self, entity_id, data):
+        """Write-through hook for /block-entity so a new block applies immediately."""
+        with self.lock:
+            self.entities[entity_id] = data
+            self.put_times[entity_id] = time.monotonic()
+        self._notify({entity_id: data})
+
+    def snapshot(self):
+        """A copy of every cached entry ({entity_id: entry})."""
+        with self.lock:
+            return dict(self.entities)
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "entities": len(self.entities),
+            "mode": "listener" if self.sync.active() else "polling",
+            "last_refresh": self.last_refresh,
+            "listener_events": self.listener_events,
+            "full_reloads": self.full_reloads
+        }
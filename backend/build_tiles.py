@@ -0,0 +1,62 @@
+"""
+Builds the heatmap tile pyramid (see tile_pyramid.py) offline from
+transaction CSVs with `lat`/`long` columns, such as
+data/transactions_700.csv.
+
+Files are read in chunks and each chunk is aggregated with numpy, so the
+input can be much larger than memory. A fraud column (is_fraud by
+default) is counted when the file has one. Add --append to build on top
+of an existing tile file instead of starting over. The server loads the
+result at startup and keeps it current from there.
+
+    python build_tiles.py [data/transactions_700.csv ...] [--max-zoom 14] [--out data/heatmap_tiles.npz]
+"""
+import argparse
+import os
+import time
+
+import pandas as pd
+
+try:
+    from tile_pyramid import TilePyramid, DEFAULT_MAX_ZOOM
+except ImportError:
+    from backend.tile_pyramid import TilePyramid, DEFAULT_MAX_ZOOM
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INPUT = os.path.join(BASE_DIR, 'data', 'transactions_700.csv')
+DEFAULT_OUTPUT = os.path.join(BASE_DIR, 'data', 'heatmap_tiles.npz')
+
+
+def build(paths, out, max_zoom=DEFAULT_MAX_ZOOM, fraud_column='is_fraud', chunksize=1_000_000, append=False):
+    pyramid = TilePyramid(max_zoom, path=out)
+    if append:
+        pyramid.load()
+
+    started = time.time()
+    for path in paths:
+        header = pd.read_csv(path, nrows=0).columns
+        usecols = ['lat', 'long'] + ([fraud_column] if fraud_column in header else [])
+        rows = 0
+        for chunk in pd.read_csv(path, usecols=usecols, chunksize=chunksize):
+            fraud = (chunk[fraud_column] == 1).to_numpy() if fraud_column in chunk else None
+            pyramid.add_many(chunk['lat'].to_numpy(), chunk['long'].to_numpy(), fraud)
+            rows += len(chunk)
+        print(f"{path}: {rows} rows{'' if fraud_column in header else f' (no {fraud_column} column)'}")
+
+    pyramid.save()
+    stats = pyramid.stats()
+    print(f"✅ {stats['transactions']} transactions -> {stats['cells'][-1]} cells at z{max_zoom}, "
+          f"{sum(stats['cells'])} in total, in {time.time() - started:.1f}s. Saved to {out}")
+    return pyramid
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the heatmap tile pyramid from transaction CSVs")
+    parser.add_argument("paths", nargs="*", default=[DEFAULT_INPUT])
+    parser.add_argument("--max-zoom", type=int, default=DEFAULT_MAX_ZOOM)
+    parser.add_argument("--out", default=DEFAULT_OUTPUT)
+    parser.add_argument("--fraud-column", default="is_fraud")
+    parser.add_argument("--chunksize", type=int, default=1_000_000)
+    parser.add_argument("--append", action="store_true")
+    args = parser.parse_args()
+    build(args.paths, args.out, args.max_zoom, args.fraud_column, args.chunksize, args.append)
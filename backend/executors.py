@@ -0,0 +1,41 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Concurrency model for the API:
+# - handlers are `async def` and never call blocking code directly
+# - the Firestore client is synchronous, so every Firestore call goes through run_io
+# - model inference (LightGBM / NumPy) goes through run_cpu, a small bounded pool sized
+#   to the cores so a burst of scoring can't take over the I/O threads
+# - other blocking network calls (Groq) go through run_in on their own pool, never run_cpu,
+#   so slow LLM answers can't hold the scoring slots
+
+FIRESTORE_IO_WORKERS = int(os.getenv("FIRESTORE_IO_WORKERS", "32"))
+MODEL_CPU_WORKERS = int(os.getenv("MODEL_CPU_WORKERS", str(os.cpu_count() or 2)))
+
+io_pool = ThreadPoolExecutor(max_workers=FIRESTORE_IO_WORKERS, thread_name_prefix="firestore-io")
+cpu_pool = ThreadPoolExecutor(max_workers=MODEL_CPU_WORKERS, thread_name_prefix="model-cpu")
+
+
+async def run_io(fn, *args, **kwargs):
+    """Runs a blocking Firestore call on the I/O pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_pool, functools.partial(fn, *args, **kwargs))
+
+
+async def run_cpu(fn, *args, **kwargs):
+    """Runs CPU-bound model code on the bounded inference pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(cpu_pool, functools.partial(fn, *args, **kwargs))
+
+
+async def run_in(pool, fn, *args, **kwargs):
+    """Runs a blocking call on a specific pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool, functools.partial(fn, *args, **kwargs))
+
+
+def shutdown():
+    io_pool.shutdown(wait=False)
+    cpu_pool.shutdown(wait=False)
@@ -5,10 +5,16 @@ import tensorflow as tf
 from tensorflow.keras.models import load_model, Model
 from tensorflow.keras import layers, backend as K
 
+try:
+    from model_bundle import export_upi_weights
+except ImportError:
+    from backend.model_bundle import export_upi_weights
+
 # paths
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 MODEL_PATH = os.path.join(BASE_DIR, "backend", "upi_models", "sentinel_vae_v1.keras")
 OUTPUT_PATH = os.path.join(BASE_DIR, "backend", "models", "upi_weights.json")
+BUNDLE_PATH = os.path.join(BASE_DIR, "backend", "models", "upi_weights.bin")
 
 # Custom Layers (needed to load)
 class Sampling(layers.Layer):
@@ -101,7 +107,9 @@ def extract_weights():
     print(f"Saving weights to {OUTPUT_PATH}...")
     with open(OUTPUT_PATH, "w") as f:
         json.dump(weights_dict, f)
-    print("✅ Done.")
+    # Memory-mapped copy the API loads first (the JSON stays as the fallback)
+    export_upi_weights(weights_dict, BUNDLE_PATH)
+    print(f"✅ Done. Bundle written to {BUNDLE_PATH}")
 
 if __name__ == "__main__":
     extract_weights()
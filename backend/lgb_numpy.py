@@ -0,0 +1,446 @@
+"""
+Pure-NumPy inference for LightGBM text models.
+
+compile_model() flattens `lgb_model.txt` into a handful of arrays (split
+feature, threshold, decision type, children, leaf values, categorical
+bitsets) that NumPyBooster evaluates for a whole batch at once, QuickScorer
+style:
+
+1. leaves are numbered left to right and every node gets a bit mask that
+   clears the leaves of its left subtree; a tree's exit leaf is the lowest
+   bit that survives ANDing the masks of all nodes whose test is false;
+2. a feature's false nodes only depend on where the value falls among that
+   feature's thresholds (or which category it is), so the AND is
+   precomputed per feature and rank -- one table lookup per feature and
+   row, following LightGBM's missing-value and categorical rules.
+
+Models with more than 64 leaves per tree or Zero-type missing handling fall
+back to evaluating each node and walking the trees level by level.
+
+Leaf values are summed tree by tree in model order, and the sigmoid uses
+the C library's exp, so predictions match Booster.predict bit for bit.
+No native lightgbm import is needed.
+
+    python lgb_numpy.py models/lgb_model.txt models/lgb_model.npz
+"""
+import hashlib
+import math
+import os
+import sys
+
+import numpy as np
+
+# LightGBM: const double kZeroThreshold = 1e-35f;
+K_ZERO_THRESHOLD = float(np.float32(1e-35))
+
+CATEGORICAL_MASK = 1
+DEFAULT_LEFT_MASK = 2
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+
+FORMAT_VERSION = 1
+
+# Up to this many rows, predict() favours fewer NumPy calls over less arithmetic
+SMALL_BATCH = 64
+
+
+def _file_sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _parse_blocks(path):
+    """Header key/values and one key/value dict per tree."""
+    header, trees, current = {}, [], None
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('Tree='):
+                current = {}
+                trees.append(current)
+                continue
+            if line == 'end of trees':
+                break
+            if '=' not in line:
+                continue
+            key, value = line.split('=', 1)
+            (current if current is not None else header)[key] = value
+    return header, trees
+
+
+def _ints(text):
+    return [int(v) for v in text.split()] if text else []
+
+
+def _floats(text):
+    return [float(v) for v in text.split()] if text else []
+
+
+def compile_model(model_path):
+    """Parses a LightGBM text model into flat arrays (see NumPyBooster for the layout)."""
+    header, trees = _parse_blocks(model_path)
+
+    objective = header.get('objective', 'regression').split()
+    sigmoid = 0.0
+    if objective[0] == 'binary':
+        sigmoid = 1.0
+        for part in objective[1:]:
+            if part.startswith('sigmoid:'):
+                sigmoid = float(part.split(':', 1)[1])
+    elif objective[0] not in ('regression', 'regression_l1', 'huber', 'fair', 'quantile', 'mape'):
+        raise ValueError(f"Unsupported objective for NumPy inference: {objective[0]}")
+    if int(header.get('num_class', 1)) != 1:
+        raise ValueError("Multiclass models are not supported by NumPy inference")
+
+    node_feature, node_threshold, node_decision = [], [], []
+    node_left, node_right = [], []
+    node_cat_start, node_cat_words = [], []
+    cat_words = []
+    leaf_value = []
+    tree_root, tree_node_start, tree_num_nodes, tree_leaf_start, tree_num_leaves = [], [], [], [], []
+
+    for tree in trees:
+        if int(tree.get('is_linear', 0)):
+            raise ValueError("Linear trees are not supported by NumPy inference")
+        num_leaves = int(tree['num_leaves'])
+        node_base, leaf_base = len(node_feature), len(leaf_value)
+        leaves = _floats(tree['leaf_value'])
+        leaf_value.extend(leaves)
+        tree_node_start.append(node_base)
+        tree_num_nodes.append(num_leaves - 1)
+        tree_leaf_start.append(leaf_base)
+        tree_num_leaves.append(num_leaves)
+
+        if num_leaves == 1:
+            tree_root.append(-(leaf_base + 1))
+            continue
+
+        cat_base = len(cat_words)
+        cat_boundaries = _ints(tree.get('cat_boundaries', ''))
+        cat_words.extend(_ints(tree.get('cat_threshold', '')))
+
+        def to_global(child):
+            # >= 0: internal node; < 0: leaf ~child
+            return node_base + child if child >= 0 else -(leaf_base + ~child + 1)
+
+        thresholds = _floats(tree['threshold'])
+        decisions = _ints(tree['decision_type'])
+        for j, (feature, threshold, decision, left, right) in enumerate(zip(
+                _ints(tree['split_feature']), thresholds, decisions,
+                _ints(tree['left_child']), _ints(tree['right_child']))):
+            node_feature.append(feature)
+            node_threshold.append(threshold)
+            node_decision.append(decision)
+            node_left.append(to_global(left))
+            node_right.append(to_global(right))
+            if decision & CATEGORICAL_MASK:
+                cat_idx = int(threshold)
+                node_cat_start.append(cat_base + cat_boundaries[cat_idx])
+                node_cat_words.append(cat_boundaries[cat_idx + 1] - cat_boundaries[cat_idx])
+            else:
+                node_cat_start.append(0)
+                node_cat_words.append(0)
+        tree_root.append(node_base)
+
+    return {
+        "format_version": np.int32(FORMAT_VERSION),
+        "num_features": np.int32(int(header.get('max_feature_idx', -1)) + 1),
+        "feature_names": np.array(header.get('feature_names', '').split()),
+        "sigmoid": np.float64(sigmoid),
+        "average_output": np.bool_('average_output' in header),
+        "node_feature": np.array(node_feature, dtype=np.int32),
+        "node_threshold": np.array(node_threshold, dtype=np.float64),
+        "node_decision": np.array(node_decision, dtype=np.uint8),
+        "node_left": np.array(node_left, dtype=np.int32),
+        "node_right": np.array(node_right, dtype=np.int32),
+        "node_cat_start": np.array(node_cat_start, dtype=np.int32),
+        "node_cat_words": np.array(node_cat_words, dtype=np.int32),
+        "cat_words": np.array(cat_words, dtype=np.uint32),
+        "leaf_value": np.array(leaf_value, dtype=np.float64),
+        "tree_root": np.array(tree_root, dtype=np.int32),
+        "tree_node_start": np.array(tree_node_start, dtype=np.int32),
+        "tree_num_nodes": np.array(tree_num_nodes, dtype=np.int32),
+        "tree_leaf_start": np.array(tree_leaf_start, dtype=np.int32),
+        "tree_num_leaves": np.array(tree_num_leaves, dtype=np.int32),
+        "source_sha256": np.array(_file_sha256(model_path)),
+    }
+
+
+def export_model(model_path, out_path):
+    """Writes the compiled arrays next to the text model (npz)."""
+    arrays = compile_model(model_path)
+    np.savez(out_path, **arrays)
+    return out_path
+
+
+class NumPyBooster:
+    """Drop-in for lightgbm.Booster.predict on binary/regression models."""
+    def __init__(self, arrays):
+        a = {k: np.asarray(v) for k, v in arrays.items()}
+        self.feature_names = [str(f) for f in a["feature_names"]]
+        self.num_features = int(a["num_features"])
+        self.sigmoid = float(a["sigmoid"])
+        self.average_output = bool(a["average_output"])
+        self.node_feature = a["node_feature"].astype(np.intp)
+        self.node_threshold = a["node_threshold"]
+        self.node_left = a["node_left"].astype(np.intp)
+        self.node_right = a["node_right"].astype(np.intp)
+        self.leaf_value = a["leaf_value"]
+        self.tree_root = a["tree_root"].astype(np.intp)
+        self.source_sha256 = str(a["source_sha256"])
+
+        decision = a["node_decision"].astype(np.int64)
+        missing = (decision >> 2) & 3
+        default_left = (decision & DEFAULT_LEFT_MASK) != 0
+        self.is_cat = (decision & CATEGORICAL_MASK) != 0
+
+        # Where a NaN goes at each numerical node: NaN-type and Zero-type (NaN becomes 0.0, which
+        # is zero) take the default direction; None-type compares 0.0 with the threshold.
+        self.nan_left = np.where(missing == MISSING_NONE, 0.0 <= self.node_threshold, default_left)
+        self.default_left = default_left
+        self.zero_nodes = np.nonzero(~self.is_cat & (missing == MISSING_ZERO))[0]
+        self._build_category_table(a["node_cat_start"], a["node_cat_words"], a["cat_words"])
+
+        tree_num_nodes = a["tree_num_nodes"].astype(np.intp)
+        tree_num_leaves = a["tree_num_leaves"].astype(np.intp)
+        self.n_trees = len(self.tree_root)
+        self.max_leaves = int(tree_num_leaves.max()) if self.n_trees else 0
+        # Zero-type nodes treat |x| <= 1e-35 specially, which doesn't fit a per-feature threshold order
+        self.quickscorer = self.max_leaves <= 64 and self.zero_nodes.size == 0
+        if self.quickscorer:
+            tree_of_node = np.repeat(np.arange(self.n_trees), tree_num_nodes)
+            self._build_leaf_masks(tree_num_nodes, a["tree_leaf_start"].astype(np.intp))
+            self._build_feature_tables(tree_of_node)
+
+    @classmethod
+    def from_model_file(cls, model_path):
+        return cls(compile_model(model_path))
+
+    @classmethod
+    def load(cls, npz_path):
+        with np.load(npz_path, allow_pickle=False) as data:
+            return cls({k: data[k] for k in data.files})
+
+    def num_trees(self):
+        return self.n_trees
+
+    # --- compilation ---
+    def _build_category_table(self, cat_start, cat_num_words, cat_words):
+        """Unpacks the categorical bitsets: category c of the i-th categorical node goes left iff cat_table[i, c]."""
+        self.cat_nodes = np.nonzero(self.is_cat)[0]
+        words = cat_num_words[self.cat_nodes].astype(np.intp)
+        self.cat_width = 32 * int(words.max()) if self.cat_nodes.size else 0
+        self.cat_table = np.zeros((self.cat_nodes.size, self.cat_width), dtype=bool)
+        for i, node in enumerate(self.cat_nodes):
+            bitset = cat_words[cat_start[node]:cat_start[node] + words[i]].astype(np.uint32)
+            bits = np.unpackbits(bitset.view(np.uint8), bitorder='little')
+            self.cat_table[i, :bits.size] = bits.astype(bool)
+        self.cat_offsets = np.arange(self.cat_nodes.size, dtype=np.intp) * self.cat_width
+
+    def _build_leaf_masks(self, tree_num_nodes, tree_leaf_start):
+        """Numbers leaves left to right per tree; clear_mask[node] drops the leaves of node's left subtree."""
+        self.mask_dtype = np.uint32 if self.max_leaves <= 32 else np.uint64
+        self.all_bits = np.iinfo(self.mask_dtype).max
+        self.clear_mask = np.full(len(self.node_feature), self.all_bits, dtype=self.mask_dtype)
+        # Leaves are looked up by frexp's exponent of the exit bit, i.e. position + 1
+        self.leaf_by_bit = np.zeros((self.n_trees, 66), dtype=np.float64)
+        for t in range(self.n_trees):
+            if tree_num_nodes[t] == 0:
+                self.leaf_by_bit[t, 1] = self.leaf_value[tree_leaf_start[t]]
+                continue
+            order = []
+
+            def collect(node):
+                # Returns the bit mask of leaves under `node`, appending leaves left to right
+                if node < 0:
+                    order.append(-node - 1)
+                    return 1 << (len(order) - 1)
+                left_bits = collect(self.node_left[node])
+                right_bits = collect(self.node_right[node])
+                self.clear_mask[node] = self.all_bits ^ left_bits
+                return left_bits | right_bits
+
+            collect(self.tree_root[t])
+            self.leaf_by_bit[t, 1:len(order) + 1] = self.leaf_value[order]
+        self.leaf_offsets = np.arange(self.n_trees, dtype=np.intp) * self.leaf_by_bit.shape[1]
+        self.leaf_by_bit = self.leaf_by_bit.ravel()
+
+    def _build_feature_tables(self, tree_of_node):
+        """
+        Per feature, the AND of the clear masks of every node that sends a
+        given value right, so a row needs one lookup per feature instead of
+        one test per node:
+        - numerical: indexed by how many of the feature's thresholds are < x
+          (those nodes go right), plus a last row for NaN;
+        - categorical: indexed by category, plus a last row for NaN, negative
+          and unseen categories (every categorical node goes right).
+        All tables are stacked into one, so a batch does a single gather.
+        """
+        cat_row = {node: i for i, node in enumerate(self.cat_nodes)}
+        num_features, thresholds_all, threshold_feature, threshold_starts, num_base, nan_rank = [], [], [], [], [], []
+        cat_features, cat_base = [], []
+        num_tables, cat_tables = [], []
+        for feature in np.unique(self.node_feature):
+            nodes = np.nonzero(self.node_feature == feature)[0]
+            num_nodes = nodes[~self.is_cat[nodes]]
+            cat_nodes = nodes[self.is_cat[nodes]]
+
+            if num_nodes.size:
+                thresholds = np.unique(self.node_threshold[num_nodes])
+                table = np.full((thresholds.size + 2, self.n_trees), self.all_bits, dtype=self.mask_dtype)
+                for node in num_nodes:
+                    t, clear = tree_of_node[node], self.clear_mask[node]
+                    k = np.searchsorted(thresholds, self.node_threshold[node])
+                    table[k + 1:thresholds.size + 1, t] &= clear
+                    if not self.nan_left[node]:
+                        table[-1, t] &= clear
+                num_features.append(feature)
+                threshold_starts.append(len(thresholds_all))
+                thresholds_all.extend(thresholds)
+                threshold_feature.extend([feature] * thresholds.size)
+                nan_rank.append(thresholds.size + 1)
+                num_tables.append(table)
+
+            if cat_nodes.size:
+                width = self.cat_width
+                table = np.full((width + 1, self.n_trees), self.all_bits, dtype=self.mask_dtype)
+                for node in cat_nodes:
+                    t, clear = tree_of_node[node], self.clear_mask[node]
+                    goes_right = ~self.cat_table[cat_row[node]]
+                    table[:width][goes_right, t] &= clear
+                    table[-1, t] &= clear
+                cat_features.append(feature)
+                cat_tables.append(table)
+
+        tables = num_tables + cat_tables
+        bases = np.cumsum([0] + [len(table) for table in tables])[:-1].astype(np.intp)
+        self.qs_num_features = np.array(num_features, dtype=np.intp)
+        self.qs_thresholds = np.array(thresholds_all, dtype=np.float64)
+        self.qs_threshold_feature = np.array(threshold_feature, dtype=np.intp)
+        self.qs_threshold_starts = np.array(threshold_starts, dtype=np.intp)
+        self.qs_threshold_slices = np.split(self.qs_thresholds, self.qs_threshold_starts[1:])
+        self.qs_nan_rank = np.array(nan_rank, dtype=np.intp)
+        self.qs_num_base = bases[:len(num_tables)]
+        self.qs_cat_features = np.array(cat_features, dtype=np.intp)
+        self.qs_cat_base = bases[len(num_tables):]
+        self.qs_table = np.concatenate(tables) if tables else np.full((1, self.n_trees), self.all_bits, dtype=self.mask_dtype)
+
+    # --- inference ---
+    def _to_matrix(self, data):
+        if hasattr(data, 'columns'):
+            if self.feature_names and list(data.columns) != self.feature_names:
+                data = data[self.feature_names]
+            data = data.to_numpy(dtype=np.float64)
+        X = np.asarray(data, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.num_features:
+            raise ValueError(f"Expected {self.num_features} features, got {X.shape[1]}")
+        return X
+
+    def _leaf_values_quickscorer(self, X):
+        n = X.shape[0]
+        small = n <= SMALL_BATCH
+        n_num = self.qs_num_features.size
+        index = np.zeros((n, max(1, n_num + self.qs_cat_features.size)), dtype=np.intp)
+        if n_num:
+            # Rank of x among the feature's thresholds = how many of them are < x.
+            # Small batches compare against every threshold at once (fewest NumPy calls),
+            # large ones binary-search feature by feature (least work).
+            if small:
+                above = X[:, self.qs_threshold_feature] > self.qs_thresholds
+                ranks = np.add.reduceat(above, self.qs_threshold_starts, axis=1, dtype=np.intp)
+            else:
+                ranks = np.empty((n, n_num), dtype=np.intp)
+                for j, feature in enumerate(self.qs_num_features):
+                    ranks[:, j] = np.searchsorted(self.qs_threshold_slices[j], X[:, feature])
+            if np.isnan(X).any():
+                ranks = np.where(np.isnan(X[:, self.qs_num_features]), self.qs_nan_rank, ranks)
+            index[:, :n_num] = ranks + self.qs_num_base
+        if self.qs_cat_features.size:
+            # NaN, negative (after truncation) and unseen categories use the last row
+            x = X[:, self.qs_cat_features]
+            valid = (x > -1.0) & (x < self.cat_width)
+            index[:, n_num:] = np.where(valid, x, self.cat_width).astype(np.intp) + self.qs_cat_base
+        if small:
+            survivors = np.bitwise_and.reduce(self.qs_table[index], axis=1)
+        else:
+            survivors = self.qs_table[index[:, 0]]
+            for j in range(1, index.shape[1]):
+                survivors &= self.qs_table[index[:, j]]
+        # The exit leaf is the lowest leaf no false condition knocked out
+        lowest = survivors & -survivors
+        _, bit = np.frexp(lowest)
+        return self.leaf_by_bit[bit + self.leaf_offsets]
+
+    def _go_left(self, X):
+        """(n_rows x n_nodes) boolean matrix of LightGBM split decisions."""
+        values = X[:, self.node_feature]
+        go_left = values <= self.node_threshold
+        if self.zero_nodes.size:
+            zero_vals = values[:, self.zero_nodes]
+            is_zero = (zero_vals >= -K_ZERO_THRESHOLD) & (zero_vals <= K_ZERO_THRESHOLD)
+            go_left[:, self.zero_nodes] = np.where(is_zero, self.default_left[self.zero_nodes], go_left[:, self.zero_nodes])
+        if np.isnan(X).any():
+            go_left = np.where(np.isnan(values), self.nan_left, go_left)
+        if self.cat_nodes.size:
+            # Categorical: NaN, negative (after truncation) or unseen categories go right
+            cats = values[:, self.cat_nodes]
+            valid = (cats > -1.0) & (cats < self.cat_width)
+            index = np.where(valid, cats, 0.0).astype(np.intp) + self.cat_offsets
+            go_left[:, self.cat_nodes] = self.cat_table.ravel()[index] & valid
+        return go_left
+
+    def _leaf_values_walk(self, X):
+        # Fallback for very deep trees / Zero-type splits: step every (row, tree) pair down one level at a time
+        go_left = self._go_left(X)
+        n = X.shape[0]
+        node = np.broadcast_to(self.tree_root, (n, self.n_trees)).copy()
+        rows = np.broadcast_to(np.arange(n)[:, None], node.shape)
+        active = node >= 0
+        while active.any():
+            r, cur = rows[active], node[active]
+            node[active] = np.where(go_left[r, cur], self.node_left[cur], self.node_right[cur])
+            active = node >= 0
+        return self.leaf_value[-node - 1]
+
+    def predict(self, data, raw_score=False):
+        X = self._to_matrix(data)
+        if self.quickscorer:
+            values = self._leaf_values_quickscorer(X)
+        else:
+            values = self._leaf_values_walk(X)
+
+        # Same accumulation order as LightGBM (tree 0, tree 1, ...); cumsum adds strictly left to right
+        raw = np.cumsum(values, axis=1)[:, -1] if self.n_trees else np.zeros(X.shape[0])
+        if self.average_output and self.n_trees:
+            raw = raw / self.n_trees
+
+        if raw_score or self.sigmoid == 0.0:
+            return raw
+        # math.exp is the same libm exp LightGBM calls, NumPy's SIMD exp can differ in the last bit
+        return np.array([1.0 / (1.0 + math.exp(-self.sigmoid * r)) for r in raw.tolist()], dtype=np.float64)
+
+
+def load_booster(model_path):
+    """
+    NumPyBooster for a text model, using the compiled .npz next to it when it
+    was built from the same file (checked by hash), else compiling in memory.
+    """
+    npz_path = os.path.splitext(model_path)[0] + '.npz'
+    if os.path.exists(npz_path):
+        try:
+            booster = NumPyBooster.load(npz_path)
+            if booster.source_sha256 == _file_sha256(model_path):
+                return booster
+            print(f"⚠️ {npz_path} is stale, recompiling from {model_path}")
+        except Exception as e:
+            print(f"⚠️ Could not read {npz_path}: {e}")
+    return NumPyBooster.from_model_file(model_path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("usage: python lgb_numpy.py <lgb_model.txt> <out.npz>")
+        sys.exit(1)
+    export_model(sys.argv[1], sys.argv[2])
+    print(f"✅ Compiled {sys.argv[1]} -> {sys.argv[2]}")
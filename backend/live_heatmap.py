@@ -0,0 +1,207 @@
+"""
+Live /fraud-heatmap?window=1h|24h|7d from transactions as they are saved.
+
+LiveHeatmap subscribes to the write-behind queue and sees every batch right
+after it commits. Scored transactions (user_transactions/*/transactions
+docs, which carry location and is_blocked) are counted into ring buffers
+per window, so nothing ever re-reads Firestore, let alone runs a
+collection-group scan. The counts are saved on shutdown and reloaded at
+startup, so the 24h and 7d views survive restarts.
+
+Each window is a ring of time buckets (1min for 1h, 15min for 24h, 1h
+for 7d) with one row per location; a slot is cleared when the ring comes
+round to it again. Like the spend windows, a bucket counts while any part
+of it is in the window, so a view covers at most one bucket more than its
+nominal span. Commits are at-least-once, so a batch replayed from the journal
+after a crash can be counted twice.
+
+Locations are free text from clients, so only ones that can be plotted
+(those in `coords`) get a row, and never more than `max_locations`; the
+rest are counted in `skipped`.
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+TRANSACTION_COLLECTION = 'transactions'
+USER_TRANSACTIONS_PREFIX = 'user_transactions/'
+WINDOWS = {
+    # name: (span seconds, bucket seconds)
+    "1h": (3600, 60),
+    "24h": (86400, 900),
+    "7d": (604800, 3600)
+}
+FRAUD_WEIGHT = 10  # a blocked transaction weighs as much as ten clean ones
+MAX_PINS = 10
+MAX_LOCATIONS = 1024  # rows per ring; about 5 KB each across the three default windows
+
+
+class _Ring:
+    def __init__(self, span, bucket_seconds, rows):
+        self.span = span
+        self.bucket_seconds = bucket_seconds
+        # One more slot than the span needs: the oldest, partly covered bucket stays alongside the current one
+        self.buckets = span // bucket_seconds + 1
+        self.slot_bucket = np.full(self.buckets, -1, dtype=np.int64)  # bucket number each slot holds
+        self.total = np.zeros((rows, self.buckets), dtype=np.int64)
+        self.blocked = np.zeros((rows, self.buckets), dtype=np.int64)
+
+    def grow(self, rows):
+        pad = ((0, rows - self.total.shape[0]), (0, 0))
+        self.total = np.pad(self.total, pad)
+        self.blocked = np.pad(self.blocked, pad)
+
+    def add(self, row, timestamp, blocked):
+        bucket = int(timestamp) // self.bucket_seconds
+        slot = bucket % self.buckets
+        if self.slot_bucket[slot] != bucket:
+            if bucket < self.slot_bucket[slot]:
+                return  # older than the ring holds
+            self.slot_bucket[slot] = bucket
+            self.total[:, slot] = 0
+            self.blocked[:, slot] = 0
+        self.total[row, slot] += 1
+        self.blocked[row, slot] += blocked
+
+    def sums(self, now):
+        live = self.slot_bucket >= (int(now) - self.span) // self.bucket_seconds
+        return self.total[:, live].sum(axis=1), self.blocked[:, live].sum(axis=1)
+
+
+class LiveHeatmap:
+    def __init__(self, coords, path=None, windows=WINDOWS, max_locations=MAX_LOCATIONS):
+        self.coords = coords
+        self.path = path
+        self.windows = windows
+        self.max_locations = max_locations
+        self.locations = []  # row -> location name
+        self.rows = {}       # location name -> row
+        self.rings = {name: _Ring(span, bucket_seconds, 0) for name, (span, bucket_seconds) in windows.items()}
+        self.lock = threading.Lock()
+        self.counted = 0
+        self.skipped = 0
+
+    @staticmethod
+    def _is_scored_transaction(path):
+        parts = path.split('/')
+        return path.startswith(USER_TRANSACTIONS_PREFIX) and len(parts) == 4 and parts[2] == TRANSACTION_COLLECTION
+
+    @staticmethod
+    def _timestamp(value):
+        if isinstance(value, (int, float)):
+            return value
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except (TypeError, ValueError):
+            return time.time()
+
+    def on_commit(self, ops):
+        """Write-behind hook: counts the scored transactions in a committed batch."""
+        with self.lock:
+            for path, data, merge in ops:
+                if merge or not self._is_scored_transaction(path):
+                    continue  # e.g. deferred reasoning merged onto a saved transaction
+                self._add_locked(data.get('location'), self._timestamp(data.get('timestamp')), bool(data.get('is_blocked')))
+
+    def add(self, location, timestamp, blocked=False):
+        with self.lock:
+            self._add_locked(location, timestamp, blocked)
+
+    def _add_locked(self, location, timestamp, blocked):
+        row = self.rows.get(location)
+        if row is None:
+            if location not in self.coords or len(self.locations) >= self.max_locations:
+                self.skipped += 1  # missing, unplottable, or over the cap
+                return
+            row = self.rows[location] = len(self.locations)
+            self.locations.append(location)
+            if row >= self.rings[next(iter(self.rings))].total.shape[0]:
+                for ring in self.rings.values():
+                    ring.grow(min(self.max_locations, max(16, 2 * (row + 1))))
+        for ring in self.rings.values():
+            ring.add(row, timestamp, 1 if blocked else 0)
+        self.counted += 1
+
+    def view(self, window, now=None):
+        """The /fraud-heatmap payload for `window` (one of WINDOWS); raises KeyError otherwise."""
+        ring = self.rings[window]
+        now = time.time() if now is None else now
+        with self.lock:
+            totals, blocked = ring.sums(now)
+            locations = list(self.locations)
+
+        points, pins = [], []
+        for row, location in enumerate(locations):
+            total, fraud = int(totals[row]), int(blocked[row])
+            if total == 0 or location not in self.coords:
+                continue
+            points.append({"location": self.coords[location], "weight": total + (FRAUD_WEIGHT - 1) * fraud,
+                           "count": total, "blocked": fraud})
+            if fraud:
+                pins.append({
+                    "location": self.coords[location],
+                    "title": location,
+                    "description": f"Risk Score: {fraud * FRAUD_WEIGHT} | Sources: {fraud} of {total} transactions blocked in the last {window}",
+                    "severity": fraud * FRAUD_WEIGHT,
+                    "common_fraud_type": "Cyber Fraud"
+                })
+        pins.sort(key=lambda x: x["severity"], reverse=True)
+        return {"status": "success", "window": window, "data": points, "pins": pins[:MAX_PINS]}
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as saved:
+                saved_locations = json.loads(str(saved["locations"]))
+                # Files from before ingest was filtered can hold unplottable rows: drop them
+                keep = [row for row, location in enumerate(saved_locations) if location in self.coords][:self.max_locations]
+                locations = [saved_locations[row] for row in keep]
+                rings = {}
+                for name, (span, bucket_seconds) in self.windows.items():
+                    ring = _Ring(span, bucket_seconds, len(locations))
+                    if f"{name}_slots" not in saved or len(saved[f"{name}_slots"]) != ring.buckets:
+                        continue  # window layout changed: start that one empty
+                    ring.slot_bucket = saved[f"{name}_slots"]
+                    ring.total = saved[f"{name}_total"][keep]
+                    ring.blocked = saved[f"{name}_blocked"][keep]
+                    rings[name] = ring
+            with self.lock:
+                self.locations = locations
+                self.rows = {location: row for row, location in enumerate(locations)}
+                for name, (span, bucket_seconds) in self.windows.items():
+                    self.rings[name] = rings.get(name) or _Ring(span, bucket_seconds, len(locations))
+            print(f"✅ Live heatmap restored: {len(locations)} locations.")
+        except Exception as e:
+            print(f"⚠️ Could not restore live heatmap: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            with self.lock:
+                columns = {"locations": np.array(json.dumps(self.locations))}
+                for name, ring in self.rings.items():
+                    rows = len(self.locations)
+                    columns[f"{name}_slots"] = ring.slot_bucket.copy()
+                    columns[f"{name}_total"] = ring.total[:rows].copy()
+                    columns[f"{name}_blocked"] = ring.blocked[:rows].copy()
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **columns)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"⚠️ Could not persist live heatmap: {e}")
+
+    def stats(self):
+        return {
+            "windows": list(self.windows),
+            "locations": len(self.locations),
+            "counted": self.counted,
+            "skipped": self.skipped,
+            "persistent": bool(self.path)
+        }
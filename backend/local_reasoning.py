@@ -0,0 +1,69 @@
+# Template-based explanations built from the scores predict() already has.
+# No network hop, so this is what Low-risk transactions get by default; see
+# HybridFraudModel.uses_llm_reasoning (and its use in predict) for the escalation policy.
+
+TEXT = {
+    'en': {
+        'p_fraud': "- The fraud model rates this transaction at {p:.1f}% probability of fraud, which is {band}.",
+        'bands': {'low': "low", 'moderate': "moderate", 'high': "high"},
+        'amount_high': "- The amount of ₹{amount:,.0f} is {ratio:.1f} times this user's usual spend of about ₹{mean:,.0f}.",
+        'amount_above': "- The amount of ₹{amount:,.0f} is somewhat above this user's usual spend of about ₹{mean:,.0f}.",
+        'amount_normal': "- The amount of ₹{amount:,.0f} is within this user's usual range (about ₹{mean:,.0f}).",
+        'amount_unknown': "- No spending history is on file for this user, so the amount of ₹{amount:,.0f} was judged on general fraud patterns only.",
+        'behaviour_high': "- The location ({location}) and device ({device}) differ sharply from this user's normal pattern (anomaly score {error:.2f}).",
+        'behaviour_mid': "- The location ({location}) and device ({device}) differ somewhat from this user's normal pattern (anomaly score {error:.2f}).",
+        'behaviour_normal': "- The location ({location}) and device ({device}) match this user's normal pattern.",
+    },
+    'hi': {
+        'p_fraud': "- फ्रॉड मॉडल के अनुसार इस लेनदेन के फ्रॉड होने की संभावना {p:.1f}% है, जो {band} है।",
+        'bands': {'low': "कम", 'moderate': "मध्यम", 'high': "अधिक"},
+        'amount_high': "- ₹{amount:,.0f} की राशि इस उपयोगकर्ता के सामान्य खर्च (लगभग ₹{mean:,.0f}) से {ratio:.1f} गुना है।",
+        'amount_above': "- ₹{amount:,.0f} की राशि इस उपयोगकर्ता के सामान्य खर्च (लगभग ₹{mean:,.0f}) से कुछ अधिक है।",
+        'amount_normal': "- ₹{amount:,.0f} की राशि इस उपयोगकर्ता के सामान्य खर्च (लगभग ₹{mean:,.0f}) के दायरे में है।",
+        'amount_unknown': "- इस उपयोगकर्ता का कोई खर्च इतिहास उपलब्ध नहीं है, इसलिए ₹{amount:,.0f} की राशि को सामान्य फ्रॉड पैटर्न के आधार पर जाँचा गया।",
+        'behaviour_high': "- स्थान ({location}) और डिवाइस ({device}) इस उपयोगकर्ता के सामान्य व्यवहार से बहुत अलग हैं (असामान्यता स्कोर {error:.2f})।",
+        'behaviour_mid': "- स्थान ({location}) और डिवाइस ({device}) इस उपयोगकर्ता के सामान्य व्यवहार से कुछ अलग हैं (असामान्यता स्कोर {error:.2f})।",
+        'behaviour_normal': "- स्थान ({location}) और डिवाइस ({device}) इस उपयोगकर्ता के सामान्य व्यवहार से मेल खाते हैं।",
+    }
+}
+
+
+def build_local_reasoning(tx_dict, p_fraud, recon_error, amount_mean=None, language='en'):
+    """
+    Three plain-text bullets: fraud probability, amount vs the user's AE
+    scaler mean, and location/device vs the behavioural profile.
+    Thresholds mirror classify_risk so the wording agrees with the verdict.
+    """
+    text = TEXT.get(language, TEXT['en'])
+    lines = []
+
+    if p_fraud > 0.7:
+        band = 'high'
+    elif p_fraud > 0.3:
+        band = 'moderate'
+    else:
+        band = 'low'
+    lines.append(text['p_fraud'].format(p=p_fraud * 100, band=text['bands'][band]))
+
+    amount = float(tx_dict.get('amount') or 0)
+    if amount_mean is None or amount_mean <= 0:
+        lines.append(text['amount_unknown'].format(amount=amount))
+    else:
+        ratio = amount / amount_mean
+        if ratio >= 3:
+            lines.append(text['amount_high'].format(amount=amount, mean=amount_mean, ratio=ratio))
+        elif ratio >= 1.5:
+            lines.append(text['amount_above'].format(amount=amount, mean=amount_mean))
+        else:
+            lines.append(text['amount_normal'].format(amount=amount, mean=amount_mean))
+
+    location = tx_dict.get('location', 'Unknown')
+    device = tx_dict.get('device_used', 'Unknown')
+    if recon_error > 1.0:
+        lines.append(text['behaviour_high'].format(location=location, device=device, error=recon_error))
+    elif recon_error > 0.3:
+        lines.append(text['behaviour_mid'].format(location=location, device=device, error=recon_error))
+    else:
+        lines.append(text['behaviour_normal'].format(location=location, device=device))
+
+    return "\n".join(lines)
@@ -12,6 +12,7 @@ if os.path.exists(local_lib_path):
     sys.path.insert(0, local_lib_path)
 
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel
 from typing import Optional, List
 from ml_models import hybrid_model
@@ -24,7 +25,25 @@ from datetime import datetime
 from city_coords import CITY_COORDS
 import pandas as pd # Added for df
 import time
+import random
+import json
+import asyncio
 from sentinel_module.detect_fraud import FraudSentinel
+from blocked_registry import BlockedRegistryCache
+from reasoning_jobs import ReasoningJobs
+from write_behind import WriteBehindQueue
+from spend_window import SpendWindows
+from spend_rollups import read_spend_last_24h, rollup_op
+from spend_reservations import SpendReservations, FirestoreSpendReservations
+from user_profiles import UserProfileCache
+from user_directory import UserDirectory
+from heatmap import HeatmapMaterializer
+from live_heatmap import LiveHeatmap, WINDOWS as LIVE_HEATMAP_WINDOWS
+from tile_pyramid import TilePyramid, DEFAULT_MAX_ZOOM, parse_bbox
+from build_tiles import build as build_tiles, DEFAULT_INPUT as TILES_SOURCE_CSV
+from pagination import fetch_page, page_size, decode_cursor
+import executors
+from executors import run_io, run_cpu, run_in
 
 # Initialize Firebase
 cred_path = os.path.join(os.path.dirname(__file__), 'firebase-credentials.json')
@@ -81,13 +100,12 @@ else:
 # Initialize Global references for Endpoints
 print("Initializing Global Data Sources...")
 try:
-    blocked_ref = db.collection('blocked_registry')
-    
     # Load Dataset
     base_dir = os.path.dirname(os.path.abspath(__file__))
     csv_path = os.path.join(base_dir, 'data', 'janani_dataset_A_final (1).csv')
     if os.path.exists(csv_path):
-        df = pd.read_csv(csv_path)
+        # Category columns: the heatmap aggregates their integer codes
+        df = pd.read_csv(csv_path, dtype={"location": "category", "transaction_type": "category"})
         print(f"Loaded CSV with {len(df)} rows.")
     else:
         print(f"Warning: CSV not found at {csv_path}")
@@ -95,13 +113,75 @@ try:
 except Exception as e:
     print(f"Error initializing globals: {e}")
     df = pd.DataFrame()
-    blocked_ref = None
 
 # --- UPI SENTINEL ---
 UPI_MODEL_PATH = "models/upi_weights.json"
 UPI_SCALER_PATH = "upi_models/feature_scaler.pkl"
 sentinel = None
 
+# --- BLOCKED REGISTRY (in-memory, kept in sync by a Firestore listener) ---
+blocked_registry = BlockedRegistryCache(poll_interval=int(os.environ.get("BLOCKED_REGISTRY_POLL_SECONDS", 30)))
+
+# --- DEFERRED REASONING ---
+# "inline": wait for Groq before responding (default). "deferred": respond with the verdict
+# and a reasoning_id, generate the explanation in the background.
+REASONING_MODE = os.environ.get("REASONING_MODE", "inline")
+REASONING_STREAM_TIMEOUT = float(os.environ.get("REASONING_STREAM_TIMEOUT", 60))
+reasoning_jobs = ReasoningJobs(hybrid_model.reasoning_pool)
+
+# --- WRITE-BEHIND PERSISTENCE ---
+# Firestore rejects write batches larger than this
+FIRESTORE_BATCH_LIMIT = 500
+persistence = WriteBehindQueue(
+    journal_path=os.environ.get("WRITE_JOURNAL_PATH", os.path.join(backend_dir, "write_journal.jsonl")),
+    max_pending=int(os.environ.get("WRITE_QUEUE_SIZE", 10000)),
+    batch_size=FIRESTORE_BATCH_LIMIT,
+    fsync=os.environ.get("WRITE_JOURNAL_FSYNC", "false").lower() == "true"
+)
+
+# --- ROLLING 24H SPEND (in-memory, rebuilt at startup, updated on every saved UPI payment) ---
+spend_windows = SpendWindows(bucket_seconds=int(os.environ.get("SPEND_BUCKET_SECONDS", 300)))
+
+# --- USER PROFILES (personal/business type rarely changes, so cache the users/{id} reads) ---
+user_profiles = UserProfileCache(
+    lambda user_id: load_user_profile(user_id),
+    max_size=int(os.environ.get("USER_PROFILE_CACHE_SIZE", 50000)),
+    ttl=int(os.environ.get("USER_PROFILE_TTL_SECONDS", 300)),
+    negative_ttl=int(os.environ.get("USER_PROFILE_NEGATIVE_TTL_SECONDS", 60))
+)
+
+# --- UPI USER DIRECTORY (/users is served from a sorted in-memory index of the user_ key range) ---
+# Profile edits seen by its listener also drop the cached profile.
+user_directory = UserDirectory(
+    poll_interval=int(os.environ.get("USER_DIRECTORY_POLL_SECONDS", 60)),
+    on_change=lambda user_id: user_profiles.invalidate(user_id)
+)
+
+# --- FRAUD HEATMAP (materialized at startup, kept current from the blocked registry) ---
+# HEATMAP_REBUILD_SECONDS > 0 also redoes the whole thing periodically.
+heatmap = HeatmapMaterializer(CITY_COORDS, rebuild_interval=int(os.environ.get("HEATMAP_REBUILD_SECONDS", 0)))
+
+# --- HEATMAP TILES (transaction lat/long at every zoom; built by build_tiles.py, updated as we score) ---
+HEATMAP_TILES_PATH = os.environ.get("HEATMAP_TILES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'heatmap_tiles.npz'))
+# --- LIVE HEATMAP (1h/24h/7d ring buffers fed by write-behind commits) ---
+live_heatmap = LiveHeatmap(CITY_COORDS, path=os.environ.get(
+    "LIVE_HEATMAP_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'live_heatmap.npz')))
+persistence.subscribe(live_heatmap.on_commit)
+
+DEFAULT_HEATMAP_ZOOM = 5  # whole country
+heatmap_tiles = TilePyramid(int(os.environ.get("HEATMAP_MAX_ZOOM", DEFAULT_MAX_ZOOM)), path=HEATMAP_TILES_PATH,
+                            save_interval=float(os.environ.get("HEATMAP_TILES_SAVE_SECONDS", 60)))
+
+# --- DAILY LIMIT RESERVATIONS (check + hold is atomic per user) ---
+# "local": striped in-process locks, enough for a single server process.
+# "firestore": transactional holds shared by every replica.
+SPEND_RESERVATIONS_MODE = os.environ.get("SPEND_RESERVATIONS", "local")
+spend_reservations = SpendReservations(
+    lambda user_id, now: fetch_spend_state(user_id, now),
+    lambda ops: persistence.enqueue(ops),
+    stripes=int(os.environ.get("SPEND_LOCK_STRIPES", 64))
+)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -109,6 +189,7 @@ async def lifespan(app: FastAPI):
     print("🚀 App Startup: Initializing Models...")
     
     loaded = hybrid_model.load_models()
+    hybrid_model.reasoning_cache.load()
     
     if not loaded:
         # Fallback Logic
@@ -138,8 +219,42 @@ async def lifespan(app: FastAPI):
     else:
         print(f"Warning: UPI Model not found at {UPI_MODEL_PATH}")
 
+    # Before the write-behind replay, whose commits it counts
+    live_heatmap.load()
+
+    # Mirror the blocked registry so per-transaction checks are local lookups
+    if db is not None:
+        blocked_registry.start(db)
+        persistence.start(db)
+        # After the journal replay so queued-but-uncommitted payments are counted too
+        spend_windows.start(db, persistence.pending)
+        user_directory.start(db)
+        if SPEND_RESERVATIONS_MODE == "firestore":
+            global spend_reservations
+            spend_reservations = FirestoreSpendReservations(db, hold_ttl=int(os.environ.get("SPEND_HOLD_TTL_SECONDS", 60)))
+
+    heatmap.start(df, blocked_registry if db is not None else None)
+    if not os.path.exists(HEATMAP_TILES_PATH):
+        # First run: build from the bundled sample (run build_tiles.py for real data)
+        try:
+            build_tiles([TILES_SOURCE_CSV], HEATMAP_TILES_PATH, heatmap_tiles.max_zoom)
+        except Exception as e:
+            print(f"⚠️ Could not build heatmap tiles: {e}")
+    heatmap_tiles.load()
+    heatmap_tiles.start()
+
+    reasoning_jobs.on_ready = save_deferred_reasoning
+
     yield
     print("Shutting down...")
+    persistence.stop(timeout=float(os.environ.get("WRITE_FLUSH_TIMEOUT", 10)))
+    blocked_registry.stop()
+    user_directory.stop()
+    heatmap.stop()
+    heatmap_tiles.stop()
+    live_heatmap.save()
+    hybrid_model.reasoning_cache.save()
+    executors.shutdown()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -154,58 +269,62 @@ app.add_middleware(
 )
 
 # --- UPI HELPER ---
-def get_user_risk_profile(user_id):
-    """
-    Fetches user type and calculates their REAL spending today.
-    """
-    # A. Get User Type (Business vs Personal)
-    if db is None:
-        print("⚠️ Database offline. Defaulting to 'personal'.")
-        return 'personal', 0, 3600
-
-    user_ref = db.collection('users').document(user_id).get()
+def fetch_user_type(user_id):
+    # A. Get User Type (Business vs Personal), usually straight from the profile cache
+    user_data = user_profiles.get(user_id)
     
-    if user_ref.exists:
-        user_data = user_ref.to_dict()
+    if user_data is not None:
         user_type = user_data.get('type', 'personal')
         print(f"👤 Found User: {user_id} | Type: {user_type}")
     else:
         # If user doesn't exist in DB, assume they are a new Personal user
         print(f"⚠️ User {user_id} not found. Defaulting to 'personal'.")
         user_type = 'personal'
+    return user_type
+
+def load_user_profile(user_id):
+    user_ref = db.collection('users').document(user_id).get()
+    return user_ref.to_dict() if user_ref.exists else None
 
+def fetch_spend_last_24h(user_id):
     # B. Calculate 'Amount Spent Today' (Last 24h)
     current_time = int(time.time())
-    start_of_day = current_time - 86400 # 24 hours ago
+    total_spent_today, last_txn_time = fetch_spend_state(user_id, current_time)
+
+    # Calculate time since last transaction
+    time_gap = 3600  # Default 1 hour if no previous transactions
+    if last_txn_time:
+        time_gap = current_time - last_txn_time
     
-    # Query: Get all transactions for this user, filter by time in Python
-    # (Avoids Firestore composite index requirement)
+    print(f"💰 {user_id} has spent ₹{total_spent_today} in the last 24h. Last txn: {time_gap}s ago.")
+    return total_spent_today, time_gap
+
+def fetch_spend_state(user_id, current_time):
+    """(spent in the 24h before current_time, timestamp of the latest transaction in it or None)"""
+    if spend_windows.ready:
+        total_spent_today, time_gap = spend_windows.lookup(user_id, current_time)
+        return total_spent_today, None if time_gap is None else current_time - time_gap
+    return scan_spend_state(user_id, current_time)
+
+def scan_spend_state(user_id, current_time):
+    # Daily rollups + a bounded tail query, only used until the spend windows finish rebuilding
+    start_of_day = current_time - 86400 # 24 hours ago
+
     try:
-        docs = db.collection('transactions')\
-            .where('user_id', '==', user_id)\
-            .stream()
+        total_spent_today, last_txn_time = read_spend_last_24h(db, user_id, current_time)
     except Exception as e:
-        print(f"⚠️ Firestore query error: {e}")
-        docs = []
+        print(f"⚠️ Firestore rollup read error: {e}")
+        total_spent_today, last_txn_time = 0, None
 
-    total_spent_today = 0
-    last_txn_time = None
-    for doc in docs:
-        data = doc.to_dict()
+    # Include writes still waiting in the write-behind queue so back-to-back
+    # payments see each other before the batch commit lands
+    for path, data in persistence.pending('transactions'):
         txn_time = data.get('timestamp', 0)
-        # Filter by timestamp in Python (last 24h)
-        if txn_time > start_of_day:
+        if data.get('user_id') == user_id and txn_time > start_of_day:
             total_spent_today += data.get('amount', 0)
             if last_txn_time is None or txn_time > last_txn_time:
                 last_txn_time = txn_time
-    
-    # Calculate time since last transaction
-    time_gap = 3600  # Default 1 hour if no previous transactions
-    if last_txn_time:
-        time_gap = current_time - last_txn_time
-    
-    print(f"💰 {user_id} has spent ₹{total_spent_today} in the last 24h. Last txn: {time_gap}s ago.")
-    return user_type, total_spent_today, time_gap
+    return total_spent_today, last_txn_time
 
 class UpiTransactionRequest(BaseModel):
     user_id: str
@@ -213,6 +332,12 @@ class UpiTransactionRequest(BaseModel):
     time_gap: int = 30 # Default if not provided (will be overridden by DB lookup)
     daily_total: float = 0 # Ignored, we calculate this from DB
 
+class UpiBatchTransaction(UpiTransactionRequest):
+    timestamp: Optional[int] = None # Epoch seconds within the last 24h; only orders a user's rows (default: now)
+
+class UpiBatchRequest(BaseModel):
+    transactions: List[UpiBatchTransaction]
+
 class TransactionData(BaseModel):
     user_id: str
     amount: float
@@ -230,6 +355,9 @@ class TransactionData(BaseModel):
     receiver_account: Optional[str] = "Unknown"
     language: Optional[str] = "en"
 
+class TransactionBatch(BaseModel):
+    transactions: List[TransactionData]
+
 class BlockRequest(BaseModel):
     entity_id: str
     entity_type: str
@@ -243,34 +371,122 @@ async def block_entity(request: BlockRequest):
     try:
         # Use simple document ID as entity_id to prevent duplicates
         doc_ref = db.collection('blocked_registry').document(request.entity_id)
-        doc_ref.set({
+        entry = {
             "entity_id": request.entity_id,
             "type": request.entity_type,
             "reason": request.reason,
             "source": request.source,
             "timestamp": datetime.now().isoformat(),
             "status": "Blocked"
-        })
+        }
+        await run_io(doc_ref.set, entry)
+        # Write-through so the block applies before the listener echoes it back
+        blocked_registry.put(request.entity_id, entry)
         print(f"Blocked entity: {request.entity_id} ({request.reason})")
         return {"status": "success", "message": f"Entity {request.entity_id} blocked successfully."}
     except Exception as e:
         print(f"Error blocking entity: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/users/{user_id}/invalidate-profile")
+async def invalidate_user_profile(user_id: str):
+    """Call after changing users/{user_id} (e.g. personal -> business) so the next payment re-reads it."""
+    user_profiles.invalidate(user_id)
+    return {"status": "success", "message": f"Profile cache cleared for {user_id}."}
+
 @app.get("/alerts")
 async def get_alerts():
     if db is None:
         return {"status": "error", "message": "Database offline"}
     try:
-        alerts_ref = db.collection('alerts').order_by('timestamp', direction=firestore.Query.DESCENDING).limit(10).stream()
-        alerts = [doc.to_dict() for doc in alerts_ref]
+        query = db.collection('alerts').order_by('timestamp', direction=firestore.Query.DESCENDING).limit(10)
+        alerts = await run_io(lambda: [doc.to_dict() for doc in query.stream()])
         return {"status": "success", "data": alerts}
     except Exception as e:
         print(f"Error fetching alerts: {e}")
         return {"status": "error", "message": str(e)}
 
+def blocked_entity_result(entity_id, entity_data, role):
+    """Critical verdict returned when the sender or receiver is in the blocked registry."""
+    reason = entity_data.get('reason', 'Blocked Entity')
+    location = entity_data.get('location', 'Unknown Location')
+    if role == "SENDER":
+        reasoning = f"⚠️ BLOCKED ENTITY DETECTED (SENDER)\n\n- Entity ID: {entity_id}\n- Location: {location}\n- Reason: {reason}\n\nThis transaction was automatically blocked because the sender is in the global blacklist."
+    else:
+        reasoning = f"⚠️ BLOCKED ENTITY DETECTED (RECEIVER)\n\n- Blocked Receiver ID: {entity_id}\n- Location: {location}\n- Reason: {reason}\n\nThis transaction was automatically blocked because the receiver is in the global blacklist."
+    return {
+        "fraud_probability": 1.0,
+        "risk_level": "Critical",
+        "anomaly_score": 1.0, # Max anomaly
+        "is_blocked": True,
+        "reasoning": reasoning,
+        "blocked_entity": entity_id
+    }
+
+def apply_geo_override(user_id, tx_dict, result):
+    # Geo-Anomaly Override (London)
+    if user_id == "ACC_1001" and "London" in tx_dict.get('location', ''):
+        print(f"Geo-Anomaly Detected: Blocking transaction for {user_id} from London")
+        result['is_blocked'] = True
+        result['risk_level'] = "Critical"
+        result['reasoning'] = f"CRITICAL GEO-ANOMALY: User {user_id} (Home Base: Mumbai, IN) attempted a transaction from London, UK. This deviation of >7,000km from the user's established geo-cluster triggers an immediate fraud block."
+    return result
+
+async def llm_reasoning(tx_dict, result, language):
+    """Groq explanation for a scored transaction, on the reasoning pool (network-bound, not CPU)."""
+    return await run_in(hybrid_model.reasoning_pool, hybrid_model.generate_ai_reasoning, tx_dict,
+                        result["fraud_probability"], result["anomaly_score"], result["risk_level"], language)
+
+def new_transaction_id(taken=None):
+    """TX_<unix seconds>_<3 digits>. Pass `taken` to stay unique within a batch."""
+    while True:
+        tx_id = f"TX_{int(datetime.now().timestamp())}_{random.randint(100, 999)}"
+        if not taken or tx_id not in taken:
+            return tx_id
+
+def build_transaction_record(tx_dict, user_id, tx_id, result):
+    return {
+        **tx_dict,
+        "user_id": user_id,
+        "transaction_id": tx_id,
+        "timestamp": datetime.now().isoformat(),
+        "fraud_probability": result["fraud_probability"],
+        "anomaly_score": result["anomaly_score"],
+        "risk_level": result["risk_level"],
+        "is_blocked": result["is_blocked"],
+        "status": "blocked" if result["is_blocked"] else "completed",
+        "reasoning": result["reasoning"],
+        **({"reasoning_status": result["reasoning_status"]} if "reasoning_status" in result else {})
+    }
+
+def user_transaction_ref(user_id, tx_id):
+    return db.collection('user_transactions').document(user_id).collection('transactions').document(tx_id)
+
+async def lookup_blocked(*entity_ids):
+    """Registry entries for each id (None = not blocked). Pure dict reads once the cache is warm."""
+    if blocked_registry.ready:
+        return [blocked_registry.get(entity_id) for entity_id in entity_ids]
+    # Cold cache: the direct Firestore reads are independent, so issue them together
+    return await asyncio.gather(*(run_io(blocked_registry.get, entity_id) for entity_id in entity_ids))
+
+def wants_deferred_reasoning(defer_reasoning):
+    """Per-request ?defer_reasoning= wins over the REASONING_MODE default."""
+    if defer_reasoning is None:
+        return REASONING_MODE == "deferred"
+    return defer_reasoning
+
+def mark_reasoning_pending(result, tx_id):
+    result["reasoning_id"] = tx_id
+    result["reasoning_status"] = "pending"
+
+def save_deferred_reasoning(tx_id, user_id, reasoning):
+    """Called from the reasoning worker once Groq has answered."""
+    # merge rather than update: the transaction itself may still be in the write-behind queue
+    persistence.set(user_transaction_ref(user_id, tx_id).path, {"reasoning": reasoning, "reasoning_status": "ready"}, merge=True)
+    print(f"Deferred reasoning saved for {tx_id}")
+
 @app.post("/analyze-transaction")
-async def analyze_transaction(data: TransactionData):
+async def analyze_transaction(data: TransactionData, defer_reasoning: Optional[bool] = None):
     print(f"Received analysis request for user: {data.user_id}")
     if db is None:
         raise HTTPException(status_code=503, detail=f"Database connection offline. Error: {init_error}")
@@ -280,73 +496,42 @@ async def analyze_transaction(data: TransactionData):
         language = tx_dict.pop('language', 'en')
         receiver = tx_dict.get('receiver_account', 'Unknown')
         
-        # --- 0. Blocked Registry Check ---
-        blocked_ref = db.collection('blocked_registry')
-        
+        # --- 0. Blocked Registry Check (in-memory) ---
+        check_receiver = bool(receiver and receiver != "Unknown")
+        entries = await (lookup_blocked(user_id, receiver) if check_receiver else lookup_blocked(user_id))
+        sender_entry = entries[0]
+        receiver_entry = entries[1] if check_receiver else None
+
         # Check Sender
-        sender_doc = blocked_ref.document(user_id).get()
-        if sender_doc.exists:
-            data = sender_doc.to_dict()
-            reason = data.get('reason', 'Blocked Entity')
-            location = data.get('location', 'Unknown Location')
-            return {
-                "status": "success",
-                "data": {
-                    "fraud_probability": 1.0,
-                    "risk_level": "Critical",
-                    "anomaly_score": 1.0, # Max anomaly
-                    "is_blocked": True,
-                    "reasoning": f"⚠️ BLOCKED ENTITY DETECTED (SENDER)\n\n- Entity ID: {user_id}\n- Location: {location}\n- Reason: {reason}\n\nThis transaction was automatically blocked because the sender is in the global blacklist.",
-                    "blocked_entity": user_id
-                }
-            }
+        if sender_entry is not None:
+            return {"status": "success", "data": blocked_entity_result(user_id, sender_entry, "SENDER")}
 
         # Check Receiver
-        if receiver and receiver != "Unknown":
-            receiver_doc = blocked_ref.document(receiver).get()
-            if receiver_doc.exists:
-                data = receiver_doc.to_dict()
-                reason = data.get('reason', 'Blocked Entity')
-                location = data.get('location', 'Unknown Location')
-                return {
-                    "status": "success",
-                    "data": {
-                        "fraud_probability": 1.0,
-                        "risk_level": "Critical",
-                        "anomaly_score": 1.0, # Max anomaly
-                        "is_blocked": True,
-                        "reasoning": f"⚠️ BLOCKED ENTITY DETECTED (RECEIVER)\n\n- Blocked Receiver ID: {receiver}\n- Location: {location}\n- Reason: {reason}\n\nThis transaction was automatically blocked because the receiver is in the global blacklist.",
-                        "blocked_entity": receiver
-                    }
-                }
+        if receiver_entry is not None:
+            return {"status": "success", "data": blocked_entity_result(receiver, receiver_entry, "RECEIVER")}
         
-        # 1. Prediction (ML Model)
-        result = hybrid_model.predict(tx_dict, user_id, language)
-        
-        # Geo-Anomaly Override (London)
-        if user_id == "ACC_1001" and "London" in tx_dict.get('location', ''):
-             print(f"Geo-Anomaly Detected: Blocking transaction for {user_id} from London")
-             result['is_blocked'] = True
-             result['risk_level'] = "Critical"
-             result['reasoning'] = f"CRITICAL GEO-ANOMALY: User {user_id} (Home Base: Mumbai, IN) attempted a transaction from London, UK. This deviation of >7,000km from the user's established geo-cluster triggers an immediate fraud block."
-
-        # 2. Persist to Firebase
-        import random
-        tx_id = f"TX_{int(datetime.now().timestamp())}_{random.randint(100, 999)}"
-        save_data = {
-            **tx_dict,
-            "user_id": user_id,
-            "transaction_id": tx_id,
-            "timestamp": datetime.now().isoformat(),
-            "fraud_probability": result["fraud_probability"],
-            "anomaly_score": result["anomaly_score"],
-            "risk_level": result["risk_level"],
-            "is_blocked": result["is_blocked"],
-            "status": "blocked" if result["is_blocked"] else "completed",
-            "reasoning": result["reasoning"]
-        }
+        # 1. Prediction (ML Model). Only the scoring holds a CPU slot; Groq runs on its own pool
+        deferred = wants_deferred_reasoning(defer_reasoning)
+        result = await run_cpu(hybrid_model.predict, tx_dict, user_id, language, include_reasoning=False)
+        apply_geo_override(user_id, tx_dict, result)
+        if result["reasoning"] is None and not deferred:
+            result["reasoning"] = await llm_reasoning(tx_dict, result, language)
+        heatmap_tiles.add(tx_dict['lat'], tx_dict['long'], result["is_blocked"])
+
+        tx_id = new_transaction_id()
+        needs_reasoning = result["reasoning"] is None
+        if needs_reasoning:
+            mark_reasoning_pending(result, tx_id)
+
+        # 2. Persist to Firebase (write-behind: queued and journaled, committed in batches)
+        save_data = build_transaction_record(tx_dict, user_id, tx_id, result)
         
-        db.collection('user_transactions').document(user_id).collection('transactions').document(tx_id).set(save_data)
+        await run_io(persistence.set, user_transaction_ref(user_id, tx_id).path, save_data)
+
+        # 3. Explanation follows in the background (queued after the transaction, so it merges onto it)
+        if needs_reasoning:
+            reasoning_jobs.submit(tx_id, user_id, hybrid_model.generate_ai_reasoning,
+                                  tx_dict, result["fraud_probability"], result["anomaly_score"], result["risk_level"], language)
         
         print(f"Analysis Complete. Blocked: {result['is_blocked']} | Saved: {tx_id}")
         return {
@@ -357,14 +542,149 @@ async def analyze_transaction(data: TransactionData):
         print(f"Error in analysis: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/analyze-transaction/batch")
+async def analyze_transaction_batch(batch: TransactionBatch, defer_reasoning: Optional[bool] = None):
+    """
+    Scores a micro-batch in one pass. Results come back in request order and
+    match what /analyze-transaction returns for each row on its own.
+    """
+    print(f"Received batch analysis request: {len(batch.transactions)} transactions")
+    if db is None:
+        raise HTTPException(status_code=503, detail=f"Database connection offline. Error: {init_error}")
+    try:
+        rows = []
+        for item in batch.transactions:
+            tx_dict = item.model_dump()
+            user_id = tx_dict.pop('user_id')
+            language = tx_dict.pop('language', 'en')
+            rows.append((tx_dict, user_id, language))
+
+        # --- 0. Blocked Registry Check (in-memory) ---
+        entity_ids = set()
+        for tx_dict, user_id, _ in rows:
+            entity_ids.add(user_id)
+            receiver = tx_dict.get('receiver_account', 'Unknown')
+            if receiver and receiver != "Unknown":
+                entity_ids.add(receiver)
+        entity_ids = list(entity_ids)
+        blocked = dict(zip(entity_ids, await lookup_blocked(*entity_ids)))
+
+        results = [None] * len(rows)
+        to_score = []
+        for i, (tx_dict, user_id, _) in enumerate(rows):
+            receiver = tx_dict.get('receiver_account', 'Unknown')
+            sender_entry = blocked.get(user_id)
+            receiver_entry = blocked.get(receiver)
+            if sender_entry is not None:
+                results[i] = blocked_entity_result(user_id, sender_entry, "SENDER")
+            elif receiver_entry is not None:
+                results[i] = blocked_entity_result(receiver, receiver_entry, "RECEIVER")
+            else:
+                to_score.append(i)
+
+        # 1. Prediction (ML Model, vectorized). Only the scoring holds a CPU slot
+        deferred = wants_deferred_reasoning(defer_reasoning)
+        scored = await run_cpu(
+            hybrid_model.predict_batch,
+            [rows[i][0] for i in to_score],
+            [rows[i][1] for i in to_score],
+            [rows[i][2] for i in to_score],
+            include_reasoning=False
+        )
+        for i, result in zip(to_score, scored):
+            apply_geo_override(rows[i][1], rows[i][0], result)
+        if not deferred:
+            # Groq calls fanned out on the reasoning pool
+            pending = [(i, result) for i, result in zip(to_score, scored) if result["reasoning"] is None]
+            texts = await asyncio.gather(*(llm_reasoning(rows[i][0], result, rows[i][2]) for i, result in pending))
+            for (_, result), text in zip(pending, texts):
+                result["reasoning"] = text
+
+        # 2. Persist to Firebase (write-behind queue groups these into batch commits)
+        writes = []
+        tx_ids = set()
+        reasoning_backlog = []
+        for i, result in zip(to_score, scored):
+            tx_dict, user_id, language = rows[i]
+            results[i] = result
+            heatmap_tiles.add(tx_dict['lat'], tx_dict['long'], result["is_blocked"])
+            tx_id = new_transaction_id(tx_ids)
+            tx_ids.add(tx_id)
+            if result["reasoning"] is None:
+                mark_reasoning_pending(result, tx_id)
+                reasoning_backlog.append((tx_id, user_id, tx_dict, result, language))
+            writes.append((user_transaction_ref(user_id, tx_id).path, build_transaction_record(tx_dict, user_id, tx_id, result)))
+        await run_io(lambda: [persistence.set(path, record) for path, record in writes])
+
+        # 3. Deferred explanations
+        for tx_id, user_id, tx_dict, result, language in reasoning_backlog:
+            reasoning_jobs.submit(tx_id, user_id, hybrid_model.generate_ai_reasoning,
+                                  tx_dict, result["fraud_probability"], result["anomaly_score"], result["risk_level"], language)
+
+        print(f"Batch Analysis Complete. Scored: {len(to_score)} | Blocked by registry: {len(rows) - len(to_score)}")
+        return {
+            "status": "success",
+            "data": results
+        }
+    except Exception as e:
+        print(f"Error in batch analysis: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/reasoning/{tx_id}")
+async def get_reasoning(tx_id: str, user_id: Optional[str] = None):
+    """
+    Poll for a deferred explanation. Jobs are tracked in memory; pass user_id
+    to fall back to the persisted transaction once the job has aged out.
+    """
+    status = reasoning_jobs.status(tx_id)
+    if status is not None:
+        return {"status": "success", "data": status}
+    if user_id and db is not None:
+        doc = await run_io(user_transaction_ref(user_id, tx_id).get)
+        if doc.exists:
+            tx = doc.to_dict()
+            return {"status": "success", "data": {
+                "reasoning_id": tx_id,
+                "status": tx.get("reasoning_status", "ready"),
+                "reasoning": tx.get("reasoning")
+            }}
+    raise HTTPException(status_code=404, detail=f"No reasoning found for {tx_id}")
+
+@app.get("/reasoning/{tx_id}/stream")
+async def stream_reasoning(tx_id: str):
+    """Server-Sent Events: one `reasoning` event when the explanation is ready."""
+    if reasoning_jobs.get(tx_id) is None:
+        raise HTTPException(status_code=404, detail=f"No reasoning job for {tx_id}")
+
+    async def events():
+        try:
+            status = await reasoning_jobs.wait(tx_id, REASONING_STREAM_TIMEOUT)
+            yield f"event: reasoning\ndata: {json.dumps(status)}\n\n"
+        except asyncio.TimeoutError:
+            yield f"event: timeout\ndata: {json.dumps({'reasoning_id': tx_id, 'status': 'pending'})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 @app.get("/transactions/{user_id}")
-async def get_user_transactions(user_id: str):
+async def get_user_transactions(user_id: str, limit: Optional[int] = None, cursor: Optional[str] = None,
+                                since: Optional[str] = None, until: Optional[str] = None, fields: Optional[str] = None):
+    """
+    Newest-first page of a user's bank transactions. since/until are ISO
+    timestamps (since < timestamp <= until), `fields` a comma-separated
+    projection; pass `next_cursor` back as `cursor` for the next page.
+    """
     if db is None:
         return {"status": "error", "message": "Database offline"}
     try:
-        docs = db.collection('user_transactions').document(user_id).collection('transactions').order_by('timestamp', direction=firestore.Query.DESCENDING).limit(50).stream()
-        tx_list = [doc.to_dict() for doc in docs]
-        return {"status": "success", "data": tx_list}
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        query = db.collection('user_transactions').document(user_id).collection('transactions')
+        projection = [f.strip() for f in fields.split(',') if f.strip()] if fields else None
+        docs, next_cursor = await run_io(fetch_page, query, page_size(limit), cursor, since, until, projection)
+        return {"status": "success", "data": [doc.to_dict() for doc in docs], "next_cursor": next_cursor}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -374,7 +694,13 @@ async def root():
 
 @app.get("/health")
 async def health():
-    return {"status": "ok", "models_loaded": hybrid_model.lgb_model is not None}
+    return {
+        "status": "ok",
+        "models_loaded": hybrid_model.lgb_model is not None,
+        "reasoning_cache": hybrid_model.reasoning_cache.stats(),
+        "ae_profiles": hybrid_model.user_aes.stats(),
+        "user_profiles": user_profiles.stats()
+    }
 
 @app.get("/db-status")
 async def db_status_check():
@@ -384,131 +710,49 @@ async def db_status_check():
         "env_present": "FIREBASE_CREDENTIALS_BASE64" in os.environ,
         "env_length": len(os.environ.get("FIREBASE_CREDENTIALS_BASE64", "")) if os.environ.get("FIREBASE_CREDENTIALS_BASE64") else 0,
         "init_error": init_error,
-        "local_file_exists": os.path.exists(cred_path)
+        "local_file_exists": os.path.exists(cred_path),
+        "blocked_registry_cache": blocked_registry.stats(),
+        "write_behind": persistence.stats(),
+        "spend_windows": spend_windows.stats(),
+        "spend_reservations": spend_reservations.stats(),
+        "user_directory": user_directory.stats(),
+        "heatmap": heatmap.stats(),
+        "heatmap_tiles": heatmap_tiles.stats(),
+        "live_heatmap": live_heatmap.stats()
     }
 
 @app.get("/fraud-heatmap")
-async def get_fraud_heatmap():
+async def get_fraud_heatmap(bbox: Optional[str] = None, zoom: Optional[int] = None, window: Optional[str] = None):
     """
-    Returns:
     1. Heatmap Points (Weighted for general density)
     2. Pinned Locations (Specific high-risk markers with metadata)
+    Without bbox/zoom: the city-level map, served as-is from the materialized
+    snapshot (`version` changes whenever it does).
+    With them: fraud points, one per visible tile with fraud at `zoom`
+    (0-14), weighted by its fraud count; bbox = west,south,east,north in
+    degrees (default: everything). A view too dense for the cell cap comes
+    back at a coarser zoom, which the response's `zoom` reports.
+    With window=1h|24h|7d: live counts of the transactions saved in that window.
     """
-    print("--- DEBUG: Calculating Heatmap ---")
-    heatmap_points = []
-    pinned_locations = {} # Use dict to aggregate counts by city name
+    if window is not None:
+        if window not in LIVE_HEATMAP_WINDOWS:
+            raise HTTPException(status_code=400, detail=f"window must be one of {', '.join(LIVE_HEATMAP_WINDOWS)}")
+        if bbox is not None or zoom is not None:
+            raise HTTPException(status_code=400, detail="window can't be combined with bbox/zoom")
+        return live_heatmap.view(window)
 
-    # 1. Process Historical Data
-    try:
-        fraud_df = df[df['is_fraud'] == 1]
-        print(f"DEBUG: Total Fraud Rows found: {len(fraud_df)}")
-        loc_counts = fraud_df['location'].value_counts()
-        print(f"DEBUG: Top locations: {loc_counts.head()}")
-        
-        for location, count in loc_counts.items():
-            if location in CITY_COORDS:
-                coords = CITY_COORDS[location]
-                
-                # heatmap weight
-                heatmap_points.append({
-                    "location": coords,
-                    "weight": int(count) * 2
-                })
-                
-                # Pin logic: Aggregate counts
-                if location not in pinned_locations:
-                    pinned_locations[location] = {
-                        "location": coords,
-                        "title": location,
-                        "desc": [],
-                        "severity": 0,
-                        "types": [] # Track fraud types
-                    }
-                pinned_locations[location]["severity"] += int(count)
-                pinned_locations[location]["desc"].append(f"Historical Fraud: {count} cases")
-                
-                # Get fraud types for this location row (approximation from aggregation)
-                # Ideally we filter df by location, but for performance in this loop we might need a better way.
-                # Since we are iterating value_counts, we can't easily get the types here without another filter.
-                # Optimization: Do a group by location first.
-                
-    except Exception as e:
-        print(f"Error processing CSV heatmap: {e}")
+    snapshot = heatmap.current()
+    if bbox is None and zoom is None:
+        return Response(content=snapshot.body, media_type="application/json",
+                        headers={"X-Heatmap-Version": str(snapshot.version)})
 
-    # OPTIMIZATION: Calculate Most Common Fraud Type per Location
     try:
-        if not df.empty:
-            fraud_df = df[df['is_fraud'] == 1]
-            # Group by location and find mode of transaction_type
-            loc_types = fraud_df.groupby('location')['transaction_type'].agg(lambda x: x.mode().iloc[0] if not x.mode().empty else "Unknown").to_dict()
-            
-            for loc in pinned_locations:
-                if loc in loc_types:
-                    pinned_locations[loc]["common_fraud_type"] = loc_types[loc]
-                else:
-                    pinned_locations[loc]["common_fraud_type"] = "Phishing" # Default
-    except Exception as e:
-        print(f"Error calculating fraud types: {e}")
-
-
-    # 2. Process Blocked Registry (Live Threats)
-    try:
-        print("DEBUG: Fetching Blocked Registry...")
-        docs = blocked_ref.stream()
-        count = 0
-        for doc in docs:
-            count += 1
-            data = doc.to_dict()
-            loc = data.get('location')
-            print(f"DEBUG: Blocked Entity Loc: {loc}")
-            if loc and loc in CITY_COORDS:
-                coords = CITY_COORDS[loc]
-                
-                # heatmap weight (very high)
-                heatmap_points.append({
-                    "location": coords,
-                    "weight": 20
-                })
-                
-                # Pin logic
-                if loc not in pinned_locations:
-                    pinned_locations[loc] = {
-                        "location": coords,
-                        "title": loc,
-                        "desc": [],
-                        "severity": 0
-                    }
-                pinned_locations[loc]["severity"] += 10 # Blocked entities are high severity
-                pinned_locations[loc]["desc"].append("Blocked Entity Detected")
-        print(f"DEBUG: Blocked entities processed: {count}")
-
-    except Exception as e:
-        print(f"Error processing Blocked Registry heatmap: {e}")
-
-    # Process and filter top pins
-    final_pins = []
-    print(f"DEBUG: Total pinned locations candidate count: {len(pinned_locations)}")
-    for loc_name, data in pinned_locations.items():
-        # Only pin if severity is significant
-        if data["severity"] > 5:
-            # unique description
-            unique_desc = list(set(data["desc"]))
-            summary_desc = f"Risk Score: {data['severity']} | Sources: {', '.join(unique_desc[:2])}..."
-            
-            final_pins.append({
-                "location": data["location"],
-                "title": data["title"],
-                "description": summary_desc,
-                "severity": data["severity"],
-                "common_fraud_type": data.get("common_fraud_type", "Cyber Fraud")
-            })
-            
-    # Sort by severity and pick top 10
-    final_pins.sort(key=lambda x: x["severity"], reverse=True)
-    final_pins = final_pins[:10]
-    
-    print(f"DEBUG: Final pins count: {len(final_pins)}")
-    return {"status": "success", "data": heatmap_points, "pins": final_pins}
+        bounds = parse_bbox(bbox) if bbox else (-180.0, -90.0, 180.0, 90.0)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    zoom = DEFAULT_HEATMAP_ZOOM if zoom is None else min(max(zoom, 0), heatmap_tiles.max_zoom)
+    zoom, cells = await run_io(heatmap_tiles.query, bounds, zoom)
+    return {"status": "success", "zoom": zoom, "data": cells, "pins": snapshot.payload["pins"], "version": snapshot.version}
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
@@ -517,55 +761,77 @@ if __name__ == "__main__":
 # --- UPI ENDPOINTS ---
 
 @app.get("/users")
-def get_users():
-    """Get all registered UPI user profiles for frontend dropdown"""
-    users = []
-    docs = db.collection('users').stream()
-    for doc in docs:
-        # Only include UPI user profiles (user_*), not transaction accounts (ACC_*)
-        if doc.id.startswith('user_'):
-            data = doc.to_dict()
-            users.append({
-                "id": doc.id,
-                "name": data.get("name", doc.id),
-                "type": data.get("type", "personal")
-            })
-    return {"users": users}
+async def get_users(limit: Optional[int] = None, cursor: Optional[str] = None,
+                    q: Optional[str] = None, by: str = "id"):
+    """
+    UPI user profiles for the frontend dropdown, one page at a time.
+    by=id|name sets the order; q is an id (or name) prefix search.
+    """
+    if db is None:
+        raise HTTPException(status_code=503, detail=f"Database connection offline. Error: {init_error}")
+    if by not in ("id", "name"):
+        raise HTTPException(status_code=400, detail="by must be 'id' or 'name'")
+    try:
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await run_io(list_upi_users, page_size(limit), cursor, q, by)
+
+def list_upi_users(limit, cursor=None, q=None, by="id"):
+    # Normally loaded at startup; if that failed, load it now (one read of the user_ range)
+    if not user_directory.ready:
+        user_directory.refresh()
+    try:
+        users, next_cursor = user_directory.page(limit, cursor, q, by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"users": users, "next_cursor": next_cursor}
 
 @app.get("/users/{user_id}/history")
-def get_user_history(user_id: str):
-    """Get transaction history for a user"""
-    current_time = int(time.time())
-    start_of_day = current_time - 86400
+async def get_user_history(user_id: str, limit: Optional[int] = None, cursor: Optional[str] = None,
+                           since: Optional[int] = None, until: Optional[int] = None):
+    """
+    Get transaction history for a user, newest first, one page at a time.
+    since/until are epoch seconds (since defaults to 24h ago).
+    """
+    try:
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await run_io(load_user_history, user_id, page_size(limit), cursor, since, until)
+
+def load_user_history(user_id, limit, cursor=None, since=None, until=None):
+    if since is None:
+        since = int(time.time()) - 86400
     
     try:
-        docs = db.collection('transactions')\
-            .where('user_id', '==', user_id)\
-            .stream()
+        # Bounded by timestamp, projected to what the response needs, one page at a time
+        query = db.collection('transactions').where('user_id', '==', user_id)
+        docs, next_cursor = fetch_page(query, limit, cursor, since, until,
+                                       fields=('amount', 'timestamp', 'verdict', 'risk_score'))
     except Exception as e:
         print(f"⚠️ History query error: {e}")
-        docs = []
+        docs, next_cursor = [], None
     
     transactions = []
-    total = 0
     for doc in docs:
         data = doc.to_dict()
-        txn_time = data.get("timestamp", 0)
-        # Filter by last 24h in Python
-        if txn_time > start_of_day:
-            transactions.append({
-                "id": doc.id,
-                "amount": data.get("amount", 0),
-                "timestamp": txn_time,
-                "verdict": data.get("verdict", "APPROVED"),
-                "risk_score": data.get("risk_score", 0)
-            })
-            total += data.get("amount", 0)
+        transactions.append({
+            "id": doc.id,
+            "amount": data.get("amount", 0),
+            "timestamp": data.get("timestamp", 0),
+            "verdict": data.get("verdict", "APPROVED"),
+            "risk_score": data.get("risk_score", 0)
+        })
     
-    return {"transactions": transactions, "daily_total": total}
+    # The 24h total comes from the spend windows / rollups, not from summing pages
+    total, _ = fetch_spend_last_24h(user_id)
+    return {"transactions": transactions, "daily_total": total, "next_cursor": next_cursor}
 
 @app.post("/analyze-upi")
-def analyze_upi_transaction(txn: UpiTransactionRequest):
+async def analyze_upi_transaction(txn: UpiTransactionRequest):
     if not sentinel:
         raise HTTPException(status_code=503, detail="UPI Model Loading...")
     
@@ -573,60 +839,193 @@ def analyze_upi_transaction(txn: UpiTransactionRequest):
         raise HTTPException(status_code=503, detail="Database connection offline.")
 
     # STEP 1: Get Real Context from Database
-    user_type, past_spent, real_time_gap = get_user_risk_profile(txn.user_id)
-    
-    # STEP 2: Calculate New Total
-    current_daily_total = past_spent + txn.amount
+    user_type = await run_io(fetch_user_type, txn.user_id)
 
-    # STEP 3: Apply DYNAMIC Rules based on user type
+    # STEP 2: Apply DYNAMIC Rules based on user type
     # Business users get 20x higher limit
     limit = 1000000 if user_type == "business" else 50000
+
+    # STEP 3: Check the limit and hold the amount in one step, so parallel
+    # payments from this user can't all squeeze under it
+    txn_time = int(time.time())
+    reservation = await run_io(spend_reservations.reserve, txn.user_id, txn.amount, limit, txn_time)
+    past_spent = reservation.past_spent
+    current_daily_total = past_spent + txn.amount
     
     print(f"📊 Analysis: User={txn.user_id} | Type={user_type} | Total={current_daily_total} | Limit={limit}")
 
     # RULE CHECK: Volume Trap (User-specific limit)
-    if current_daily_total > limit:
+    if not reservation.granted:
         # LOG THE FAILED ATTEMPT TO DB
-        db.collection("alerts").add({
-            "user_id": txn.user_id,
-            "reason": "Volume Violation",
-            "amount": txn.amount,
-            "timestamp": int(time.time())
-        })
-        return {
-            "verdict": "BLOCKED",
-            "reason": f"VOLUME_VIOLATION: Exceeded {user_type} limit (₹{limit:,})",
-            "risk_score": 100.0,
-            "ui_color": "red",
-            "user_type": user_type,
-            "daily_spent": past_spent,
-            "daily_limit": limit
-        }
+        await run_io(persistence.enqueue, [volume_alert_op(txn.user_id, txn.amount)])
+        return volume_blocked_response(user_type, past_spent, limit)
 
-    # STEP 4: AI Check (VAE) - Context-aware with user limit
-    status, reason, risk_score = sentinel.predict(
-        txn.user_id, txn.amount, real_time_gap, current_daily_total, user_limit=limit
-    )
-
-    # STEP 5: If Approved or Flagged, SAVE to History
-    # This ensures the 'daily total' updates for the NEXT transaction!
-    if status == "APPROVED" or status == "FLAGGED":
-        db.collection("transactions").add({
-            "user_id": txn.user_id,
-            "amount": txn.amount,
-            "timestamp": int(time.time()),
+    try:
+        real_time_gap = 3600  # Default 1 hour if no previous transactions
+        if reservation.last_txn_time:
+            real_time_gap = txn_time - reservation.last_txn_time
+
+        # STEP 4: AI Check (VAE) - Context-aware with user limit
+        status, reason, risk_score = await run_cpu(
+            sentinel.predict, txn.user_id, txn.amount, real_time_gap, current_daily_total, user_limit=limit
+        )
+
+        # STEP 5: If Approved or Flagged, SAVE to History
+        # This ensures the 'daily total' updates for the NEXT transaction!
+        if status == "APPROVED" or status == "FLAGGED":
+            ops = upi_transaction_ops(txn.user_id, txn.amount, txn_time, risk_score, status)
+            doc_id = ops[0][0].split('/')[-1]
+            await run_io(spend_reservations.commit, [reservation], ops,
+                         lambda: spend_windows.add(txn.user_id, txn.amount, txn_time, doc_id))
+            print(f"✅ Transaction Saved to History: {status}")
+    finally:
+        # No-op once committed; a payment the model blocked stops counting
+        spend_reservations.release(reservation)
+
+    return upi_verdict_response(status, reason, risk_score, user_type, past_spent, txn.amount, limit)
+
+def volume_alert_op(user_id, amount):
+    return (db.collection("alerts").document().path, {
+        "user_id": user_id,
+        "reason": "Volume Violation",
+        "amount": amount,
+        "timestamp": int(time.time())
+    }, False)
+
+def upi_transaction_ops(user_id, amount, txn_time, risk_score, status):
+    """Raw doc + its day's rollup; they go out in the same batch."""
+    return [
+        (db.collection("transactions").document().path, {
+            "user_id": user_id,
+            "amount": amount,
+            "timestamp": txn_time,
             "risk_score": float(risk_score),
             "verdict": status
-        })
-        print(f"✅ Transaction Saved to History: {status}")
+        }, False),
+        rollup_op(user_id, amount, txn_time)
+    ]
+
+def volume_blocked_response(user_type, past_spent, limit):
+    return {
+        "verdict": "BLOCKED",
+        "reason": f"VOLUME_VIOLATION: Exceeded {user_type} limit (₹{limit:,})",
+        "risk_score": 100.0,
+        "ui_color": "red",
+        "user_type": user_type,
+        "daily_spent": past_spent,
+        "daily_limit": limit
+    }
 
+def upi_verdict_response(status, reason, risk_score, user_type, past_spent, amount, limit):
     return {
         "verdict": status,
         "reason": reason,
         "risk_score": float(risk_score),
         "ui_color": "red" if status == "BLOCKED" else "green" if status == "APPROVED" else "orange",
         "user_type": user_type,
-        "daily_spent": past_spent + txn.amount if status != "BLOCKED" else past_spent,
+        "daily_spent": past_spent + amount if status != "BLOCKED" else past_spent,
         "daily_limit": limit
     }
 
+# Every saved payment is two docs (raw + rollup) plus at most one holds doc per user
+# (Firestore reservations), and a whole batch commits as one Firestore batch
+MAX_UPI_BATCH = FIRESTORE_BATCH_LIMIT // 3
+
+@app.post("/analyze-upi/batch")
+async def analyze_upi_batch(batch: UpiBatchRequest):
+    """
+    Scores a batch of UPI payments with the same rules as /analyze-upi.
+
+    Users are independent: their types are fetched concurrently and their
+    rows are scored side by side. A user's own rows are applied one after
+    another in timestamp order (ties keep request order), each seeing the
+    daily total and time gap left by the previous one, exactly as if they
+    had been sent to /analyze-upi in that order. Client timestamps only
+    set that order and must fall within the last 24h: every row is
+    checked, held and saved at server time, like a single payment. Each row goes through the
+    same per-user spend reservation as a single request, so a batch and
+    concurrent single payments can't overrun a limit together. Step k
+    scores every user's k-th row in one Sentinel pass; all writes go out as
+    one batch commit. Results come back in request order.
+    """
+    if not sentinel:
+        raise HTTPException(status_code=503, detail="UPI Model Loading...")
+    
+    if db is None:
+        raise HTTPException(status_code=503, detail="Database connection offline.")
+
+    txns = batch.transactions
+    if len(txns) > MAX_UPI_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_UPI_BATCH} transactions per batch.")
+
+    now = int(time.time())
+    for txn in txns:
+        # A future or stale timestamp would check the limit against the wrong 24h window
+        if txn.timestamp is not None and not now - 86400 < txn.timestamp <= now:
+            raise HTTPException(status_code=400, detail="timestamp must be within the last 24 hours and not in the future.")
+    by_user = {}
+    for i, txn in enumerate(txns):
+        by_user.setdefault(txn.user_id, []).append(i)
+    for rows in by_user.values():
+        rows.sort(key=lambda i: (txns[i].timestamp or now, i))
+
+    # STEP 1: Every user's type, concurrently
+    user_ids = list(by_user)
+    user_types = await asyncio.gather(*(run_io(fetch_user_type, user_id) for user_id in user_ids))
+    limits = {user_id: 1000000 if user_type == "business" else 50000 for user_id, user_type in zip(user_ids, user_types)}
+    user_types = dict(zip(user_ids, user_types))
+
+    results = [None] * len(txns)
+    ops, saved, held = [], [], []
+    try:
+        for step in range(max((len(rows) for rows in by_user.values()), default=0)):
+            # STEP 2: Check + hold this step's row for every user; a user's earlier
+            # rows are still held, so they count towards the total and the gap
+            step_rows = [by_user[user_id][step] for user_id in user_ids if step < len(by_user[user_id])]
+            reservations = await asyncio.gather(*(
+                run_io(spend_reservations.reserve, txns[i].user_id, txns[i].amount, limits[txns[i].user_id], now)
+                for i in step_rows
+            ))
+
+            scoring = []
+            for i, reservation in zip(step_rows, reservations):
+                txn = txns[i]
+                # RULE CHECK: Volume Trap (User-specific limit)
+                if not reservation.granted:
+                    ops.append(volume_alert_op(txn.user_id, txn.amount))
+                    results[i] = volume_blocked_response(user_types[txn.user_id], reservation.past_spent, limits[txn.user_id])
+                    continue
+                held.append(reservation)
+                time_gap = 3600  # Default 1 hour if no previous transactions
+                if reservation.last_txn_time:
+                    time_gap = max(0, reservation.txn_time - reservation.last_txn_time)
+                scoring.append((i, reservation, (txn.amount, time_gap, reservation.past_spent + txn.amount, limits[txn.user_id])))
+
+            if not scoring:
+                continue
+            # STEP 3: One Sentinel pass for this step's rows
+            decisions = await run_cpu(sentinel.predict_batch, [row for _, _, row in scoring])
+            for (i, reservation, _), (status, reason, risk_score) in zip(scoring, decisions):
+                txn = txns[i]
+                results[i] = upi_verdict_response(status, reason, risk_score, user_types[txn.user_id],
+                                                  reservation.past_spent, txn.amount, limits[txn.user_id])
+                if status == "APPROVED" or status == "FLAGGED":
+                    txn_ops = upi_transaction_ops(txn.user_id, txn.amount, reservation.txn_time, risk_score, status)
+                    ops.extend(txn_ops)
+                    saved.append((reservation, txn_ops[0][0].split('/')[-1]))
+                else:
+                    # Blocked by the model: stop holding it before the user's next row
+                    spend_reservations.release(reservation)
+
+        # STEP 4: One batched commit for the lot
+        def publish():
+            for reservation, doc_id in saved:
+                spend_windows.add(reservation.user_id, reservation.amount, reservation.txn_time, doc_id)
+        if ops:
+            await run_io(spend_reservations.commit, [reservation for reservation, _ in saved], ops, publish)
+    finally:
+        for reservation in held:
+            spend_reservations.release(reservation)
+    print(f"✅ UPI batch: {len(txns)} payments, {len(user_ids)} users, {len(saved)} saved.")
+
+    return {"results": [{"user_id": txn.user_id, **result} for txn, result in zip(txns, results)]}
@@ -1,53 +1,226 @@
-import pandas as pd
 import numpy as np
 import os
-import joblib
 import json
+import re
+import time
+import bisect
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from groq import Groq
 from dotenv import load_dotenv
 
 # Import shared utils
 try:
-    from ml_utils import SafeLabelEncoder, FEATURES_LGB, CAT_COLS, AE_FEATURES
+    from ml_utils import SafeLabelEncoder, FEATURES_LGB, CAT_COLS, AE_FEATURES, load_label_encoders
 except ImportError:
-    from backend.ml_utils import SafeLabelEncoder, FEATURES_LGB, CAT_COLS, AE_FEATURES
+    from backend.ml_utils import SafeLabelEncoder, FEATURES_LGB, CAT_COLS, AE_FEATURES, load_label_encoders
+
+try:
+    from local_reasoning import build_local_reasoning
+except ImportError:
+    from backend.local_reasoning import build_local_reasoning
+
+try:
+    from lgb_numpy import load_booster
+except ImportError:
+    from backend.lgb_numpy import load_booster
+
+try:
+    from behavior_ae import NumPyBehaviorAE, StackedAEProfiles, UserAEStore
+except ImportError:
+    from backend.behavior_ae import NumPyBehaviorAE, StackedAEProfiles, UserAEStore
 
 # Load API Key
 load_dotenv()
 groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
 
-class NumPyBehaviorAE:
-    """Lightweight Autoencoder using pure NumPy for inference."""
-    def __init__(self, weights):
-        self.enc_w = np.array(weights['enc_w']).T  # Transpose for np.dot (Input x Hidden) vs torch (Hidden x Input)
-        self.enc_b = np.array(weights['enc_b'])
-        self.dec_w = np.array(weights['dec_w']).T
-        self.dec_b = np.array(weights['dec_b'])
-        self.scaler_mean = np.array(weights['scaler_mean'])
-        self.scaler_scale = np.array(weights['scaler_scale'])
-
-    def predict(self, x):
-        # 1. Scale
-        scaled_x = (x - self.scaler_mean) / self.scaler_scale
-        
-        # 2. Encoder (Linear -> ReLU)
-        z = np.dot(scaled_x, self.enc_w) + self.enc_b
-        z = np.maximum(0, z) # ReLU
-        
-        # 3. Decoder (Linear)
-        recon = np.dot(z, self.dec_w) + self.dec_b
-        
-        return recon, scaled_x
-
-    def get_mse(self, x):
-        recon, scaled_x = self.predict(x)
-        return np.mean((scaled_x - recon)**2)
+# LightGBM inference engine: "auto" (native Booster, NumPy if lightgbm won't load),
+# "native" or "numpy" (compiled trees, no native dependency)
+LGB_ENGINE = os.getenv("LGB_ENGINE", "auto").lower()
+
+# Resident AE profiles (LRU); the rest stay in the memory-mapped bundle until used
+AE_CACHE_PROFILES = int(os.getenv("AE_CACHE_PROFILES", "100000"))
+
+# Groq calls are network-bound, so batch scoring fans them out over a small pool
+REASONING_WORKERS = int(os.getenv("REASONING_WORKERS", "8"))
+
+# Risk levels that escalate to a Groq explanation; all others get the local template.
+# e.g. "Low,High,Critical" restores LLM reasoning everywhere, "" turns it off.
+LLM_REASONING_LEVELS = {level.strip() for level in os.getenv("LLM_REASONING_LEVELS", "High,Critical").split(",") if level.strip()}
+
+# Reasoning cache (see ReasoningCache)
+REASONING_CACHE_SIZE = int(os.getenv("REASONING_CACHE_SIZE", "2048"))
+REASONING_CACHE_TTL = float(os.getenv("REASONING_CACHE_TTL", "3600"))
+REASONING_CACHE_PATH = os.getenv("REASONING_CACHE_PATH")  # unset = memory only
+
+# Bucket edges for the cache key. p_fraud edges follow the 0.3 / 0.7 / 0.85 decision
+# cut-offs; anomaly edges the 0.3 / 1.0 / 2.0 ones, then widen logarithmically.
+P_FRAUD_BUCKETS = [0.1, 0.2, 0.3, 0.5, 0.7, 0.85, 0.95]
+ANOMALY_BUCKETS = [0.1, 0.3, 0.6, 1.0, 2.0, 10.0, 100.0, 1e4, 1e6]
+
+# Per-transaction values the cached text refers to by placeholder; filled in on every use
+REASONING_PLACEHOLDERS = {
+    "{amount}": lambda tx: f"₹{tx.get('amount')}",
+    "{device}": lambda tx: str(tx.get('device_used'))
+}
+
+
+def bucket_range(edges, value, fmt):
+    """Text for the cache bucket `value` falls in, e.g. "70.0%-85.0%"."""
+    i = bisect.bisect_right(edges, value)
+    low = fmt(edges[i - 1]) if i > 0 else fmt(0)
+    return f"{low}-{fmt(edges[i])}" if i < len(edges) else f"above {low}"
+
+
+BRACED = re.compile(r"\{[^{}]*\}")
+
+
+def shareable_reasoning(text):
+    """
+    True if an LLM text can be cached for everyone in its key: it uses
+    every placeholder, has no other {braced} token (a renamed or translated
+    placeholder) and no ₹ figure of its own, so filling it in can't leave
+    one transaction's amount in another's explanation.
+    """
+    return set(BRACED.findall(text)) == set(REASONING_PLACEHOLDERS) and "₹" not in text
+
+
+def fill_reasoning(text, tx_dict):
+    for placeholder, value in REASONING_PLACEHOLDERS.items():
+        text = text.replace(placeholder, value(tx_dict))
+    return text
+
+
+class ReasoningCache:
+    """
+    Bounded LRU + TTL cache for Groq explanations.
+
+    Keyed on a quantized risk signature instead of the raw transaction, so
+    routine transactions that land in the same buckets share one LLM call.
+    The prompt is built from the key's fields only; the amount and device
+    come back as placeholders filled in per transaction, so a cached text
+    never names another user's payment. put() only takes texts that kept
+    their placeholders (see shareable_reasoning); the rest are served to
+    the one request that asked and not cached.
+    Entries are timestamped with wall-clock time so the optional JSON file
+    written by save() stays valid across restarts.
+    """
+    def __init__(self, max_size=2048, ttl=3600, path=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.entries = OrderedDict()  # key -> (created_at, text)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rejected = 0
+
+    @staticmethod
+    def make_key(tx_dict, p_fraud, recon_error, risk_level, language):
+        return "|".join([
+            "v2",  # v1 texts were written from per-user prompts: never reuse them
+            risk_level,
+            str(bisect.bisect_right(P_FRAUD_BUCKETS, float(p_fraud))),
+            str(bisect.bisect_right(ANOMALY_BUCKETS, float(recon_error))),
+            str(tx_dict.get('merchant_category')),
+            str(tx_dict.get('location')),
+            language or 'en'
+        ])
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if time.time() - entry[0] > self.ttl:
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, text):
+        """Caches `text` if it is shareable; returns whether it was."""
+        if not shareable_reasoning(text):
+            with self.lock:
+                self.rejected += 1
+            return False
+        with self.lock:
+            self.entries[key] = (time.time(), text)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            now = time.time()
+            with self.lock:
+                # Saved oldest-first, so replaying keeps the LRU order
+                for key, created_at, text in saved:
+                    if now - created_at <= self.ttl and shareable_reasoning(text):
+                        self.entries[key] = (created_at, text)
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+            print(f"✅ Reasoning cache restored: {len(self.entries)} entries.")
+        except Exception as e:
+            print(f"⚠️ Could not restore reasoning cache: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            with self.lock:
+                snapshot = [[key, created_at, text] for key, (created_at, text) in self.entries.items()]
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"⚠️ Could not persist reasoning cache: {e}")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "rejected": self.rejected,
+            "persistent": bool(self.path)
+        }
+
+def classify_risk(p_fraud, recon_error):
+    """Maps the two model scores onto (risk_level, is_blocked)."""
+    risk_level = "Low"
+    if p_fraud > 0.7 or recon_error > 1.0:
+        risk_level = "Critical"
+    elif p_fraud > 0.3 or recon_error > 0.3:
+        risk_level = "High"
+    return risk_level, bool(p_fraud > 0.85 or recon_error > 2.0)
 
 class HybridFraudModel:
     def __init__(self):
         self.lgb_model = None
-        self.user_aes = {}
+        self.user_aes = UserAEStore(StackedAEProfiles.from_weights({}), AE_CACHE_PROFILES)
         self.label_encoders = {}
+        self.reasoning_pool = ThreadPoolExecutor(max_workers=REASONING_WORKERS, thread_name_prefix="reasoning")
+        self.reasoning_cache = ReasoningCache(REASONING_CACHE_SIZE, REASONING_CACHE_TTL, REASONING_CACHE_PATH)
         self.data_dir = os.path.join(os.path.dirname(__file__), 'data')
         self.models_dir = os.path.join(os.path.dirname(__file__), 'models')
 
@@ -58,40 +231,38 @@ class HybridFraudModel:
             # 1. Load LightGBM
             lgb_path = os.path.join(self.models_dir, 'lgb_model.txt')
             if os.path.exists(lgb_path):
-                try:
-                    import lightgbm as lgb
-                    self.lgb_model = lgb.Booster(model_file=lgb_path)
-                    print("✅ LightGBM loaded.")
-                except  (ImportError, OSError) as ie:
-                    print(f"❌ LightGBM library missing or broken (libgomp?): {ie}")
-                    print("⚠️ proceeding with LightGBM DISABLED.")
-                    self.lgb_model = None
-                except Exception as e:
-                    print(f"❌ Error loading LightGBM model file: {e}")
-                    self.lgb_model = None
+                self.lgb_model = self.load_lgb_model(lgb_path)
             else:
                 print("⚠️ LightGBM model file not found.")
                 return False
 
-            # 2. Load Autoencoder Weights (JSON)
+            # 2. Load Autoencoder Weights (memory-mapped bundle, JSON as fallback)
+            ae_bundle_path = os.path.join(self.models_dir, 'ae_weights.bin')
             ae_path = os.path.join(self.models_dir, 'ae_weights.json')
-            if os.path.exists(ae_path):
+            profiles = None
+            if os.path.exists(ae_bundle_path):
+                try:
+                    profiles = StackedAEProfiles.load(ae_bundle_path)
+                    print(f"✅ Mapped {len(profiles)} Autoencoder profiles from {ae_bundle_path}.")
+                except Exception as e:
+                    print(f"⚠️ Could not open {ae_bundle_path} ({e}), falling back to JSON.")
+            if profiles is None and os.path.exists(ae_path):
                 with open(ae_path, 'r') as f:
                     weights_data = json.load(f)
-                
-                self.user_aes = {}
-                for user, weights in weights_data.items():
-                    self.user_aes[user] = NumPyBehaviorAE(weights)
-                print(f"✅ Loaded {len(self.user_aes)} Autoencoder profiles.")
-            else:
+
+                profiles = StackedAEProfiles.from_weights(weights_data)
+                print(f"✅ Loaded {len(profiles)} Autoencoder profiles ({profiles.nbytes()} bytes stacked).")
+            if profiles is None:
                 print("⚠️ Autoencoder weights not found.")
                 return False
+            # Only the active users' profiles are copied into memory, on first use
+            self.user_aes = UserAEStore(profiles, AE_CACHE_PROFILES)
 
             # 3. Load Label Encoders
             le_path = os.path.join(self.models_dir, 'label_encoders.joblib')
             if os.path.exists(le_path):
                 try:
-                    self.label_encoders = joblib.load(le_path)
+                    self.label_encoders = load_label_encoders(le_path)
                     print("✅ Label Encoders loaded.")
                 except Exception as e:
                     print(f"❌ Error loading Label Encoders (Class mismatch?): {e}")
@@ -106,6 +277,35 @@ class HybridFraudModel:
             print(f"❌ Error loading models: {e}")
             return False
 
+    def load_lgb_model(self, lgb_path):
+        """
+        LGB_ENGINE=auto (default) and native use the lightgbm Booster, which
+        is the faster of the two for the 1-10 row requests of the serving
+        path (see bench_lgb_numpy.py), and fall back to the pure-NumPy
+        compiled trees if the library won't load (e.g. libgomp missing).
+        The NumPy engine gives the same probabilities; LGB_ENGINE=numpy
+        forces it.
+        """
+        if LGB_ENGINE != 'numpy':
+            try:
+                import lightgbm as lgb
+                model = lgb.Booster(model_file=lgb_path)
+                print("✅ LightGBM loaded (native).")
+                return model
+            except (ImportError, OSError) as ie:
+                print(f"❌ LightGBM library missing or broken (libgomp?): {ie}")
+                print("⚠️ falling back to the NumPy tree engine.")
+            except Exception as e:
+                print(f"❌ Error loading LightGBM model file: {e}")
+                return None
+        try:
+            model = load_booster(lgb_path)
+            print(f"✅ LightGBM loaded (NumPy engine, {model.num_trees()} trees).")
+            return model
+        except Exception as e:
+            print(f"❌ Error compiling LightGBM model for NumPy: {e}")
+            return None
+
     def train_models(self):
         """Fallback to in-memory training (DEV ONLY)."""
         print("⚠️ Artifacts missing. Falling back to IN-MEMORY TRAINING (Slow!)...")
@@ -120,25 +320,33 @@ class HybridFraudModel:
 
     def generate_ai_reasoning(self, tx_dict, p_fraud, recon_error, risk_level, language='en'):
         """Uses Groq to generate a natural language explanation."""
+        cache_key = ReasoningCache.make_key(tx_dict, p_fraud, recon_error, risk_level, language)
+        cached = self.reasoning_cache.get(cache_key)
+        if cached is not None:
+            return fill_reasoning(cached, tx_dict)
+
         try:
+            # Only what the cache key holds goes in, since the answer is shared by everyone with that key
+            p_range = bucket_range(P_FRAUD_BUCKETS, float(p_fraud), lambda v: f"{v * 100:.0f}%")
+            anomaly_range = bucket_range(ANOMALY_BUCKETS, float(recon_error), lambda v: f"{v:g}")
             prompt = f"""
             As a Financial Fraud Expert, provide a human-understandable explanation for this transaction analysis:
             
             TRANSACTION DATA:
-            - User: {tx_dict.get('user_id', 'Unknown')}
-            - Amount: ₹{tx_dict.get('amount')}
+            - Amount: {{amount}}
             - Location: {tx_dict.get('location')}
             - Category: {tx_dict.get('merchant_category')}
-            - Device: {tx_dict.get('device_used')}
+            - Device: {{device}}
             
             ANALYTICS:
             - Risk Level: {risk_level}
-            - Fraud Probability (LightGBM): {p_fraud*100:.1f}%
-            - Behavioral Anomaly Score (Autoencoder): {recon_error:.4f}
+            - Fraud Probability (LightGBM): {p_range}
+            - Behavioral Anomaly Score (Autoencoder): {anomaly_range}
             
             INSTRUCTIONS:
             Provide exactly 2-3 bullet points explaining why this was flagged as {risk_level} risk. 
-            - Mention specific behaviors (e.g., "The amount is significantly higher than the user's daily ₹400 average").
+            - Refer to the amount as {{amount}} and the device as {{device}}, written exactly like that, braces included.
+            - Describe the pattern, not a specific person or account.
             - Mention location or device anomalies if the scores are high.
             - Keep it simple and direct. Use "-" for bullets.
             - IMPORTANT: Do NOT use any Markdown formatting like **bold** or __italic__. Use plain text only.
@@ -157,55 +365,127 @@ class HybridFraudModel:
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=250
             )
-            return completion.choices[0].message.content.strip()
+            reasoning = completion.choices[0].message.content.strip()
+            # Only real LLM answers that kept their placeholders are cached, never the fallback below
+            self.reasoning_cache.put(cache_key, reasoning)
+            return fill_reasoning(reasoning, tx_dict)
         except Exception as e:
             print(f"Groq Error: {e}")
             return "Analysis based on hybrid matching of general fraud signatures and personal behavioral deviations."
 
-    def predict(self, tx_dict, user_id, language='en'):
+    def uses_llm_reasoning(self, risk_level):
+        return risk_level in LLM_REASONING_LEVELS
+
+    def local_reasoning(self, tx_dict, user_id, p_fraud, recon_error, language='en'):
+        """Deterministic explanation, no network. Uses the user's AE amount mean when known."""
+        amount_mean = None
+        ae = self.user_aes.get(user_id)
+        if ae is not None:
+            amount_mean = float(ae.scaler_mean[AE_FEATURES.index('amount')])
+        return build_local_reasoning(tx_dict, p_fraud, recon_error, amount_mean, language)
+
+    def lgb_matrix(self, tx_dicts):
+        """FEATURES_LGB matrix for LightGBM, categoricals encoded column by column (no DataFrame)."""
+        X = np.empty((len(tx_dicts), len(FEATURES_LGB)), dtype=np.float64)
+        for j, col in enumerate(FEATURES_LGB):
+            values = [tx.get(col) for tx in tx_dicts]
+            if col in CAT_COLS and col in self.label_encoders:
+                X[:, j] = self.label_encoders[col].transform(values)
+            else:
+                X[:, j] = np.array(values, dtype=np.float64)
+        return X
+
+    def ae_matrix(self, tx_dicts):
+        return np.array([[tx.get(col) for col in AE_FEATURES] for tx in tx_dicts], dtype=np.float64)
+
+    def predict(self, tx_dict, user_id, language='en', include_reasoning=True):
         if not self.lgb_model:
             # Fallback for LGBM disabled
             p_fraud = 0.0 # Default if model broken
         else:
-            test_df = pd.DataFrame([tx_dict])
-            lgb_input = test_df[FEATURES_LGB].copy()
-            for col in CAT_COLS:
-                if col in self.label_encoders:
-                    sle = self.label_encoders[col]
-                    lgb_input[col] = sle.transform(lgb_input[col])
-            
             try:
-                p_fraud = self.lgb_model.predict(lgb_input)[0]
+                p_fraud = self.lgb_model.predict(self.lgb_matrix([tx_dict]))[0]
             except Exception as e:
                 print(f"LGBM Prediction Error: {e}")
                 p_fraud = 0.0
 
         # AE Logic (NumPy)
-        test_df = pd.DataFrame([tx_dict])
-        if user_id in self.user_aes:
-            ae = self.user_aes[user_id]
-            ae_input = test_df[AE_FEATURES].values
-            recon_error = ae.get_mse(ae_input)
-        else:
-            recon_error = 0.0
+        recon_error = self.user_aes.mse(self.ae_matrix([tx_dict]), [user_id])[0]
 
         # Risk Level
-        risk_level = "Low"
-        if p_fraud > 0.7 or recon_error > 1.0:
-            risk_level = "Critical"
-        elif p_fraud > 0.3 or recon_error > 0.3:
-            risk_level = "High"
+        risk_level, is_blocked = classify_risk(p_fraud, recon_error)
 
-        reasoning = self.generate_ai_reasoning(tx_dict, p_fraud, recon_error, risk_level, language)
+        # Local template unless the risk level escalates to the LLM.
+        # Deferred mode leaves LLM reasoning empty; the caller schedules it separately.
+        reasoning = None
+        if not self.uses_llm_reasoning(risk_level):
+            reasoning = self.local_reasoning(tx_dict, user_id, p_fraud, recon_error, language)
+        elif include_reasoning:
+            reasoning = self.generate_ai_reasoning(tx_dict, p_fraud, recon_error, risk_level, language)
 
         return {
             "fraud_probability": float(p_fraud),
             "anomaly_score": float(recon_error),
-            "is_blocked": bool(p_fraud > 0.85 or recon_error > 2.0),
+            "is_blocked": is_blocked,
             "risk_level": risk_level,
             "reasoning": reasoning
         }
 
+    def predict_batch(self, tx_dicts, user_ids, languages=None, include_reasoning=True):
+        """
+        Scores a micro-batch of transactions.
+        LightGBM runs once over the whole encoded matrix and the stacked
+        autoencoders score every row, whatever its user, in one pass.
+        Per-row results are identical to calling predict() row by row.
+        """
+        n = len(tx_dicts)
+        if n == 0:
+            return []
+        if languages is None:
+            languages = ['en'] * n
+
+        # LightGBM: encode every categorical column in one pass, predict once
+        p_fraud = np.zeros(n)
+        if self.lgb_model:
+            try:
+                p_fraud = np.asarray(self.lgb_model.predict(self.lgb_matrix(tx_dicts)), dtype=np.float64)
+            except Exception as e:
+                print(f"LGBM Batch Prediction Error: {e}")
+                p_fraud = np.zeros(n)
+
+        # AE: every user's profile in one gather + vector pass over the stacked weights
+        recon_errors = self.user_aes.mse(self.ae_matrix(tx_dicts), user_ids)
+
+        levels = [classify_risk(p_fraud[i], recon_errors[i]) for i in range(n)]
+
+        reasonings = [None] * n
+        llm_rows = []
+        for i in range(n):
+            if self.uses_llm_reasoning(levels[i][0]):
+                llm_rows.append(i)
+            else:
+                reasonings[i] = self.local_reasoning(tx_dicts[i], user_ids[i], p_fraud[i], recon_errors[i], languages[i])
+
+        # LLM reasoning is I/O bound (Groq), fan it out instead of waiting row by row
+        if include_reasoning and llm_rows:
+            llm_text = self.reasoning_pool.map(
+                lambda i: self.generate_ai_reasoning(tx_dicts[i], p_fraud[i], recon_errors[i], levels[i][0], languages[i]),
+                llm_rows
+            )
+            for i, text in zip(llm_rows, llm_text):
+                reasonings[i] = text
+
+        return [
+            {
+                "fraud_probability": float(p_fraud[i]),
+                "anomaly_score": float(recon_errors[i]),
+                "is_blocked": levels[i][1],
+                "risk_level": levels[i][0],
+                "reasoning": reasonings[i]
+            }
+            for i in range(n)
+        ]
+
 # Singleton instance
 hybrid_model = HybridFraudModel()
 
@@ -1,4 +1,5 @@
 import numpy as np
+import pandas as pd
 from sklearn.preprocessing import LabelEncoder
 
 # Constants
@@ -24,3 +25,49 @@ class SafeLabelEncoder:
         # For simplicity, we'll map to the first class if unknown
         safe_series = series.astype(str).apply(lambda x: x if x in self.classes_ else list(self.classes_)[0])
         return self.le.transform(safe_series)
+
+
+class CompiledLabelEncoder:
+    """
+    Inference-time replacement for SafeLabelEncoder.
+
+    Holds the fitted vocabulary twice: a str -> code dict for single values
+    and a sorted NumPy string array (the same order LabelEncoder uses, so
+    codes match what LightGBM was trained on) for whole columns. A column
+    is hashed once to find its distinct values, those few are looked up in
+    the vocabulary with one searchsorted, and the codes are scattered back.
+    Unseen values always get `unknown_code` (0, the first class in sorted
+    order) instead of whichever class a set happened to yield first.
+    """
+    def __init__(self, classes, unknown_code=0):
+        self.classes_ = np.array(sorted({str(c) for c in classes}))
+        self.codes = {c: i for i, c in enumerate(self.classes_.tolist())}
+        self.unknown_code = unknown_code
+
+    @classmethod
+    def from_label_encoder(cls, encoder):
+        """Builds from a fitted SafeLabelEncoder (or a plain sklearn LabelEncoder)."""
+        le = getattr(encoder, 'le', encoder)
+        return cls(le.classes_)
+
+    def encode(self, value):
+        return self.codes.get(str(value), self.unknown_code)
+
+    def lookup(self, strings):
+        """Codes for an array of str values."""
+        if len(self.classes_) == 0:
+            return np.full(len(strings), self.unknown_code, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.classes_, strings), len(self.classes_) - 1)
+        return np.where(self.classes_[pos] == strings, pos, self.unknown_code).astype(np.int64)
+
+    def transform(self, values):
+        inverse, uniques = pd.factorize(np.asarray(values, dtype=object), use_na_sentinel=False)
+        return self.lookup(np.asarray(uniques).astype(str))[inverse]
+
+
+def load_label_encoders(path):
+    """Loads label_encoders.joblib (old SafeLabelEncoder or compiled) as CompiledLabelEncoders."""
+    import joblib
+    encoders = joblib.load(path)
+    return {col: enc if isinstance(enc, CompiledLabelEncoder) else CompiledLabelEncoder.from_label_encoder(enc)
+            for col, enc in encoders.items()}
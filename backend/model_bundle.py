@@ -0,0 +1,136 @@
+"""
+Binary model bundles: a small JSON header followed by raw, aligned arrays.
+
+Layout (all integers little-endian):
+
+    8 bytes   magic  b"FRDBNDL1"
+    8 bytes   header length (uint64)
+    header    JSON {"version", "kind", "meta", "arrays": {name: {dtype, shape, offset}}}
+    padding   to a 64-byte boundary, then each array's raw bytes (C order),
+              each starting on a 64-byte boundary at its `offset`
+
+open_bundle() maps the file read-only with np.memmap and hands out array
+views into it, so nothing is parsed or copied at startup. Pages are read
+on first touch and shared through the OS page cache by every process
+(e.g. uvicorn workers) that opens the same file.
+
+Convert existing JSON weights:
+
+    python model_bundle.py ae  models/ae_weights.json  models/ae_weights.bin
+    python model_bundle.py upi models/upi_weights.json models/upi_weights.bin
+"""
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+MAGIC = b"FRDBNDL1"
+VERSION = 1
+ALIGN = 64
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def write_bundle(path, kind, arrays, meta=None):
+    """Writes {name: ndarray} atomically (tmp file + rename)."""
+    arrays = {name: np.ascontiguousarray(a) for name, a in arrays.items()}
+    entries, offset = {}, 0
+    for name, a in arrays.items():
+        entries[name] = {"dtype": a.dtype.str, "shape": list(a.shape), "offset": offset}
+        offset = _align(offset + a.nbytes)
+    header = json.dumps({"version": VERSION, "kind": kind, "meta": meta or {}, "arrays": entries}).encode('utf-8')
+    data_start = _align(len(MAGIC) + 8 + len(header))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for name, a in arrays.items():
+            f.write(b"\0" * (data_start + entries[name]["offset"] - f.tell()))
+            f.write(a.tobytes())
+    os.replace(tmp_path, path)
+    return path
+
+
+class Bundle:
+    """Read-only view of a bundle file; `arrays` are views into one shared memmap."""
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a model bundle")
+            (header_len,) = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(header_len).decode('utf-8'))
+        if header.get("version") != VERSION:
+            raise ValueError(f"{path}: unsupported bundle version {header.get('version')}")
+        self.kind = header["kind"]
+        self.meta = header.get("meta", {})
+        data_start = _align(len(MAGIC) + 8 + header_len)
+
+        self.arrays = {}
+        if os.path.getsize(path) > data_start:
+            raw = np.memmap(path, dtype=np.uint8, mode='r')
+        for name, entry in header["arrays"].items():
+            dtype = np.dtype(entry["dtype"])
+            shape = tuple(entry["shape"])
+            nbytes = dtype.itemsize * int(np.prod(shape, dtype=np.int64))
+            start = data_start + entry["offset"]
+            if nbytes == 0:
+                self.arrays[name] = np.empty(shape, dtype=dtype)
+            else:
+                self.arrays[name] = raw[start:start + nbytes].view(dtype).reshape(shape)
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+
+def open_bundle(path, kind=None):
+    bundle = Bundle(path)
+    if kind is not None and bundle.kind != kind:
+        raise ValueError(f"{path} holds '{bundle.kind}', expected '{kind}'")
+    return bundle
+
+
+# --- exporters for the two weight files ---
+
+def export_ae_weights(weights_data, path):
+    """ae_weights.json layout -> bundle (see behavior_ae.StackedAEProfiles for the tensors)."""
+    try:
+        from behavior_ae import StackedAEProfiles
+    except ImportError:
+        from backend.behavior_ae import StackedAEProfiles
+    return StackedAEProfiles.from_weights(weights_data).save(path)
+
+
+def export_upi_weights(weights_data, path):
+    """upi_weights.json layout -> bundle with one w/b pair per Dense layer, in order."""
+    layers = weights_data.get("all_layers") or (weights_data.get("encoder_layers", []) + weights_data.get("decoder_layers", []))
+    arrays = {}
+    for i, layer in enumerate(layers):
+        w = np.array(layer["w"], dtype=np.float64)
+        b = np.array(layer["b"], dtype=np.float64)
+        # Keras weights are float32; keep float64 if a file ever holds something wider
+        if np.array_equal(w.astype(np.float32), w) and np.array_equal(b.astype(np.float32), b):
+            w, b = w.astype(np.float32), b.astype(np.float32)
+        arrays[f"layer{i}_w"] = w
+        arrays[f"layer{i}_b"] = b
+    meta = {"layers": [{"name": layer.get("name"), "activation": layer["activation"]} for layer in layers]}
+    return write_bundle(path, "upi_vae", arrays, meta)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] not in ("ae", "upi"):
+        print("usage: python model_bundle.py {ae|upi} <weights.json> <out.bin>")
+        sys.exit(1)
+    with open(sys.argv[2], 'r') as f:
+        weights_data = json.load(f)
+    if sys.argv[1] == "ae":
+        export_ae_weights(weights_data, sys.argv[3])
+    else:
+        export_upi_weights(weights_data, sys.argv[3])
+    print(f"✅ Wrote {sys.argv[3]}")
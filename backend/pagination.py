@@ -0,0 +1,65 @@
+"""
+Keyset pagination for newest-first Firestore listings.
+
+Pages are ordered by (timestamp, document id) descending and the next page
+starts after the last row of the previous one, so every page costs the
+same reads however deep into the history it is. The cursor handed to
+clients is that (timestamp, id) pair as url-safe base64 JSON; they should
+treat it as opaque.
+"""
+
+import base64
+import json
+
+from firebase_admin import firestore
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(timestamp, doc_id):
+    raw = json.dumps([timestamp, doc_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(timestamp, doc_id); raises ValueError for anything that isn't one of ours."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, doc_id = json.loads(raw.decode('utf-8'))
+    except Exception:
+        raise ValueError("invalid cursor")
+    if not isinstance(doc_id, str) or not isinstance(timestamp, (int, float, str)):
+        raise ValueError("invalid cursor")
+    return timestamp, doc_id
+
+
+def page_size(limit, default=DEFAULT_PAGE_SIZE):
+    return default if limit is None else max(1, min(int(limit), MAX_PAGE_SIZE))
+
+
+def fetch_page(query, limit, cursor=None, since=None, until=None, fields=None):
+    """
+    One page of `query`, newest first: (docs, next_cursor or None).
+    since/until filter `timestamp` (since < timestamp <= until) in the query
+    itself; `fields` projects the read (timestamp is always included).
+    """
+    if since is not None:
+        query = query.where('timestamp', '>', since)
+    if until is not None:
+        query = query.where('timestamp', '<=', until)
+    if fields:
+        query = query.select(sorted(set(fields) | {'timestamp'}))
+    query = query.order_by('timestamp', direction=firestore.Query.DESCENDING)\
+        .order_by('__name__', direction=firestore.Query.DESCENDING)
+    if cursor:
+        timestamp, doc_id = decode_cursor(cursor)
+        query = query.start_after({'timestamp': timestamp, '__name__': doc_id})
+
+    # One extra row tells us whether there is a next page without another round trip
+    docs = list(query.limit(limit + 1).stream())
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    last = docs[-1]
+    return docs, encode_cursor(last.to_dict().get('timestamp'), last.id)
@@ -0,0 +1,66 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+
+class ReasoningJobs:
+    """
+    Tracks Groq explanations that are generated after the verdict was returned.
+
+    Each job is keyed by the transaction id (the `reasoning_id` handed to the
+    client) and runs on the shared reasoning thread pool. `on_ready` is called
+    from the worker thread once the text exists, which is where the persisted
+    transaction gets updated. Only the most recent `max_jobs` are kept; older
+    ones are still readable from Firestore.
+    """
+    def __init__(self, executor, max_jobs=10000):
+        self.executor = executor
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.on_ready = None
+
+    def submit(self, tx_id, user_id, fn, *args):
+        future = self.executor.submit(fn, *args)
+        with self.lock:
+            self.jobs[tx_id] = {"user_id": user_id, "future": future, "submitted": time.time()}
+            while len(self.jobs) > self.max_jobs:
+                self.jobs.popitem(last=False)
+        future.add_done_callback(lambda f: self._finished(tx_id, user_id, f))
+        return tx_id
+
+    def _finished(self, tx_id, user_id, future):
+        try:
+            reasoning = future.result()
+        except Exception as e:
+            print(f"⚠️ Reasoning job {tx_id} failed: {e}")
+            return
+        if self.on_ready is not None:
+            try:
+                self.on_ready(tx_id, user_id, reasoning)
+            except Exception as e:
+                print(f"⚠️ Could not persist reasoning for {tx_id}: {e}")
+
+    def get(self, tx_id):
+        with self.lock:
+            return self.jobs.get(tx_id)
+
+    def status(self, tx_id):
+        """{"status": "pending"|"ready"|"error", ...} for a tracked job, None if unknown."""
+        job = self.get(tx_id)
+        if job is None:
+            return None
+        future = job["future"]
+        if not future.done():
+            return {"reasoning_id": tx_id, "status": "pending", "reasoning": None}
+        if future.exception() is not None:
+            return {"reasoning_id": tx_id, "status": "error", "reasoning": None}
+        return {"reasoning_id": tx_id, "status": "ready", "reasoning": future.result()}
+
+    async def wait(self, tx_id, timeout):
+        """Awaits a job without blocking the event loop. Raises asyncio.TimeoutError."""
+        job = self.get(tx_id)
+        # shield: a client giving up on the stream must not cancel the job itself
+        await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job["future"])), timeout=timeout)
+        return self.status(tx_id)
@@ -1,38 +1,182 @@
-import pandas as pd
+import math
+import os
+import threading
+
 import numpy as np
 import joblib
-from scipy import stats
-import os
 
 import json
 # Removed TensorFlow imports to make it lightweight
 TF_AVAILABLE = False
 
+# Confidence points around a decision threshold where float32 scores get re-checked in float64.
+# float32 drift is ~1e-5 points, so this is wide enough to never let a decision flip.
+THRESHOLD_GUARD = 1e-3
+
 class NumPyVAE:
-    """Lightweight VAE Inference using pure NumPy."""
-    def __init__(self, weights_path):
-        with open(weights_path, 'r') as f:
-            weights_data = json.load(f)
-        self.layers = weights_data.get("all_layers", [])
-        if not self.layers:
-            # Handle split mode if it was preserved that way
-            enc = weights_data.get("encoder_layers", [])
-            dec = weights_data.get("decoder_layers", [])
-            self.layers = enc + dec
+    """
+    Lightweight VAE Inference using pure NumPy.
 
-    def predict(self, x):
-        out = x
-        for layer in self.layers:
-            w = np.array(layer["w"])
-            b = np.array(layer["b"])
+    The dense layers are compiled once at load into contiguous `dtype`
+    arrays (float32 by default; the Keras weights are float32 anyway), and
+    fold_scaler() pre-multiplies the MinMaxScaler into the first layer so
+    predict_raw() / reconstruction_error() take unscaled features. All
+    entry points accept one row (1-D) or a batch (N x features).
+    """
+    def __init__(self, weights_path, dtype=np.float32):
+        # Memory-mapped bundle next to the JSON (see model_bundle.py) wins when present
+        bundle_path = os.path.splitext(weights_path)[0] + ".bin"
+        self.layers = None
+        if os.path.exists(bundle_path):
+            try:
+                self.layers = self.load_bundle(bundle_path)
+            except Exception as e:
+                print(f"⚠️ Could not open {bundle_path} ({e}), falling back to JSON.")
+
+        if self.layers is None:
+            with open(weights_path, 'r') as f:
+                weights_data = json.load(f)
+            self.layers = weights_data.get("all_layers", [])
+            if not self.layers:
+                # Handle split mode if it was preserved that way
+                enc = weights_data.get("encoder_layers", [])
+                dec = weights_data.get("decoder_layers", [])
+                self.layers = enc + dec
+
+        self.dtype = np.dtype(dtype)
+        self.weights = [np.ascontiguousarray(np.asarray(layer["w"], dtype=np.float64), dtype=self.dtype) for layer in self.layers]
+        self.biases = [np.ascontiguousarray(np.asarray(layer["b"], dtype=np.float64), dtype=self.dtype) for layer in self.layers]
+        self.activations = [layer["activation"] for layer in self.layers]
+        self.input_scale = None
+        self.input_min = None
+        self.raw_w = None
+        self.raw_b = None
+        self._row_plan = None
+        self._local = threading.local()
+
+    @staticmethod
+    def load_bundle(path):
+        try:
+            from model_bundle import open_bundle
+        except ImportError:
+            from backend.model_bundle import open_bundle
+        bundle = open_bundle(path, kind="upi_vae")
+        return [{"name": layer["name"], "activation": layer["activation"],
+                 "w": bundle[f"layer{i}_w"], "b": bundle[f"layer{i}_b"]}
+                for i, layer in enumerate(bundle.meta["layers"])]
+
+    def fold_scaler(self, scale, min_):
+        """
+        MinMaxScaler.transform is x * scale + min, so the first layer on
+        scaled input equals x @ (scale[:, None] * W) + (min @ W + b) on raw
+        input. Folded in float64, then stored in the engine dtype.
+        """
+        scale = np.asarray(scale, dtype=np.float64)
+        min_ = np.asarray(min_, dtype=np.float64)
+        w0 = np.asarray(self.layers[0]["w"], dtype=np.float64)
+        b0 = np.asarray(self.layers[0]["b"], dtype=np.float64)
+        self.raw_w = np.ascontiguousarray(scale[:, None] * w0, dtype=self.dtype)
+        self.raw_b = np.ascontiguousarray(min_ @ w0 + b0, dtype=self.dtype)
+        self.input_scale = scale.astype(self.dtype)
+        self.input_min = min_.astype(self.dtype)
+        self._compile_row_plan()
+
+    def _forward(self, out, first_w, first_b):
+        for i, activation in enumerate(self.activations):
+            w, b = (first_w, first_b) if i == 0 else (self.weights[i], self.biases[i])
             out = np.dot(out, w) + b
-            if layer["activation"] == "relu":
+            if activation == "relu":
                 out = np.maximum(0, out)
-            elif layer["activation"] == "sigmoid":
+            elif activation == "sigmoid":
                 out = 1 / (1 + np.exp(-out))
         return out
 
-# --- 2. THE ROBUST SENTINEL CLASS ---
+    def predict(self, x):
+        """Reconstruction of already-scaled features."""
+        return self._forward(np.asarray(x, dtype=self.dtype), self.weights[0], self.biases[0])
+
+    def predict_raw(self, x):
+        """(scaled features, reconstruction) for raw features; needs fold_scaler()."""
+        x = np.asarray(x, dtype=self.dtype)
+        return x * self.input_scale + self.input_min, self._forward(x, self.raw_w, self.raw_b)
+
+    def reconstruction_error(self, x):
+        """Mean squared reconstruction error of raw features, per row for a batch."""
+        scaled, recon = self.predict_raw(x)
+        return np.mean((scaled - recon) ** 2, axis=-1)
+
+    def reconstruction_error_row(self, values):
+        """
+        reconstruction_error() for one row of raw features (a sequence), in
+        about a dozen ufunc calls on per-thread preallocated buffers:
+        - every buffer carries a trailing 1 so the bias is the weight's last row
+        - a final sigmoid is computed as tanh(z / 2) (the 1/2 is folded into
+          the weights), so the error is taken on 2 * scaled - 1 vs the tanh
+          output and divided by 4
+        """
+        plan = self._row_plan
+        buffers = getattr(self._local, 'row_buffers', None)
+        if buffers is None:
+            buffers = self._local.row_buffers = self._make_row_buffers()
+        x, target, outs = buffers
+        n = len(target)
+        x[:n] = values
+
+        out = x
+        for (w, activation), h in zip(plan["layers"], outs):
+            np.dot(out, w, out=h[1])
+            if activation == "relu":
+                np.maximum(h[1], 0, out=h[1])
+            elif activation == "tanh":
+                np.tanh(h[1], out=h[1])
+            elif activation == "sigmoid":
+                np.negative(h[1], out=h[1])
+                np.exp(h[1], out=h[1])
+                np.add(h[1], 1, out=h[1])
+                np.reciprocal(h[1], out=h[1])
+            out = h[0]
+
+        np.multiply(x[:n], plan["target_scale"], out=target)
+        np.add(target, plan["target_min"], out=target)
+        np.subtract(target, out, out=target)
+        return float(np.dot(target, target)) * plan["error_scale"]
+
+    def _compile_row_plan(self):
+        layers = []
+        for i, activation in enumerate(self.activations):
+            w, b = (self.raw_w, self.raw_b) if i == 0 else (self.weights[i], self.biases[i])
+            w_aug = np.vstack([w.astype(np.float64), b.astype(np.float64)[None, :]])
+            if activation == "sigmoid" and i == len(self.activations) - 1:
+                w_aug, activation = w_aug * 0.5, "tanh"
+            layers.append((np.ascontiguousarray(w_aug, dtype=self.dtype), activation))
+
+        scale = self.input_scale.astype(np.float64)
+        min_ = self.input_min.astype(np.float64)
+        if layers[-1][1] == "tanh":
+            # sigmoid(z) = (tanh(z / 2) + 1) / 2, so compare tanh against 2 * scaled - 1
+            scale, min_, error_scale = 2 * scale, 2 * min_ - 1, 0.25
+        else:
+            error_scale = 1.0
+        self._row_plan = {
+            "layers": layers,
+            "target_scale": scale.astype(self.dtype),
+            "target_min": min_.astype(self.dtype),
+            "error_scale": error_scale / len(scale),
+        }
+
+    def _make_row_buffers(self):
+        n = len(self.input_scale)
+        x = np.ones(n + 1, dtype=self.dtype)
+        outs = []
+        for w, activation in self._row_plan["layers"]:
+            h = np.ones(w.shape[1] + 1, dtype=self.dtype)
+            outs.append((h, h[:-1]))  # (input to the next layer with its trailing 1, this layer's output)
+        # the last layer feeds the error, not another layer
+        last = outs[-1][1]
+        outs[-1] = (last, last)
+        return x, np.empty(n, dtype=self.dtype), outs
+
+
 class FraudSentinel:
     def __init__(self, weights_path, scaler_path):
         """Initializes the Hybrid Fraud Engine with NumPy."""
@@ -47,6 +191,8 @@ class FraudSentinel:
                  weights_path = os.path.join(base, "upi_weights.json")
 
             self.model = NumPyVAE(weights_path)
+            # float64 copy, only used to settle scores that land next to a decision threshold
+            self.exact_model = NumPyVAE(weights_path, dtype=np.float64)
             print("✅ Sentinel VAE (NumPy) loaded.")
         except Exception as e:
             print(f"❌ Error loading VAE weights: {e}")
@@ -56,6 +202,10 @@ class FraudSentinel:
         # 2. Load the Scaler
         try:
             self.scaler = joblib.load(scaler_path)
+            # MinMaxScaler.transform is x * scale_ + min_; keep just the arrays
+            self.scale = np.asarray(self.scaler.scale_, dtype=np.float64)
+            self.min = np.asarray(self.scaler.min_, dtype=np.float64)
+            self.model.fold_scaler(self.scale, self.min)
         except Exception as e:
             print(f"❌ Error loading Sentinel Scaler: {e}")
             self.disabled = True
@@ -76,9 +226,38 @@ class FraudSentinel:
             # Fallback if TF is missing
             return "APPROVED", "Sentinel Offline (Lightweight Mode)", 0.0
 
-        # Determine if this is a business user (higher limit = business)
-        is_business = user_limit >= 500000
-        
+        velocity = self._velocity_trap(time_gap)
+        if velocity is not None:
+            return velocity
+
+        features = self._features(amount, time_gap, daily_total, user_limit)
+        # Inference: float32 VAE with the scaler folded into its first layer
+        mse = self.model.reconstruction_error_row(features)
+        return self._decide(features, mse, user_limit)
+
+    def predict_batch(self, rows):
+        """
+        predict() for many transactions at once: rows are (amount, time_gap,
+        daily_total, user_limit) and every row that reaches the VAE goes
+        through it in a single batched pass. Decisions match predict().
+        """
+        if getattr(self, 'disabled', False):
+            return [("APPROVED", "Sentinel Offline (Lightweight Mode)", 0.0)] * len(rows)
+
+        results = [None] * len(rows)
+        pending = []
+        for i, (amount, time_gap, daily_total, user_limit) in enumerate(rows):
+            results[i] = self._velocity_trap(time_gap)
+            if results[i] is None:
+                pending.append((i, self._features(amount, time_gap, daily_total, user_limit)))
+        if pending:
+            mses = self.model.reconstruction_error(np.array([f for _, f in pending], dtype=np.float64))
+            for (i, features), mse in zip(pending, mses.tolist()):
+                results[i] = self._decide(features, mse, rows[i][3])
+        return results
+
+    @staticmethod
+    def _velocity_trap(time_gap):
         # Check if this is likely a first transaction (time_gap >= 3600 means no recent history)
         is_first_transaction = time_gap >= 3600
 
@@ -87,7 +266,10 @@ class FraudSentinel:
         # Skip for first transactions (no history = can't judge velocity)
         if not is_first_transaction and 2 < time_gap < 15:
             return "BLOCKED", f"VELOCITY_VIOLATION: Speed limit breached ({time_gap}s gap)", 100.0
+        return None
 
+    @staticmethod
+    def _features(amount, time_gap, daily_total, user_limit):
         # --- LAYER 2: VAE BRAIN (Context-Aware) ---
         # Normalize amount and daily_total relative to user's limit
         # This makes ₹400k normal for a business user (40% of limit)
@@ -96,41 +278,48 @@ class FraudSentinel:
         normalized_daily = (daily_total / user_limit) * 50000
         
         # Feature Engineering with normalized values
-        log_vel = np.log1p(normalized_amount / (time_gap + 1))
-        features = pd.DataFrame([[normalized_amount, time_gap, log_vel, normalized_amount, normalized_daily]], 
-                                columns=['amount_inr', 'time_since_last_txn', 'log_velocity', 'amt_1h', 'amt_24h'])
-        
-        # Inference
-        scaled_input = self.scaler.transform(features)
-        
-        # RECONSTRUCTION LOGIC (NumPy)
-        reconstruction = self.model.predict(scaled_input[0])
-        # Reshape to match scaled_input for MSE calc
-        reconstruction = reconstruction.reshape(1, -1)
-        
-        # Calculate Error
-        mse = np.mean(np.power(scaled_input - reconstruction, 2))
-        
+        # ['amount_inr', 'time_since_last_txn', 'log_velocity', 'amt_1h', 'amt_24h']
+        log_vel = math.log1p(normalized_amount / (time_gap + 1))
+        return (normalized_amount, time_gap, log_vel, normalized_amount, normalized_daily)
+
+    def _decide(self, features, mse, user_limit):
+        # Determine if this is a business user (higher limit = business)
+        is_business = user_limit >= 500000
+
         # Calculate Risk Probability with adjusted thresholds
         # Use more relaxed thresholds for business users
         error_mean = self.ERROR_MEAN
         error_std = self.ERROR_STD * (2.0 if is_business else 1.0)  # Business gets 2x tolerance
-        
-        z_score = (mse - error_mean) / error_std
-        # Cap z-score to prevent extreme confidence values
-        z_score = min(z_score, 4.0)  # Cap at 4 standard deviations
-        
-        confidence = stats.norm.cdf(z_score) * 100
-        confidence = min(99.99, max(0.01, confidence))
 
         # Final Decision with user-type aware thresholds
         # Business users have higher thresholds before blocking
         block_threshold = 99.95 if is_business else 99.9
         flag_threshold = 98 if is_business else 95
-        
+
+        confidence = self.confidence(mse, error_mean, error_std)
+        if min(abs(confidence - block_threshold), abs(confidence - flag_threshold)) < THRESHOLD_GUARD:
+            # Too close to call in float32: redo it the float64 way so the decision can't flip
+            confidence = self.confidence(self.exact_mse(features), error_mean, error_std)
+
         if confidence > block_threshold:
             return "BLOCKED", "AI_ANOMALY_DETECTED: Pattern is statistically impossible", confidence
         elif confidence > flag_threshold:
             return "FLAGGED", "SUSPICIOUS_ACTIVITY: Step-Up Auth Required", confidence
         else:
-            return "APPROVED", "NORMAL_BEHAVIOR", confidence
\ No newline at end of file
+            return "APPROVED", "NORMAL_BEHAVIOR", confidence
+
+    @staticmethod
+    def confidence(mse, error_mean, error_std):
+        z_score = (mse - error_mean) / error_std
+        # Cap z-score to prevent extreme confidence values
+        z_score = min(z_score, 4.0)  # Cap at 4 standard deviations
+
+        # Standard normal CDF; erfc keeps the lower tail accurate
+        confidence = 0.5 * math.erfc(-z_score / math.sqrt(2)) * 100
+        return min(99.99, max(0.01, confidence))
+
+    def exact_mse(self, features):
+        """Reconstruction error in float64 with the scaler applied separately (the original arithmetic)."""
+        scaled = np.array(features, dtype=np.float64) * self.scale + self.min
+        reconstruction = self.exact_model.predict(scaled)
+        return float(np.mean(np.power(scaled - reconstruction, 2)))
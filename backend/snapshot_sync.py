@@ -0,0 +1,72 @@
+import threading
+
+
+class SnapshotSync:
+    """
+    Keeps an in-memory mirror of a Firestore query current: a snapshot
+    listener while one can be attached, a full reload every
+    `poll_interval` seconds while it can't (or after it dies).
+
+    The owner supplies `query()` (what to watch), `refresh()` (reload
+    everything) and `on_snapshot` (the listener callback); `name` is used
+    in log lines and the poll thread's name.
+    """
+    def __init__(self, name, poll_interval, query, refresh, on_snapshot):
+        self.name = name
+        self.poll_interval = poll_interval
+        self.query = query
+        self.refresh = refresh
+        self.on_snapshot = on_snapshot
+        self.watch = None
+        self.poll_thread = None
+        self.stop_event = threading.Event()
+
+    def start(self):
+        self.stop_event.clear()
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"⚠️ Initial {self.name.lower()} load failed: {e}")
+
+        self._attach_listener()
+
+        thread_name = self.name.lower().replace(' ', '-') + "-poll"
+        self.poll_thread = threading.Thread(target=self._poll_loop, name=thread_name, daemon=True)
+        self.poll_thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self._detach_listener()
+
+    def active(self):
+        """True while a listener is attached and alive."""
+        return self.watch is not None and getattr(self.watch, 'is_active', True)
+
+    def _attach_listener(self):
+        try:
+            self.watch = self.query().on_snapshot(self.on_snapshot)
+            print(f"✅ {self.name} listener attached.")
+        except Exception as e:
+            print(f"⚠️ {self.name} listener unavailable ({e}). Polling every {self.poll_interval}s.")
+            self.watch = None
+
+    def _detach_listener(self):
+        if self.watch is not None:
+            try:
+                self.watch.unsubscribe()
+            except Exception as e:
+                print(f"⚠️ Error detaching {self.name.lower()} listener: {e}")
+            self.watch = None
+
+    def _poll_loop(self):
+        while not self.stop_event.wait(self.poll_interval):
+            if self.active():
+                continue
+            try:
+                self.refresh()
+                # A listener that was attached but died is unsubscribed and re-attached after a successful reload
+                if self.watch is not None:
+                    self._detach_listener()
+                    self._attach_listener()
+            except Exception as e:
+                print(f"⚠️ {self.name} poll failed: {e}")
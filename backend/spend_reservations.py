@@ -0,0 +1,228 @@
+"""
+Per-user daily-limit reservations for /analyze-upi.
+
+Reading the 24h spend, checking it against the limit and saving the
+payment used to be three separate steps, so parallel payments from one
+user could all pass the check. A reservation makes check-and-hold atomic
+per user: reserve() reads the committed spend plus every hold still in
+flight for that user, and either records a hold for the new amount or
+refuses. The hold counts towards later checks until commit() swaps it
+for the saved payment, or release() drops it.
+
+Two implementations with the same interface:
+
+- SpendReservations: in-process. Users hash onto a fixed set of lock
+  stripes, so one user's checks are serialized while other users run in
+  parallel (apart from the occasional shared stripe). Correct for one
+  server process, which is how the app is deployed.
+- FirestoreSpendReservations: for several replicas. The check and the hold
+  run in one Firestore transaction over the user's rollups and a
+  spend_holds/{user_id} doc (retried on contention), and commit() writes
+  the payment and clears its hold in another transaction, skipping the
+  write-behind queue so other replicas see it immediately. Holds carry an
+  expiry so a replica that dies mid-payment doesn't pin the limit.
+"""
+import itertools
+import threading
+import time
+import uuid
+
+try:
+    from spend_rollups import read_spend_last_24h
+    from write_behind import resolve_transforms
+except ImportError:
+    from backend.spend_rollups import read_spend_last_24h
+    from backend.write_behind import resolve_transforms
+
+HOLDS_COLLECTION = 'spend_holds'
+
+
+class Reservation:
+    def __init__(self, owner, user_id, amount, txn_time, past_spent, last_txn_time, granted, token):
+        self.owner = owner
+        self.user_id = user_id
+        self.amount = amount
+        self.txn_time = txn_time
+        self.past_spent = past_spent        # committed spend + other holds, before this payment
+        self.last_txn_time = last_txn_time  # latest committed or held payment, or None
+        self.granted = granted
+        self.token = token
+        self.settled = not granted
+
+    def release(self):
+        self.owner.release(self)
+
+
+class SpendReservations:
+    def __init__(self, read_state, write, stripes=64):
+        """
+        read_state(user_id, now) -> (spent in the 24h before now, last txn time or None)
+        write(ops) persists a list of write-behind ops.
+        """
+        self.read_state = read_state
+        self.write = write
+        self.locks = [threading.Lock() for _ in range(stripes)]
+        self.holds = [{} for _ in range(stripes)]  # per stripe: user_id -> {token: (amount, txn_time)}
+        self.tokens = itertools.count(1)
+        self.granted = 0
+        self.refused = 0
+        self.contended = 0
+
+    def _stripe(self, user_id):
+        return hash(user_id) % len(self.locks)
+
+    def reserve(self, user_id, amount, limit, txn_time):
+        stripe = self._stripe(user_id)
+        lock = self.locks[stripe]
+        if not lock.acquire(blocking=False):
+            self.contended += 1
+            lock.acquire()
+        try:
+            spent, last_txn_time = self.read_state(user_id, txn_time)
+            held = self.holds[stripe].get(user_id, {})
+            for held_amount, held_time in held.values():
+                spent += held_amount
+                if last_txn_time is None or held_time > last_txn_time:
+                    last_txn_time = held_time
+            granted = spent + amount <= limit
+            token = None
+            if granted:
+                token = next(self.tokens)
+                self.holds[stripe].setdefault(user_id, {})[token] = (amount, txn_time)
+                self.granted += 1
+            else:
+                self.refused += 1
+        finally:
+            lock.release()
+        return Reservation(self, user_id, amount, txn_time, spent, last_txn_time, granted, token)
+
+    def commit(self, reservations, ops, publish=None):
+        """
+        Persists the payments and swaps their holds for the real thing:
+        write(ops) and publish() (which makes them visible to read_state,
+        e.g. adding them to the spend windows) run under the users' stripe
+        locks together with dropping the holds, so no check ever counts a
+        payment twice or not at all.
+        """
+        stripes = sorted({self._stripe(r.user_id) for r in reservations if not r.settled})
+        for stripe in stripes:  # always in stripe order, so two commits can't deadlock
+            self.locks[stripe].acquire()
+        try:
+            if ops:
+                self.write(ops)
+            if publish is not None:
+                publish()
+            for r in reservations:
+                self._drop(r)
+        finally:
+            for stripe in reversed(stripes):
+                self.locks[stripe].release()
+
+    def release(self, reservation):
+        """Drops a hold that won't be committed (no-op once committed)."""
+        if reservation.settled:
+            return
+        with self.locks[self._stripe(reservation.user_id)]:
+            self._drop(reservation)
+
+    def _drop(self, reservation):
+        if reservation.settled:
+            return
+        stripe = self._stripe(reservation.user_id)
+        held = self.holds[stripe].get(reservation.user_id)
+        if held is not None:
+            held.pop(reservation.token, None)
+            if not held:
+                del self.holds[stripe][reservation.user_id]
+        reservation.settled = True
+
+    def stats(self):
+        return {
+            "mode": "local",
+            "stripes": len(self.locks),
+            "in_flight": sum(len(h) for stripe in self.holds for h in list(stripe.values())),
+            "granted": self.granted,
+            "refused": self.refused,
+            "contended": self.contended
+        }
+
+
+class FirestoreSpendReservations:
+    def __init__(self, db, hold_ttl=60):
+        from firebase_admin import firestore
+        self.firestore = firestore
+        self.db = db
+        self.hold_ttl = hold_ttl
+        self.granted = 0
+        self.refused = 0
+
+    def _holds_ref(self, user_id):
+        return self.db.collection(HOLDS_COLLECTION).document(user_id)
+
+    def reserve(self, user_id, amount, limit, txn_time):
+        ref = self._holds_ref(user_id)
+        # Letter first so it is a plain field name in the "holds.<token>" update path
+        token = "h" + uuid.uuid4().hex
+
+        @self.firestore.transactional
+        def check_and_hold(transaction):
+            now = time.time()
+            spent, last_txn_time = read_spend_last_24h(self.db, user_id, txn_time, transaction=transaction)
+            snap = ref.get(transaction=transaction)
+            holds = (snap.to_dict() or {}).get('holds', {}) if snap.exists else {}
+            live = {t: h for t, h in holds.items() if h.get('expires', 0) > now}
+            for hold in live.values():
+                spent += hold['amount']
+                if last_txn_time is None or hold['txn_time'] > last_txn_time:
+                    last_txn_time = hold['txn_time']
+            granted = spent + amount <= limit
+            if granted:
+                live[token] = {"amount": amount, "txn_time": txn_time, "expires": now + self.hold_ttl}
+            if granted or len(live) != len(holds):
+                transaction.set(ref, {"holds": live})
+            return spent, last_txn_time, granted
+
+        spent, last_txn_time, granted = check_and_hold(self.db.transaction())
+        if granted:
+            self.granted += 1
+        else:
+            self.refused += 1
+        return Reservation(self, user_id, amount, txn_time, spent, last_txn_time, granted, token if granted else None)
+
+    def commit(self, reservations, ops, publish=None):
+        """Writes the payments and clears their holds in one transaction (one hold doc write per user)."""
+        reservations = [r for r in reservations if not r.settled]
+        tokens = {}
+        for r in reservations:
+            tokens.setdefault(r.user_id, set()).add(r.token)
+        refs = {user_id: self._holds_ref(user_id) for user_id in tokens}
+
+        @self.firestore.transactional
+        def write_and_clear(transaction):
+            # Firestore wants every read before the first write
+            snaps = {snap.id: snap for snap in self.db.get_all(list(refs.values()), transaction=transaction)}
+            for user_id, ref in refs.items():
+                snap = snaps.get(ref.id)
+                holds = (snap.to_dict() or {}).get('holds', {}) if snap is not None and snap.exists else {}
+                transaction.set(ref, {"holds": {t: h for t, h in holds.items() if t not in tokens[user_id]}})
+            for path, data, merge in ops:
+                transaction.set(self.db.document(path), resolve_transforms(data), merge=merge)
+
+        write_and_clear(self.db.transaction())
+        for r in reservations:
+            r.settled = True
+        if publish is not None:
+            publish()
+
+    def release(self, reservation):
+        if reservation.settled:
+            return
+        try:
+            self._holds_ref(reservation.user_id).update({f"holds.{reservation.token}": self.firestore.DELETE_FIELD})
+        except Exception as e:
+            # It expires on its own after hold_ttl
+            print(f"⚠️ Could not release spend hold for {reservation.user_id}: {e}")
+        reservation.settled = True
+
+    def stats(self):
+        return {"mode": "firestore", "hold_ttl": self.hold_ttl, "granted": self.granted, "refused": self.refused}
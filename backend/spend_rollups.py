@@ -0,0 +1,95 @@
+"""
+Per-user, per-day spend rollups next to the raw `transactions` collection.
+
+    daily_spend/{user_id}_{YYYYMMDD}
+        user_id, day ("YYYYMMDD", UTC), total_amount, count, last_timestamp
+
+Every saved UPI transaction queues its raw doc and an Increment/Maximum on
+its day's rollup as one write-behind entry, so both land in the same batch.
+
+The last 24h always spans today (UTC) and the end of yesterday. Today's
+rollup covers its part exactly. For yesterday, whichever slice is shorter
+is read raw with a bounded (user_id ==, timestamp range) query projected to
+amount/timestamp: the part still inside the window, or the part that has
+aged out, which is then subtracted from yesterday's rollup. Either way it
+is at most 12h of one user's transactions, regardless of account age.
+That query needs the composite index in firestore.indexes.json.
+"""
+
+import time
+
+try:
+    from write_behind import increment, maximum
+except ImportError:
+    from backend.write_behind import increment, maximum
+
+ROLLUP_COLLECTION = 'daily_spend'
+DAY_SECONDS = 86400
+
+
+def day_key(timestamp):
+    return time.strftime('%Y%m%d', time.gmtime(timestamp))
+
+
+def rollup_path(user_id, timestamp):
+    return f"{ROLLUP_COLLECTION}/{user_id}_{day_key(timestamp)}"
+
+
+def rollup_op(user_id, amount, timestamp):
+    """Write-behind op that adds one transaction to its day's rollup."""
+    return (rollup_path(user_id, timestamp), {
+        "user_id": user_id,
+        "day": day_key(timestamp),
+        "total_amount": increment(amount),
+        "count": increment(1),
+        "last_timestamp": maximum(timestamp)
+    }, True)
+
+
+def transactions_between(db, user_id, start, end=None, fields=('amount', 'timestamp'), transaction=None):
+    """Docs of `user_id` with start < timestamp (<= end), projected to `fields`."""
+    query = db.collection('transactions')\
+        .where('user_id', '==', user_id)\
+        .where('timestamp', '>', start)
+    if end is not None:
+        query = query.where('timestamp', '<=', end)
+    if fields:
+        query = query.select(list(fields))
+    return query.stream(transaction=transaction)
+
+
+def read_spend_last_24h(db, user_id, now=None, transaction=None):
+    """
+    (spent in the last 24h, timestamp of the latest transaction in it or None)
+    from rollups. Pass `transaction` to make the reads part of it.
+    """
+    now = int(now if now is not None else time.time())
+    window_start = now - DAY_SECONDS
+    today_start = now - now % DAY_SECONDS
+    yesterday_start = today_start - DAY_SECONDS
+
+    today_path = rollup_path(user_id, now)
+    yesterday_path = rollup_path(user_id, yesterday_start)
+    # One round trip for both; get_all doesn't keep the order of its refs
+    snaps = db.get_all([db.document(today_path), db.document(yesterday_path)], transaction=transaction)
+    rollups = {snap.id: snap.to_dict() for snap in snaps if snap.exists}
+    today = rollups.get(today_path.split('/')[-1])
+    yesterday = rollups.get(yesterday_path.split('/')[-1])
+
+    total = (today or {}).get('total_amount', 0)
+    last_ts = (today or {}).get('last_timestamp')
+
+    if yesterday and yesterday.get('count', 0) and yesterday.get('last_timestamp', 0) > window_start:
+        if window_start - yesterday_start <= today_start - window_start:
+            # Little of yesterday has aged out: subtract that slice from the rollup
+            expired = sum(doc.to_dict().get('amount', 0)
+                          for doc in transactions_between(db, user_id, yesterday_start - 1, window_start,
+                                                          transaction=transaction))
+            total += yesterday.get('total_amount', 0) - expired
+        else:
+            total += sum(doc.to_dict().get('amount', 0)
+                         for doc in transactions_between(db, user_id, window_start, today_start - 1,
+                                                         transaction=transaction))
+        if last_ts is None:
+            last_ts = yesterday['last_timestamp']
+    return total, last_ts
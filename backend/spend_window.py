@@ -0,0 +1,175 @@
+import threading
+import time
+from collections import deque
+
+
+class SpendWindows:
+    """
+    Rolling 24h spend per user, kept in memory so /analyze-upi doesn't
+    scan a user's whole `transactions` history on every payment.
+
+    Each user has a deque of time buckets ([bucket_start, amount]; 5 minutes
+    wide by default), the running total of those buckets and the time of
+    their latest transaction. Buckets fall off the left once they are
+    entirely older than the window, so a lookup only touches the buckets
+    that expired since the last one. A bucket counts while any part of it
+    is inside the window: the total can include up to `bucket_seconds` of
+    spend older than 24h, never less than the real figure.
+
+    Rebuilt at startup from one range query on `timestamp` (single-field,
+    no composite index) plus writes still queued in the write-behind
+    journal, then kept current by add() when /analyze-upi saves a
+    transaction. Until the rebuild finishes `ready` is False and callers
+    should fall back to the Firestore scan. The windows only see writes
+    made through this process, which is how the app is deployed (one
+    uvicorn worker).
+    """
+    def __init__(self, window_seconds=86400, bucket_seconds=300, sweep_every=1024):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.sweep_every = sweep_every
+        self.users = {}  # user_id -> {"buckets": deque, "total": float, "last_ts": int, "ids": {doc_id: ts}}
+        self.lock = threading.Lock()
+        self.ready = False
+        self.thread = None
+        self.adds = 0
+        self.lookups = 0
+        self.rebuilt_docs = 0
+        self.last_rebuild = None
+        self.rebuild_seconds = None
+
+    # --- startup ---
+    def start(self, db, pending=None):
+        """Rebuilds in a background thread; `pending` returns queued (path, data) writes."""
+        self.thread = threading.Thread(target=self._rebuild_safely, args=(db, pending), name="spend-window-rebuild", daemon=True)
+        self.thread.start()
+
+    def _rebuild_safely(self, db, pending):
+        try:
+            self.rebuild(db, pending)
+        except Exception as e:
+            print(f"⚠️ Spend window rebuild failed ({e}). Falling back to per-request scans.")
+
+    def rebuild(self, db, pending=None, now=None):
+        started = time.time()
+        now = int(now if now is not None else started)
+        docs = db.collection('transactions')\
+            .where('timestamp', '>', now - self.window_seconds)\
+            .stream()
+
+        records = [(doc.id, doc.to_dict()) for doc in docs]
+        if pending is not None:
+            # Journaled writes replayed at startup may or may not have landed already
+            seen_ids = {doc_id for doc_id, _ in records}
+            for path, data in pending('transactions'):
+                doc_id = path.split('/')[-1]
+                if doc_id not in seen_ids:
+                    records.append((doc_id, data))
+
+        with self.lock:
+            # Merged into the live windows rather than replacing them: add()s that land while the
+            # query streams are kept, and doc ids stop anything being counted twice
+            for doc_id, data in records:
+                if data.get('user_id') is None:
+                    continue
+                self._add_locked(data['user_id'], data.get('amount', 0), data.get('timestamp', 0), doc_id, now)
+            self.ready = True
+            self.rebuilt_docs = len(records)
+            self.last_rebuild = now
+            self.rebuild_seconds = time.time() - started
+        print(f"✅ Spend windows rebuilt: {len(self.users)} users from {len(records)} transactions in {self.rebuild_seconds:.2f}s.")
+
+    # --- updates ---
+    def add(self, user_id, amount, timestamp, doc_id=None):
+        """Records a saved transaction. Re-adding the same doc_id is a no-op."""
+        now = int(time.time())
+        with self.lock:
+            self._add_locked(user_id, amount, timestamp, doc_id, now)
+            self.adds += 1
+            if self.adds % self.sweep_every == 0:
+                self._sweep_locked(now)
+
+    def _add_locked(self, user_id, amount, timestamp, doc_id, now):
+        if timestamp <= now - self.window_seconds:
+            return
+        state = self.users.get(user_id)
+        if state is None:
+            state = self.users[user_id] = {"buckets": deque(), "total": 0.0, "last_ts": None, "ids": {}}
+        if doc_id is not None:
+            if doc_id in state["ids"]:
+                return
+            state["ids"][doc_id] = timestamp
+
+        bucket_start = timestamp - timestamp % self.bucket_seconds
+        buckets = state["buckets"]
+        if buckets and buckets[-1][0] == bucket_start:
+            buckets[-1][1] += amount
+        elif not buckets or buckets[-1][0] < bucket_start:
+            buckets.append([bucket_start, amount])
+        else:
+            # Out-of-order timestamp (rebuild order, clock skew): insert in place
+            for i, bucket in enumerate(buckets):
+                if bucket[0] == bucket_start:
+                    bucket[1] += amount
+                    break
+                if bucket[0] > bucket_start:
+                    buckets.insert(i, [bucket_start, amount])
+                    break
+        state["total"] += amount
+        if state["last_ts"] is None or timestamp > state["last_ts"]:
+            state["last_ts"] = timestamp
+
+    def _expire_locked(self, state, now):
+        cutoff = now - self.window_seconds
+        buckets = state["buckets"]
+        expired = False
+        while buckets and buckets[0][0] + self.bucket_seconds <= cutoff:
+            buckets.popleft()
+            expired = True
+        if expired:
+            # Re-sum the (at most window / bucket) live buckets so float error can't build up
+            state["total"] = sum(amount for _, amount in buckets)
+            state["ids"] = {doc_id: ts for doc_id, ts in state["ids"].items() if ts > cutoff}
+        return bool(buckets)
+
+    def _sweep_locked(self, now):
+        for user_id in [u for u, state in self.users.items() if not self._expire_locked(state, now)]:
+            del self.users[user_id]
+
+    # --- lookups ---
+    def lookup(self, user_id, now=None):
+        """
+        (spent in the 24h before `now`, seconds since the last transaction in
+        it or None). Buckets are only ever expired against the wall clock, so
+        a lookup at a future `now` is summed without touching shared state.
+        """
+        wall = int(time.time())
+        now = int(now if now is not None else wall)
+        with self.lock:
+            self.lookups += 1
+            state = self.users.get(user_id)
+            if state is None:
+                return 0, None
+            if not self._expire_locked(state, min(now, wall)):
+                del self.users[user_id]
+                return 0, None
+            total = state["total"]
+            if now > wall:
+                cutoff = now - self.window_seconds
+                total = sum(amount for start, amount in state["buckets"] if start + self.bucket_seconds > cutoff)
+            last_ts = state["last_ts"]
+            gap = now - last_ts if last_ts > now - self.window_seconds else None
+            return total, gap
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "users": len(self.users),
+            "buckets": sum(len(state["buckets"]) for state in list(self.users.values())),
+            "bucket_seconds": self.bucket_seconds,
+            "adds": self.adds,
+            "lookups": self.lookups,
+            "rebuilt_docs": self.rebuilt_docs,
+            "last_rebuild": self.last_rebuild,
+            "rebuild_seconds": self.rebuild_seconds
+        }
@@ -0,0 +1,249 @@
+"""
+Multi-resolution tile aggregation of transaction coordinates for the
+/fraud-heatmap bbox/zoom view.
+
+Cells are Web Mercator map tiles (the z/x/y scheme map libraries use).
+Every point is counted in one tile per zoom level from 0 to `max_zoom`;
+tile (z, x, y) is exactly the four tiles (z+1, 2x..2x+1, 2y..2y+1), so each
+level is the roll-up of the one above it. A cell keeps the transaction
+count, how many of them were fraud, and coordinate sums for a centroid,
+so points are drawn where the transactions are rather than at tile
+corners. Like the city-level heatmap, a point's weight is its fraud
+count: tiles with no fraud are left out, and `count` says how many
+transactions the tile holds in all.
+
+Built offline from the transaction CSVs (build_tiles.py), loaded at
+startup, updated as /analyze-transaction scores new transactions, and
+saved every `save_interval` seconds while there are unsaved changes and
+again on shutdown, so a crash loses at most one interval of updates.
+"""
+import math
+import os
+import threading
+
+import numpy as np
+
+DEFAULT_MAX_ZOOM = 14  # ~2.4 km tiles at the equator, ~2.2 km over India
+MAX_LAT = 85.0511287798  # Web Mercator's square world
+MAX_CELLS = 5000  # per query; a view that would return more is served one zoom level coarser
+
+
+def tile_xy(lat, lng, zoom):
+    """Tile (x, y) containing a point at `zoom`; y grows southward."""
+    n = 1 << zoom
+    lat = math.radians(min(max(lat, -MAX_LAT), MAX_LAT))
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(lat)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tiles_xy(lat, lng, zoom):
+    """Vectorized tile_xy over arrays."""
+    n = 1 << zoom
+    lat = np.radians(np.clip(lat, -MAX_LAT, MAX_LAT))
+    x = ((np.asarray(lng, dtype=np.float64) + 180.0) / 360.0 * n).astype(np.int64)
+    y = ((1.0 - np.arcsinh(np.tan(lat)) / np.pi) / 2.0 * n).astype(np.int64)
+    return np.clip(x, 0, n - 1), np.clip(y, 0, n - 1)
+
+
+def parse_bbox(text):
+    """"west,south,east,north" in degrees -> tuple; raises ValueError."""
+    try:
+        west, south, east, north = (float(v) for v in text.split(','))
+    except (AttributeError, ValueError):
+        raise ValueError("bbox must be west,south,east,north")
+    if not (-180 <= west <= east <= 180 and -90 <= south <= north <= 90):
+        raise ValueError("bbox must be west,south,east,north with west <= east and south <= north")
+    return west, south, east, north
+
+
+def _aggregate(keys, count, fraud, lat_sum, lng_sum):
+    """Sums the cell columns per unique key."""
+    keys, inverse = np.unique(keys, return_inverse=True)
+    sums = [np.bincount(inverse, weights=column, minlength=len(keys)) for column in (count, fraud, lat_sum, lng_sum)]
+    return keys, sums[0].astype(np.int64), sums[1].astype(np.int64), sums[2], sums[3]
+
+
+class TilePyramid:
+    def __init__(self, max_zoom=DEFAULT_MAX_ZOOM, path=None, save_interval=0):
+        self.max_zoom = max_zoom
+        self.path = path
+        self.save_interval = save_interval
+        self.levels = [{} for _ in range(max_zoom + 1)]  # per zoom: (x, y) -> [count, fraud, lat_sum, lng_sum]
+        self.lock = threading.Lock()
+        self.points = 0
+        self.dirty = False
+        self.save_thread = None
+        self.stop_event = threading.Event()
+
+    def start(self):
+        """Starts saving periodically (with `save_interval` and `path` set)."""
+        self.stop_event.clear()
+        if self.save_interval and self.path:
+            self.save_thread = threading.Thread(target=self._save_loop, name="heatmap-tiles-save", daemon=True)
+            self.save_thread.start()
+
+    def stop(self):
+        """Stops the periodic saves and saves one last time."""
+        self.stop_event.set()
+        if self.save_thread is not None:
+            self.save_thread.join(timeout=5)
+            self.save_thread = None
+        self.save()
+
+    def _save_loop(self):
+        while not self.stop_event.wait(self.save_interval):
+            if self.dirty:
+                self.save()
+
+    @staticmethod
+    def _valid(lat, lng):
+        return lat is not None and lng is not None and -90 <= lat <= 90 and -180 <= lng <= 180
+
+    def add(self, lat, lng, fraud=False):
+        """One scored transaction (incremental update)."""
+        if not self._valid(lat, lng):
+            return
+        x, y = tile_xy(lat, lng, self.max_zoom)
+        fraud = 1 if fraud else 0
+        with self.lock:
+            for zoom in range(self.max_zoom, -1, -1):
+                shift = self.max_zoom - zoom
+                cell = self.levels[zoom].get((x >> shift, y >> shift))
+                if cell is None:
+                    self.levels[zoom][(x >> shift, y >> shift)] = [1, fraud, lat, lng]
+                else:
+                    cell[0] += 1
+                    cell[1] += fraud
+                    cell[2] += lat
+                    cell[3] += lng
+            self.points += 1
+            self.dirty = True
+
+    def add_many(self, lat, lng, fraud=None):
+        """Bulk load: aggregates the finest level with numpy, then rolls it up level by level."""
+        lat = np.asarray(lat, dtype=np.float64)
+        lng = np.asarray(lng, dtype=np.float64)
+        fraud = np.zeros(len(lat)) if fraud is None else np.asarray(fraud, dtype=np.float64)
+        keep = np.isfinite(lat) & np.isfinite(lng) & (np.abs(lat) <= 90) & (np.abs(lng) <= 180)
+        lat, lng, fraud = lat[keep], lng[keep], fraud[keep]
+        x, y = tiles_xy(lat, lng, self.max_zoom)
+        self._merge_finest(x, y, np.ones(len(lat)), fraud, lat, lng)
+
+    def _merge_finest(self, x, y, count, fraud, lat_sum, lng_sum):
+        if len(x) == 0:
+            return
+        side = np.int64(1) << self.max_zoom
+        keys, count, fraud, lat_sum, lng_sum = _aggregate(x * side + y, count, fraud, lat_sum, lng_sum)
+        x, y = keys // side, keys % side
+        with self.lock:
+            for zoom in range(self.max_zoom, -1, -1):
+                if zoom < self.max_zoom:
+                    # Roll the level above up into this one: four children per parent
+                    x, y = x >> 1, y >> 1
+                    keys, count, fraud, lat_sum, lng_sum = _aggregate(x * side + y, count, fraud, lat_sum, lng_sum)
+                    x, y = keys // side, keys % side
+                level = self.levels[zoom]
+                for cx, cy, c, f, la, ln in zip(x.tolist(), y.tolist(), count.tolist(), fraud.tolist(),
+                                                lat_sum.tolist(), lng_sum.tolist()):
+                    cell = level.get((cx, cy))
+                    if cell is None:
+                        level[(cx, cy)] = [c, f, la, ln]
+                    else:
+                        cell[0] += c
+                        cell[1] += f
+                        cell[2] += la
+                        cell[3] += ln
+            self.points += int(count.sum())
+            self.dirty = True
+
+    def query(self, bbox, zoom, max_cells=MAX_CELLS):
+        """
+        (zoom, points): the fraud cells at `zoom` (clamped to the pyramid)
+        that intersect bbox = (west, south, east, north). While there would
+        be more than `max_cells` of them, the next coarser zoom is used
+        instead, so the returned zoom can be lower than the one asked for.
+        """
+        zoom = min(max(int(zoom), 0), self.max_zoom)
+        cells = self._fraud_cells(bbox, zoom)
+        while len(cells) > max_cells and zoom > 0:
+            zoom -= 1
+            cells = self._fraud_cells(bbox, zoom)
+        return zoom, [{
+            "location": {"lat": round(lat_sum / count, 6), "lng": round(lng_sum / count, 6)},
+            "weight": fraud,
+            "count": count,
+            "fraud": fraud,
+            "tile": [zoom, x, y]
+        } for x, y, (count, fraud, lat_sum, lng_sum) in cells[:max_cells]]
+
+    def _fraud_cells(self, bbox, zoom):
+        west, south, east, north = bbox
+        x0, y0 = tile_xy(north, west, zoom)
+        x1, y1 = tile_xy(south, east, zoom)
+        level = self.levels[zoom]
+        cells = []
+        with self.lock:
+            # Walk whichever is smaller: the tiles in view, or the occupied tiles at this zoom
+            if (x1 - x0 + 1) * (y1 - y0 + 1) <= len(level):
+                for x in range(x0, x1 + 1):
+                    for y in range(y0, y1 + 1):
+                        cell = level.get((x, y))
+                        if cell is not None and cell[1]:
+                            cells.append((x, y, cell[:]))
+            else:
+                for (x, y), cell in level.items():
+                    if cell[1] and x0 <= x <= x1 and y0 <= y <= y1:
+                        cells.append((x, y, cell[:]))
+        return cells
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as saved:
+                max_zoom = int(saved["max_zoom"])
+                columns = [saved[name] for name in ("x", "y", "count", "fraud", "lat_sum", "lng_sum")]
+            with self.lock:
+                self.max_zoom = max_zoom
+                self.levels = [{} for _ in range(max_zoom + 1)]
+                self.points = 0
+            self._merge_finest(*columns)
+            self.dirty = False
+            print(f"✅ Heatmap tiles loaded: {self.points} transactions, {len(self.levels[max_zoom])} cells at z{max_zoom}.")
+        except Exception as e:
+            print(f"⚠️ Could not load heatmap tiles: {e}")
+
+    def save(self):
+        """Writes the finest level (the rest is rebuilt from it on load)."""
+        if not self.path:
+            return
+        try:
+            with self.lock:
+                finest = list(self.levels[self.max_zoom].items())
+                max_zoom = self.max_zoom
+                self.dirty = False
+            columns = {
+                "max_zoom": np.int64(max_zoom),
+                "x": np.array([x for (x, _), _ in finest], dtype=np.int64),
+                "y": np.array([y for (_, y), _ in finest], dtype=np.int64),
+                "count": np.array([cell[0] for _, cell in finest], dtype=np.int64),
+                "fraud": np.array([cell[1] for _, cell in finest], dtype=np.int64),
+                "lat_sum": np.array([cell[2] for _, cell in finest], dtype=np.float64),
+                "lng_sum": np.array([cell[3] for _, cell in finest], dtype=np.float64)
+            }
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **columns)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"⚠️ Could not persist heatmap tiles: {e}")
+
+    def stats(self):
+        return {
+            "max_zoom": self.max_zoom,
+            "transactions": self.points,
+            "cells": [len(level) for level in self.levels],
+            "unsaved_changes": self.dirty,
+            "persistent": bool(self.path)
+        }
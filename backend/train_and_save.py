@@ -13,10 +13,17 @@ import json
 
 # Import shared utils to ensure consistent class paths for pickling
 try:
-    from ml_utils import SafeLabelEncoder, FEATURES_LGB, CAT_COLS, AE_FEATURES
+    from ml_utils import SafeLabelEncoder, CompiledLabelEncoder, FEATURES_LGB, CAT_COLS, AE_FEATURES
 except ImportError:
     # Handle running as script from root
-    from backend.ml_utils import SafeLabelEncoder, FEATURES_LGB, CAT_COLS, AE_FEATURES
+    from backend.ml_utils import SafeLabelEncoder, CompiledLabelEncoder, FEATURES_LGB, CAT_COLS, AE_FEATURES
+
+try:
+    from lgb_numpy import export_model
+    from model_bundle import export_ae_weights
+except ImportError:
+    from backend.lgb_numpy import export_model
+    from backend.model_bundle import export_ae_weights
 
 # --- CONFIG ---
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
@@ -51,8 +58,9 @@ def train_and_save():
         X[col] = sle.transform(X[col])
         label_encoders[col] = sle
 
-    # Save Encoders
-    joblib.dump(label_encoders, os.path.join(MODELS_DIR, 'label_encoders.joblib'))
+    # Save Encoders (compiled form; load_label_encoders still reads old SafeLabelEncoder files)
+    compiled = {col: CompiledLabelEncoder.from_label_encoder(sle) for col, sle in label_encoders.items()}
+    joblib.dump(compiled, os.path.join(MODELS_DIR, 'label_encoders.joblib'))
     print("✅ Label Encoders saved.")
 
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
@@ -64,6 +72,10 @@ def train_and_save():
     lgb_model.save_model(os.path.join(MODELS_DIR, 'lgb_model.txt'))
     print("✅ LightGBM model saved.")
 
+    # Compiled trees for the NumPy inference engine (see lgb_numpy.py)
+    export_model(os.path.join(MODELS_DIR, 'lgb_model.txt'), os.path.join(MODELS_DIR, 'lgb_model.npz'))
+    print("✅ LightGBM trees compiled for NumPy inference.")
+
     # --- 2. Train Autoencoders ---
     print("Training Autoencoders...")
     df_b_path = os.path.join(DATA_DIR, 'transactions_700.csv')
@@ -105,6 +117,10 @@ def train_and_save():
         json.dump(ae_weights, f)
     print(f"✅ Autoencoder weights saved for {len(ae_weights)} users.")
 
+    # Memory-mapped bundle the API loads (the JSON above stays as the fallback)
+    export_ae_weights(ae_weights, os.path.join(MODELS_DIR, 'ae_weights.bin'))
+    print("✅ Autoencoder bundle written.")
+
     print("\n🎉 Training Complete! Artifacts are in backend/models/")
 
 if __name__ == "__main__":
@@ -0,0 +1,147 @@
+import bisect
+import threading
+import time
+
+try:
+    from pagination import encode_cursor, decode_cursor
+    from snapshot_sync import SnapshotSync
+except ImportError:
+    from backend.pagination import encode_cursor, decode_cursor
+    from backend.snapshot_sync import SnapshotSync
+
+PREFIX = 'user_'
+# First id after every "user_..." id: "_" is 0x5F, "`" is 0x60
+PREFIX_END = 'user`'
+
+
+class UserDirectory:
+    """
+    In-memory directory of the UPI profiles (`users/user_*`) for /users.
+
+    Only the user_ key range is read, with a document-id range query
+    projected to name/type, so the ACC_* account docs sharing the
+    collection cost nothing no matter how many there are. The directory is
+    kept as two sorted indexes (by id, and by lower-cased name) plus a
+    dict of entries: listing, prefix search and keyset pagination are
+    bisects into them.
+
+    Loaded once at startup and kept current by a snapshot listener on the
+    same key range; if the listener can't be attached (or dies), a
+    background thread reloads every `poll_interval` seconds instead, like
+    the blocked registry (both use SnapshotSync). `on_change(user_id)` is called for every doc the
+    listener reports, e.g. to invalidate a profile cache.
+    """
+    def __init__(self, poll_interval=60, on_change=None):
+        self.on_change = on_change
+        self.entries = {}     # user_id -> {"id", "name", "type"}
+        self.by_id = []       # sorted user_ids
+        self.by_name = []     # sorted (name.lower(), user_id)
+        self.lock = threading.Lock()
+        self.collection = None
+        self.sync = SnapshotSync("User directory", poll_interval, self.key_range_query,
+                                 self.refresh, self._on_snapshot)
+        self.ready = False
+        self.last_refresh = None
+        self.listener_events = 0
+        self.full_reloads = 0
+
+    def start(self, db):
+        self.collection = db.collection('users')
+        self.sync.start()
+
+    def stop(self):
+        self.sync.stop()
+
+    def key_range_query(self):
+        return self.collection\
+            .where('__name__', '>=', self.collection.document(PREFIX))\
+            .where('__name__', '<', self.collection.document(PREFIX_END))
+
+    @staticmethod
+    def _entry(user_id, data):
+        return {"id": user_id, "name": data.get("name", user_id), "type": data.get("type", "personal")}
+
+    def refresh(self):
+        """Full reload of the user_ range (startup and polling fallback)."""
+        docs = self.key_range_query().select(['name', 'type']).stream()
+        entries = {doc.id: self._entry(doc.id, doc.to_dict()) for doc in docs if doc.id.startswith(PREFIX)}
+        by_id = sorted(entries)
+        by_name = sorted((entry["name"].lower(), user_id) for user_id, entry in entries.items())
+        with self.lock:
+            self.entries, self.by_id, self.by_name = entries, by_id, by_name
+            self.ready = True
+            self.last_refresh = time.time()
+            self.full_reloads += 1
+        print(f"✅ User directory loaded: {len(entries)} UPI users.")
+
+    def _on_snapshot(self, col_snapshot, changes, read_time):
+        changed = []
+        with self.lock:
+            for change in changes:
+                user_id = change.document.id
+                if not user_id.startswith(PREFIX):
+                    continue
+                self._remove_locked(user_id)
+                if change.type.name != 'REMOVED':
+                    self._insert_locked(self._entry(user_id, change.document.to_dict()))
+                changed.append(user_id)
+            self.listener_events += len(changes)
+            self.ready = True
+        if self.on_change is not None:
+            for user_id in changed:
+                self.on_change(user_id)
+
+    def _insert_locked(self, entry):
+        self.entries[entry["id"]] = entry
+        bisect.insort(self.by_id, entry["id"])
+        bisect.insort(self.by_name, (entry["name"].lower(), entry["id"]))
+
+    def _remove_locked(self, user_id):
+        entry = self.entries.pop(user_id, None)
+        if entry is None:
+            return
+        i = bisect.bisect_left(self.by_id, user_id)
+        if i < len(self.by_id) and self.by_id[i] == user_id:
+            del self.by_id[i]
+        key = (entry["name"].lower(), user_id)
+        i = bisect.bisect_left(self.by_name, key)
+        if i < len(self.by_name) and self.by_name[i] == key:
+            del self.by_name[i]
+
+    def page(self, limit, cursor=None, q=None, by="id"):
+        """
+        (entries, next_cursor): users in id order, or in name order with
+        by="name". `q` keeps only ids (or names, case-insensitively) that
+        start with it. Raises ValueError for a bad cursor.
+        """
+        by_name = by == "name"
+        prefix = (q or "").lower() if by_name else (q or "")
+        with self.lock:
+            index = self.by_name if by_name else self.by_id
+            if cursor:
+                sort_key, user_id = decode_cursor(cursor)
+                if not isinstance(sort_key, str):
+                    raise ValueError("invalid cursor")
+                start = bisect.bisect_right(index, (sort_key, user_id) if by_name else user_id)
+            else:
+                start = bisect.bisect_left(index, (prefix, "") if by_name else prefix)
+            keys = []
+            for key in index[start:start + limit + 1]:
+                sort_key, user_id = key if by_name else (key, key)
+                if not sort_key.startswith(prefix):
+                    break
+                keys.append((sort_key, user_id))
+            page = [self.entries[user_id] for _, user_id in keys[:limit]]
+
+        next_cursor = encode_cursor(*keys[limit - 1]) if len(keys) > limit else None
+        return page, next_cursor
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "users": len(self.entries),
+            "mode": "listener" if self.sync.active() else "polling",
+            "last_refresh": self.last_refresh,
+            "listener_events": self.listener_events,
+            "full_reloads": self.full_reloads
+        }
@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Flight:
+    """One in-progress fetch that concurrent misses for the same user wait on."""
+    def __init__(self):
+        self.done = threading.Event()
+        self.profile = None
+        self.error = None
+
+
+class UserProfileCache:
+    """
+    Bounded LRU + TTL cache of `users/{user_id}` docs, so /analyze-upi
+    doesn't re-read a profile (really just its personal/business type) on
+    every payment.
+
+    Unknown users are cached too, as None, for the shorter `negative_ttl`,
+    so a stream of payments from an account with no profile doesn't read
+    Firestore each time. Concurrent misses for one user share a single
+    fetch (singleflight); a failed fetch is raised to every waiter and
+    nothing is cached. invalidate() drops an entry (or all of them) and
+    makes fetches already in flight skip the cache on return, so they
+    can't put back what was just invalidated.
+    """
+    def __init__(self, fetch, max_size=50000, ttl=300, negative_ttl=60):
+        self.fetch = fetch  # user_id -> profile dict, or None if there is no such user
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.entries = OrderedDict()  # user_id -> (expires_at, profile or None)
+        self.flights = {}
+        self.lock = threading.Lock()
+        self.epoch = 0  # bumped by invalidate()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.collapsed = 0
+        self.fetches = 0
+        self.fetch_errors = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, user_id):
+        """The user's profile dict, or None for an unknown user."""
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None:
+                if entry[0] > time.time():
+                    self.entries.move_to_end(user_id)
+                    self.hits += 1
+                    if entry[1] is None:
+                        self.negative_hits += 1
+                    return entry[1]
+                del self.entries[user_id]
+                self.expirations += 1
+            self.misses += 1
+
+            flight = self.flights.get(user_id)
+            leader = flight is None
+            if leader:
+                flight = self.flights[user_id] = _Flight()
+                epoch = self.epoch
+            else:
+                self.collapsed += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.profile
+
+        try:
+            flight.profile = self.fetch(user_id)
+        except Exception as e:
+            flight.error = e
+        with self.lock:
+            self.fetches += 1
+            del self.flights[user_id]
+            if flight.error is not None:
+                self.fetch_errors += 1
+            elif epoch == self.epoch:
+                ttl = self.ttl if flight.profile is not None else self.negative_ttl
+                self.entries[user_id] = (time.time() + ttl, flight.profile)
+                self.entries.move_to_end(user_id)
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+        flight.done.set()
+        if flight.error is not None:
+            raise flight.error
+        return flight.profile
+
+    def invalidate(self, user_id=None):
+        """Forgets one user (or everyone, with no argument); the next get() reads Firestore again."""
+        with self.lock:
+            if user_id is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(user_id, None)
+            self.epoch += 1
+            self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "negative_ttl_seconds": self.negative_ttl,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "collapsed_misses": self.collapsed,
+            "firestore_reads": self.fetches,
+            "firestore_reads_saved": lookups - self.fetches,
+            "fetch_errors": self.fetch_errors,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations
+        }
@@ -0,0 +1,134 @@
+"""
+Concurrency stress test for the in-process spend reservations
+(spend_reservations.SpendReservations).
+
+1. Linearizable per user: many threads race payments for one user against
+   a 50k limit, with a slow spend read. Every check must have seen exactly
+   the payments granted before it (so the granted totals form one
+   sequential history), nothing is refused that would have fit, and the
+   committed total never passes the limit. The same race without the
+   reservations is run first to show it does overshoot.
+2. Parallel across users: the same number of payments spread over
+   different users must finish far faster than for a single user, since
+   only same-stripe users wait for each other.
+
+    python backend/verify_spend_reservations.py
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from spend_reservations import SpendReservations
+except ImportError:
+    from backend.spend_reservations import SpendReservations
+
+LIMIT = 50000
+READ_LATENCY = 0.002  # a warm spend read is much faster; slow reads widen the race window
+
+
+class Ledger:
+    """Stands in for the spend windows + Firestore: committed spend per user."""
+    def __init__(self):
+        self.totals = {}
+        self.lock = threading.Lock()
+
+    def read_state(self, user_id, now):
+        time.sleep(READ_LATENCY)
+        with self.lock:
+            return self.totals.get(user_id, 0), None
+
+    def add(self, user_id, amount):
+        with self.lock:
+            self.totals[user_id] = self.totals.get(user_id, 0) + amount
+
+
+def race_without_reservations(amounts, workers):
+    ledger = Ledger()
+
+    def pay(amount):
+        spent, _ = ledger.read_state("user_a", 0)
+        if spent + amount <= LIMIT:
+            time.sleep(random.uniform(0, 0.002))  # scoring
+            ledger.add("user_a", amount)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(pay, amounts))
+    return ledger.totals.get("user_a", 0)
+
+
+def race_with_reservations(amounts, workers, stripes=64):
+    ledger = Ledger()
+    reservations = SpendReservations(ledger.read_state, lambda ops: None, stripes=stripes)
+    history = []
+    history_lock = threading.Lock()
+
+    def pay(amount):
+        r = reservations.reserve("user_a", amount, LIMIT, 0)
+        with history_lock:
+            history.append((r.past_spent, amount, r.granted))
+        if r.granted:
+            time.sleep(random.uniform(0, 0.002))  # scoring
+            reservations.commit([r], [], lambda: ledger.add("user_a", amount))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(pay, amounts))
+    return ledger.totals.get("user_a", 0), history
+
+
+def check_linearizable(history):
+    granted = sorted((spent, amount) for spent, amount, ok in history if ok)
+    running = 0
+    for spent, amount in granted:
+        assert spent == running, f"a check saw {spent}, expected {running}: overlapping reservations"
+        running += amount
+    for spent, amount, ok in history:
+        if not ok:
+            assert spent + amount > LIMIT, f"refused {amount} at {spent} although it fits under {LIMIT}"
+    return running
+
+
+def timed_payments(user_ids, workers, stripes=64):
+    ledger = Ledger()
+    reservations = SpendReservations(ledger.read_state, lambda ops: None, stripes=stripes)
+
+    def pay(user_id):
+        r = reservations.reserve(user_id, 100, LIMIT, 0)
+        reservations.commit([r], [], lambda: ledger.add(user_id, 100))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(pay, user_ids))
+    return time.perf_counter() - start, reservations.stats()
+
+
+def main():
+    random.seed(7)
+    workers = 32
+
+    print("1. One user, 32 threads, 400 payments of ₹500-₹5,000 against a ₹50,000 limit")
+    overshoots = 0
+    for trial in range(5):
+        amounts = [random.randint(500, 5000) for _ in range(400)]
+        unsafe_total = race_without_reservations(amounts, workers)
+        overshoots += unsafe_total > LIMIT
+        total, history = race_with_reservations(amounts, workers)
+        running = check_linearizable(history)
+        assert total == running and total <= LIMIT
+        print(f"   trial {trial + 1}: without reservations ₹{unsafe_total:,} | with: ₹{total:,}, "
+              f"{sum(ok for _, _, ok in history)} granted, one sequential history ✅")
+    assert overshoots > 0, "the unsynchronized race never overshot; raise READ_LATENCY so the test has teeth"
+
+    print("2. 256 payments, 32 threads: one user vs 256 different users")
+    same_user, _ = timed_payments(["user_a"] * 256, workers)
+    many_users, stats = timed_payments([f"user_{i}" for i in range(256)], workers)
+    print(f"   one user:   {same_user * 1000:7.1f} ms (serialized, ~{READ_LATENCY * 1000:.0f} ms each)")
+    print(f"   many users: {many_users * 1000:7.1f} ms ({same_user / many_users:.1f}x faster, "
+          f"{stats['contended']} contended stripe waits)")
+    assert many_users < same_user / 4, "different users are not running in parallel"
+    print("✅ Reservations are linearizable per user and parallel across users.")
+
+
+if __name__ == "__main__":
+    main()
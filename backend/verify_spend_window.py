@@ -0,0 +1,77 @@
+"""
+Checks for the in-memory rolling spend windows (spend_window.SpendWindows).
+
+1. Window totals: spend inside the last 24h counts, spend older than the
+   window (plus one bucket) doesn't, and the gap is measured from the
+   latest transaction.
+2. Lookups don't rewrite history: a lookup at a future `now` reports that
+   moment's (smaller) total but leaves every bucket in place, so the next
+   lookup at the real time still sees the full 24h of spend.
+3. Rebuild merges: an add() that lands while the rebuild's range query is
+   streaming survives it, and a doc both streamed and added counts once.
+
+    python backend/verify_spend_window.py
+"""
+import time
+from types import SimpleNamespace
+
+try:
+    from spend_window import SpendWindows
+except ImportError:
+    from backend.spend_window import SpendWindows
+
+DAY = 86400
+
+
+def check_totals(now):
+    windows = SpendWindows()
+    windows.add("user_a", 40000, now - 3600, "d1")
+    windows.add("user_a", 500, now - 60, "d2")
+    windows.add("user_a", 9999, now - 2 * DAY, "d3")  # outside the window: ignored
+    windows.add("user_a", 500, now - 60, "d2")        # same doc again: no-op
+    assert windows.lookup("user_a", now) == (40500, 60), windows.lookup("user_a", now)
+    assert windows.lookup("user_b", now) == (0, None)
+
+
+def check_future_lookup_keeps_state(now):
+    windows = SpendWindows()
+    windows.add("user_a", 40000, now - 3600, "d1")
+    windows.add("user_a", 2000, now - 60, "d2")
+    before = [list(bucket) for bucket in windows.users["user_a"]["buckets"]]
+
+    # 2 days ahead nothing is inside that window...
+    assert windows.lookup("user_a", now + 2 * DAY) == (0, None)
+    # ...a few minutes short of 24h after the first payment only it has dropped out
+    spent, _ = windows.lookup("user_a", now - 3600 + DAY + 600)
+    assert spent == 2000, spent
+
+    # ...and neither lookup expired anything for everyone else
+    assert [list(bucket) for bucket in windows.users["user_a"]["buckets"]] == before
+    assert windows.users["user_a"]["ids"].keys() == {"d1", "d2"}
+    assert windows.lookup("user_a", now) == (42000, 60), windows.lookup("user_a", now)
+
+
+def check_rebuild_keeps_concurrent_adds(now):
+    windows = SpendWindows()
+
+    def streamed():
+        yield SimpleNamespace(id="d1", to_dict=lambda: {"user_id": "user_a", "amount": 100, "timestamp": now - 10})
+        # Payments saved while the range query is still streaming
+        windows.add("user_a", 50, now - 5, "d2")
+        windows.add("user_a", 100, now - 10, "d1")
+        yield SimpleNamespace(id="d3", to_dict=lambda: {"user_id": "user_a", "amount": 25, "timestamp": now - 1})
+
+    query = SimpleNamespace(where=lambda *args: query, stream=streamed)
+    windows.rebuild(SimpleNamespace(collection=lambda name: query), now=now)
+    assert windows.lookup("user_a", now) == (175, 1), windows.lookup("user_a", now)
+
+
+def main():
+    now = int(time.time())
+    for check in (check_totals, check_future_lookup_keeps_state, check_rebuild_keeps_concurrent_adds):
+        check(now)
+        print(f"✅ {check.__name__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+# Field transforms have to survive the JSON journal, so producers write these
+# markers and they become Firestore transforms when the batch is built
+INCREMENT = "$increment"
+MAXIMUM = "$maximum"
+
+
+def increment(value):
+    return {INCREMENT: value}
+
+
+def maximum(value):
+    return {MAXIMUM: value}
+
+
+def resolve_transforms(data):
+    if not any(isinstance(v, dict) and len(v) == 1 and (INCREMENT in v or MAXIMUM in v) for v in data.values()):
+        return data
+    from firebase_admin import firestore
+    resolved = {}
+    for key, value in data.items():
+        if isinstance(value, dict) and len(value) == 1 and INCREMENT in value:
+            resolved[key] = firestore.Increment(value[INCREMENT])
+        elif isinstance(value, dict) and len(value) == 1 and MAXIMUM in value:
+            resolved[key] = firestore.Maximum(value[MAXIMUM])
+        else:
+            resolved[key] = value
+    return resolved
+
+
+class WriteBehindQueue:
+    """
+    Write-behind persistence for scored transactions.
+
+    Endpoints enqueue their Firestore writes and respond straight away; a
+    background thread drains the queue into batch commits of up to
+    `batch_size` documents. Every entry is appended to a local journal
+    before it is queued and acknowledged after its batch commits, so writes
+    still queued when the process dies are replayed on the next start.
+
+    An entry is a list of (document_path, data, merge) ops that must land in
+    the same batch. Values made with increment()/maximum() are applied as
+    Firestore field transforms; like every op they are at-least-once, so an
+    entry replayed after a crash between its commit and its ack is applied
+    twice. When the queue is full, enqueue() blocks until there is room,
+    which slows producers down instead of dropping data or letting a write
+    overtake the ones queued before it.
+
+    A batch that still fails after `max_retries` is parked rather than
+    dropped: its entries stay visible to pending() and are journaled, and
+    the drainer commits them again after a backoff that doubles each round
+    (up to `max_park_seconds`). Parked entries don't hold up flush() or
+    journal compaction.
+
+    subscribe(callback) calls callback(ops) with the ops of every batch
+    once it has committed, e.g. to feed live aggregates.
+    """
+    def __init__(self, journal_path, max_pending=10000, batch_size=500, flush_interval=0.05,
+                 max_retries=5, enqueue_timeout=2.0, fsync=False, park_seconds=5.0, max_park_seconds=300.0):
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.enqueue_timeout = enqueue_timeout
+        self.fsync = fsync
+        self.park_seconds = park_seconds
+        self.max_park_seconds = max_park_seconds
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.db = None
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.journal_lock = threading.Lock()
+        self.journal = None
+        self.next_seq = 1
+        self.uncommitted = {}  # seq -> ops, from enqueue until its batch commits
+        self.failed = {}       # seq -> ops that ran out of retries; parked for the drainer to retry
+        self.failed_rounds = 0  # parked rounds in a row that failed again; sets the backoff
+        self.retry_failed_at = None
+        self.idle = threading.Condition()
+        self.outstanding = 0
+        self.committed_docs = 0
+        self.committed_batches = 0
+        self.retries = 0
+        self.failed_docs = 0
+        self.inline_commits = 0
+        self.backpressure_waits = 0
+        self.listeners = []
+
+    # --- lifecycle ---
+    def start(self, db):
+        self.db = db
+        self.stop_event.clear()
+        replay = self._read_journal()
+        self.journal = open(self.journal_path, 'a', encoding='utf-8')
+        for seq, ops in replay:
+            self._track(1)
+            self.uncommitted[seq] = ops
+            self.queue.put((seq, ops))
+        if replay:
+            print(f"♻️ Replaying {len(replay)} journaled writes from {self.journal_path}")
+        self.thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=10):
+        """Flushes what is queued (up to `timeout` seconds) and stops the drainer."""
+        if self.thread is None:
+            return
+        drained = self.flush(timeout)
+        self.stop_event.set()
+        self.thread.join(timeout=timeout)
+        self.thread = None
+        if not drained:
+            print(f"⚠️ Write-behind queue not drained on shutdown; {self.outstanding} entries stay in the journal.")
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def flush(self, timeout=None):
+        """Blocks until every enqueued entry has been committed (or parked after failing)."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self.idle:
+            while self.outstanding > 0:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.idle.wait(remaining)
+        return True
+
+    # --- producers ---
+    def set(self, doc_path, data, merge=False):
+        self.enqueue([(doc_path, data, merge)])
+
+    def enqueue(self, ops):
+        ops = [(path, data, merge) for path, data, merge in ops]
+        if self.thread is None:
+            # Not started (no database / tests): write through
+            self._commit_inline(ops)
+            return
+        # Counted before it is journaled so compaction can never truncate it
+        self._track(1)
+        with self.journal_lock:
+            seq = self.next_seq
+            self.next_seq += 1
+            self.uncommitted[seq] = ops
+            self._journal_write({"seq": seq, "ops": [[path, data, merge] for path, data, merge in ops]})
+        # Backpressure: wait for room rather than write around the queue, which would
+        # let this entry land before (and be overwritten by) writes queued ahead of it
+        waited = False
+        while True:
+            try:
+                self.queue.put((seq, ops), timeout=self.enqueue_timeout)
+                return
+            except queue.Full:
+                if not waited:
+                    waited = True
+                    self.backpressure_waits += 1
+                    print(f"⚠️ Write-behind queue full ({self.queue.maxsize} entries); waiting for the drainer.")
+                if self.thread is None or not self.thread.is_alive():
+                    # Stays journaled (and in pending()); replayed on the next start
+                    raise RuntimeError("Write-behind drainer is not running")
+
+    def pending(self, collection):
+        """Data of queued, not yet committed writes whose path is directly under `collection`."""
+        prefix = collection + "/"
+        with self.journal_lock:
+            entries = list(self.uncommitted.values())
+        found = []
+        for ops in entries:
+            for path, data, _ in ops:
+                if path.startswith(prefix) and "/" not in path[len(prefix):]:
+                    found.append((path, data))
+        return found
+
+    def subscribe(self, callback):
+        self.listeners.append(callback)
+
+    def _notify(self, ops):
+        for callback in self.listeners:
+            try:
+                callback(ops)
+            except Exception as e:
+                print(f"⚠️ Write-behind subscriber failed: {e}")
+
+    # --- drainer ---
+    def _run(self):
+        while not (self.stop_event.is_set() and self.queue.empty()):
+            self._retry_failed()
+            try:
+                first = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            entries = [first]
+            doc_count = len(first[1])
+            while doc_count < self.batch_size:
+                try:
+                    seq, ops = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if doc_count + len(ops) > self.batch_size:
+                    # Doesn't fit: commit what we have, this one starts the next batch
+                    self._commit_entries(entries)
+                    entries, doc_count = [], 0
+                entries.append((seq, ops))
+                doc_count += len(ops)
+            self._commit_entries(entries)
+
+    def _commit_entries(self, entries):
+        if not entries:
+            return
+        ops = [op for _, entry_ops in entries for op in entry_ops]
+        for attempt in range(self.max_retries + 1):
+            try:
+                batch = self.db.batch()
+                for path, data, merge in ops:
+                    batch.set(self.db.document(path), resolve_transforms(data), merge=merge)
+                batch.commit()
+                self.committed_docs += len(ops)
+                self.committed_batches += 1
+                self._ack([seq for seq, _ in entries])
+                self._forget([seq for seq, _ in entries])
+                self._notify(ops)
+                break
+            except Exception as e:
+                if attempt == self.max_retries:
+                    # Parked: still uncommitted (so pending() sees it) and journaled, retried later
+                    self.failed_docs += len(ops)
+                    with self.journal_lock:
+                        self.failed.update(entries)
+                        if self.retry_failed_at is None:
+                            self.retry_failed_at = time.time() + self._park_delay()
+                    print(f"❌ Write-behind commit failed after {attempt + 1} attempts ({len(ops)} docs): {e}. "
+                          f"Retrying in {self._park_delay():.0f}s.")
+                    break
+                self.retries += 1
+                # Exponential backoff with full jitter, capped at 5s
+                time.sleep(random.uniform(0, min(5.0, 0.1 * (2 ** attempt))))
+        self._track(-len(entries))
+
+    def _park_delay(self):
+        return min(self.max_park_seconds, self.park_seconds * (2 ** self.failed_rounds))
+
+    def _retry_failed(self):
+        """Commits the parked entries again, in their original order, once their backoff is up."""
+        if self.retry_failed_at is None or time.time() < self.retry_failed_at:
+            return
+        # Only the drainer parks entries, so `failed` can't change under us here. They are
+        # counted before they leave it, so compaction can't drop them from the journal meanwhile
+        entries = sorted(self.failed.items())
+        self._track(len(entries))
+        with self.journal_lock:
+            self.failed = {}
+            self.retry_failed_at = None
+        print(f"♻️ Retrying {len(entries)} parked write-behind entries.")
+        batch, doc_count = [], 0
+        for seq, ops in entries:
+            if batch and doc_count + len(ops) > self.batch_size:
+                self._commit_entries(batch)
+                batch, doc_count = [], 0
+            batch.append((seq, ops))
+            doc_count += len(ops)
+        self._commit_entries(batch)
+        with self.journal_lock:
+            if self.failed:
+                self.failed_rounds += 1
+                self.retry_failed_at = time.time() + self._park_delay()
+            else:
+                self.failed_rounds = 0
+
+    def _commit_inline(self, ops):
+        batch = self.db.batch()
+        for path, data, merge in ops:
+            batch.set(self.db.document(path), resolve_transforms(data), merge=merge)
+        batch.commit()
+        self.inline_commits += 1
+        self._notify(ops)
+
+    def _forget(self, seqs):
+        with self.journal_lock:
+            for seq in seqs:
+                self.uncommitted.pop(seq, None)
+
+    def _track(self, delta):
+        with self.idle:
+            self.outstanding += delta
+            if self.outstanding == 0:
+                self.idle.notify_all()
+                self._compact_journal()
+
+    # --- journal ---
+    def _journal_write(self, record):
+        if self.journal is None:
+            return
+        self.journal.write(json.dumps(record) + "\n")
+        self.journal.flush()
+        if self.fsync:
+            os.fsync(self.journal.fileno())
+
+    def _ack(self, seqs):
+        with self.journal_lock:
+            self._journal_write({"ack": seqs})
+
+    def _compact_journal(self):
+        # Nothing outstanding means every journaled entry is acknowledged or parked;
+        # only the parked ones need to survive, for a retry or the next start to replay
+        with self.journal_lock:
+            if self.journal is not None:
+                self.journal.truncate(0)
+                self.journal.seek(0)
+                for seq, ops in self.failed.items():
+                    self._journal_write({"seq": seq, "ops": [[path, data, merge] for path, data, merge in ops]})
+
+    def _read_journal(self):
+        """Journaled entries that were never acknowledged, in their original order."""
+        if not os.path.exists(self.journal_path):
+            return []
+        entries, acked = [], set()
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn last line from a crash mid-write
+                if "ack" in record:
+                    acked.update(record["ack"])
+                else:
+                    entries.append((record["seq"], [tuple(op) for op in record["ops"]]))
+        pending = [(seq, ops) for seq, ops in entries if seq not in acked]
+        if entries:
+            self.next_seq = max(seq for seq, _ in entries) + 1
+        return pending
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "outstanding": self.outstanding,
+            "committed_docs": self.committed_docs,
+            "committed_batches": self.committed_batches,
+            "retries": self.retries,
+            "failed_docs": self.failed_docs,
+            "parked_entries": len(self.failed),
+            "inline_commits": self.inline_commits,
+            "backpressure_waits": self.backpressure_waits
+        }
@@ -14,6 +14,19 @@ interface UserProfile {
   type: "personal" | "business"
 }
 
+interface HistoryEntry {
+  id: string
+  amount: number
+  timestamp: number
+  verdict: string
+  risk_score: number
+}
+
+// The largest page /users serves
+const USERS_PAGE_SIZE = 500
+// Payments shown per "Load more" of the 24h history
+const HISTORY_PAGE_SIZE = 20
+
 export const UpiPay = () => {
   const [step, setStep] = useState<'input' | 'processing' | 'success'>('input')
   const [amount, setAmount] = useState("")
@@ -29,16 +42,31 @@ export const UpiPay = () => {
   const [selectedUser, setSelectedUser] = useState<string>("user_common")
   const [dailySpent, setDailySpent] = useState<number>(0)
   const [dailyLimit, setDailyLimit] = useState<number>(50000)
+  const [history, setHistory] = useState<HistoryEntry[]>([])
+  const [historyCursor, setHistoryCursor] = useState<string | null>(null)
 
   // Fetch users on mount
   useEffect(() => {
-    // Fetch Users
-    fetch(`${API_URL}/users`)
-      .then(res => res.json())
-      .then(data => {
-        if (data.users && data.users.length > 0) {
-          setUsers(data.users)
-          const firstUser = data.users[0]
+    // /users is paginated: follow next_cursor until every page is in
+    const fetchAllUsers = async () => {
+      const allUsers: UserProfile[] = []
+      let cursor: string | null = null
+      do {
+        const params = new URLSearchParams({ limit: String(USERS_PAGE_SIZE) })
+        if (cursor) params.set("cursor", cursor)
+        const res = await fetch(`${API_URL}/users?${params}`)
+        const data = await res.json()
+        allUsers.push(...(data.users || []))
+        cursor = data.next_cursor || null
+      } while (cursor)
+      return allUsers
+    }
+
+    fetchAllUsers()
+      .then(allUsers => {
+        if (allUsers.length > 0) {
+          setUsers(allUsers)
+          const firstUser = allUsers[0]
           setSelectedUser(firstUser.id)
           setDailyLimit(firstUser.type === "business" ? 1000000 : 50000)
           fetchUserHistory(firstUser.id)
@@ -47,11 +75,18 @@ export const UpiPay = () => {
       .catch(err => console.error("Failed to fetch users:", err))
   }, [])
 
-  const fetchUserHistory = async (userId: string) => {
+  // /users/{id}/history is paginated: the first page replaces the list, "Load more" follows next_cursor
+  const fetchUserHistory = async (userId: string, cursor: string | null = null) => {
     try {
-      const res = await fetch(`${API_URL}/users/${userId}/history`)
+      const params = new URLSearchParams({ limit: String(HISTORY_PAGE_SIZE) })
+      if (cursor) params.set("cursor", cursor)
+      const res = await fetch(`${API_URL}/users/${userId}/history?${params}`)
       const data = await res.json()
+      // Covers the whole 24h window, whichever page this is
       setDailySpent(data.daily_total || 0)
+      const page: HistoryEntry[] = data.transactions || []
+      setHistory(prev => cursor ? [...prev, ...page] : page)
+      setHistoryCursor(data.next_cursor || null)
     } catch (err) {
       console.error("Failed to fetch user history:", err)
     }
@@ -202,6 +237,28 @@ export const UpiPay = () => {
               style={{ width: `${Math.min((dailySpent / dailyLimit) * 100, 100)}%` }}
             />
           </div>
+
+          {/* Last 24h Payments */}
+          {history.length > 0 && (
+            <div className="mt-3 max-h-40 overflow-y-auto space-y-1">
+              {history.map(txn => (
+                <div key={txn.id} className="flex justify-between text-xs">
+                  <span className="text-slate-500">{new Date(txn.timestamp * 1000).toLocaleTimeString()}</span>
+                  <span className={txn.verdict === 'FLAGGED' ? 'text-orange-400' : 'text-slate-300'}>
+                    ₹{txn.amount.toLocaleString()} · {txn.verdict}
+                  </span>
+                </div>
+              ))}
+              {historyCursor && (
+                <button
+                  onClick={() => fetchUserHistory(selectedUser, historyCursor)}
+                  className="w-full text-xs text-blue-400 hover:text-blue-300 pt-1"
+                >
+                  Load more
+                </button>
+              )}
+            </div>
+          )}
         </div>
 
         {/* Recipient Info */}